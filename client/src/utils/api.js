@@ -202,11 +202,11 @@ export const api = {
     }
   },
   getVolumes: async (login, reviewer, trainee) => {
-    // Get volumes based on user type
+    // Get volume info based on user type
     let responses = [];
     if (reviewer) {
-      const response = await axios.get('/system/subvolume_ids');
-      const trainingResponse = await axios.get('/system/subvolume_ids', {
+      const response = await axios.get('/system/subvolume_info');
+      const trainingResponse = await axios.get('/system/subvolume_info', {
         params: {
           training: true
         }
@@ -215,7 +215,7 @@ export const api = {
       responses = [...response.data, ...trainingResponse.data];
     }
     else {     
-      const response = await axios.get('/system/subvolume_ids', {
+      const response = await axios.get('/system/subvolume_info', {
         params: {
           training: trainee
         }
@@ -226,16 +226,14 @@ export const api = {
 
     const volumes = [];
 
-    for (const volume of responses) {
+    for (const data of responses) {
       try {
-        const infoResponse = await axios.get(`/item/${ volume.id }/subvolume_info`);
-
-        const { data } = infoResponse;
+        if (data.error) throw new Error(data.error);
 
         if (trainee && data.training_user !== login) continue;
 
         // Get parent volume info
-        const pathResponse = await axios.get(`/item/${ volume.id }/rootpath`);
+        const pathResponse = await axios.get(`/item/${ data.id }/rootpath`);
 
         // Get info for training volumes
         const trainingInfo = data.training_user ? await getTrainingInfo(data) : null;
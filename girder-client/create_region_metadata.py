@@ -5,6 +5,7 @@ import os
 import sys
 import numpy as np
 from libtiff import TIFF
+from ninjato_label_stats import get_label_stats
 
 
 if __name__ == '__main__':
@@ -71,9 +72,10 @@ if __name__ == '__main__':
             imarray = np.array(images)
             print(imarray.shape)
 
-            levels = imarray[np.nonzero(imarray)]
-            min_level = min(levels)
-            max_level = max(levels)
+            # compute extents of all regions in one pass over the mask
+            stats = get_label_stats(imarray)
+            min_level = min(stats)
+            max_level = max(stats)
             print(f'min_level: {min_level}, max_level: {max_level}')
             meta_dict = {'regions': {},
                          'max_region_id': int(max_level)}
@@ -83,38 +85,21 @@ if __name__ == '__main__':
             whole_z_max = 0
             whole_y_max = 0
             whole_x_max = 0
-            for lev in range(min_level, max_level+1):
-                level_indices = np.where(imarray == lev)
-                if (level_indices[0].size == 0) or (level_indices[1].size == 0) or (level_indices[2].size == 0):
-                    continue
-                z_min = min(level_indices[0])
-                z_max = max(level_indices[0])
-                y_min = min(level_indices[1])
-                y_max = max(level_indices[1])
-                x_min = min(level_indices[2])
-                x_max = max(level_indices[2])
-                # need to convert extent values to int from int64, otherwise, JSON serialization
-                # will raise exception when adding metadata to item
+            for lev, lev_stats in stats.items():
                 meta_dict['regions'][str(lev)] = {
-                    "x_max": int(x_max),
-                    "x_min": int(x_min),
-                    "y_max": int(y_max),
-                    "y_min": int(y_min),
-                    "z_max": int(z_max),
-                    "z_min": int(z_min)
+                    "x_max": lev_stats['x_max'],
+                    "x_min": lev_stats['x_min'],
+                    "y_max": lev_stats['y_max'],
+                    "y_min": lev_stats['y_min'],
+                    "z_max": lev_stats['z_max'],
+                    "z_min": lev_stats['z_min']
                 }
-                if z_min < whole_z_min:
-                    whole_z_min = z_min
-                if y_min < whole_y_min:
-                    whole_y_min = y_min
-                if x_min < whole_x_min:
-                    whole_x_min = x_min
-                if z_max > whole_z_max:
-                    whole_z_max = z_max
-                if y_max > whole_y_max:
-                    whole_y_max = y_max
-                if x_max > whole_x_max:
-                    whole_x_max = x_max
+                whole_z_min = min(whole_z_min, lev_stats['z_min'])
+                whole_y_min = min(whole_y_min, lev_stats['y_min'])
+                whole_x_min = min(whole_x_min, lev_stats['x_min'])
+                whole_z_max = max(whole_z_max, lev_stats['z_max'])
+                whole_y_max = max(whole_y_max, lev_stats['y_max'])
+                whole_x_max = max(whole_x_max, lev_stats['x_max'])
 
             # find the file_name with path excluding the top folder name sync_data
             slash_idx = os.path.dirname(file_name_with_path).find('/')
@@ -136,3 +121,5 @@ if __name__ == '__main__':
             }
             if file_name in file_to_item_id:
                 gc.addMetadataToItem(file_to_item_id[file_name], meta_dict)
+                # build the per-label stats index of the whole subvolume mask on the server
+                gc.post(f'item/{file_to_item_id[file_name]}/label_index')
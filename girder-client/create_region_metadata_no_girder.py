@@ -2,6 +2,7 @@ import argparse
 import os
 import numpy as np
 from libtiff import TIFF
+from ninjato_label_stats import get_label_stats
 
 
 if __name__ == '__main__':
@@ -26,28 +27,19 @@ if __name__ == '__main__':
         imarray = np.array(images)
         print(imarray.shape)
 
-        levels = imarray[np.nonzero(imarray)]
-        min_level = min(levels)
-        max_level = max(levels)
+        # compute extents of all regions in one pass over the mask
+        stats = get_label_stats(imarray)
+        max_level = max(stats)
         meta_dict = {'regions': {},
                      'max_region_id': int(max_level)}
-        for lev in range(min_level, max_level+1):
-            level_indices = np.where(imarray == lev)
-            z_min = min(level_indices[0])
-            z_max = max(level_indices[0])
-            y_min = min(level_indices[1])
-            y_max = max(level_indices[1])
-            x_min = min(level_indices[2])
-            x_max = max(level_indices[2])
-            # need to convert extent values to int from int64, otherwise, JSON serialization
-            # will raise exception when adding metadata to item
+        for lev, lev_stats in stats.items():
             meta_dict['regions'][str(lev)] = {
-                "x_max": int(x_max),
-                "x_min": int(x_min),
-                "y_max": int(y_max),
-                "y_min": int(y_min),
-                "z_max": int(z_max),
-                "z_min": int(z_min)
+                "x_max": lev_stats['x_max'],
+                "x_min": lev_stats['x_min'],
+                "y_max": lev_stats['y_max'],
+                "y_min": lev_stats['y_min'],
+                "z_max": lev_stats['z_max'],
+                "z_min": lev_stats['z_min']
             }
             if lev == 850 or lev == 851:
                 print(lev, meta_dict['regions'][str(lev)])
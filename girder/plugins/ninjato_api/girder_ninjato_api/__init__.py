@@ -1,13 +1,22 @@
+from girder import events
 from girder.plugin import getPlugin, GirderPlugin
 from girder.api import access
+from girder.api.rest import getCurrentUser
 from girder.api.describe import Description, autoDescribeRoute
 from girder.constants import AccessType
-from .utils import update_assignment_in_whole_item
+from girder.utility.model_importer import ModelImporter
+from .models import AssignmentExtent, AssignmentStatus, History, LabelIndex, RegionPool, \
+    UserAssignment
+from .utils import update_assignment_in_whole_item, remove_volume_sidecar, \
+    build_whole_item_label_index
+from .crop_cache import get_stats as get_crop_cache_stats
+from .request_context import invalidate_loaded_item
+from .item_loader import load_lazy_meta
 from .endpoint_utils import get_item_assignment, save_user_annotation_as_item, get_subvolume_item_ids, \
     get_subvolume_item_info, get_region_or_assignment_info, get_available_region_ids, \
     claim_assignment, request_assignment, get_all_avail_items_for_review, \
     get_region_comment_info, save_user_review_result_as_item, remove_region_from_item_assignment, \
-    get_subvolume_all_assignment_status
+    get_subvolume_all_assignment_status, get_subvolumes_item_info, invalidate_subvolume_ids_cache
 
 
 @access.public
@@ -230,6 +239,28 @@ def get_subvolume_info(item):
     return get_subvolume_item_info(item)
 
 
+@access.public
+@autoDescribeRoute(
+    Description('Get subvolume item info of all subvolumes in a collection or of the specified '
+                'subvolumes in one request.')
+    .param('training', 'A boolean True or False to indicate whether to get info of subvolumes '
+                       'from training data collection or not if ids is not set. Default is False',
+           dataType='boolean', default=False, required=False)
+    .jsonParam('ids', 'list of whole subvolume item ids to get info of. If it is not set, info of '
+                      'all subvolumes in the collection will be returned',
+               required=False, requireArray=True)
+    .jsonParam('fields', 'list of info keys to return for each subvolume in addition to id, e.g., '
+                         '["name", "total_regions"]. If it is not set, all info keys will be '
+                         'returned',
+               required=False, requireArray=True)
+    .errorResponse()
+    .errorResponse('Get action was denied on the user.', 403)
+    .errorResponse('Failed to get subvolume info', 500)
+)
+def get_subvolumes_info(training, ids, fields):
+    return get_subvolumes_item_info(getCurrentUser(), training=training, ids=ids, fields=fields)
+
+
 @access.public
 @autoDescribeRoute(
     Description('Get status of all assignments in the specified subvolume.')
@@ -304,6 +335,33 @@ def update_whole_subvolume(item, assign_item_id, mask_file_name):
     }
 
 
+@access.admin
+@autoDescribeRoute(
+    Description('Build the per-label bounding box, voxel count and centroid index of the whole '
+                'subvolume mask as an admin only endpoint to be triggered at ingest or when the '
+                'whole subvolume mask is replaced outside of the API')
+    .modelParam('id', 'The whole subvolume item ID', model='item', level=AccessType.WRITE)
+    .errorResponse()
+    .errorResponse('Admin access was denied.', 403)
+)
+def build_label_index(item):
+    return {
+        'label_count': build_whole_item_label_index(item),
+        'status': 'success'
+    }
+
+
+@access.admin
+@autoDescribeRoute(
+    Description('Get region crop cache hit and miss counters along with cache size info as an '
+                'admin only endpoint for sizing the crop cache')
+    .errorResponse()
+    .errorResponse('Admin access was denied.', 403)
+)
+def get_crop_cache_info():
+    return get_crop_cache_stats()
+
+
 class NinjatoPlugin(GirderPlugin):
     DISPLAY_NAME = 'Girder Ninjato API'
     CLIENT_SOURCE_PATH = 'web_client'
@@ -311,6 +369,12 @@ class NinjatoPlugin(GirderPlugin):
     def load(self, info):
         # add plugin loading logic here
         getPlugin('jobs').load(info)
+        ModelImporter.registerModel('assignment_extent', AssignmentExtent, 'ninjato_api')
+        ModelImporter.registerModel('assignment_status', AssignmentStatus, 'ninjato_api')
+        ModelImporter.registerModel('history', History, 'ninjato_api')
+        ModelImporter.registerModel('label_index', LabelIndex, 'ninjato_api')
+        ModelImporter.registerModel('region_pool', RegionPool, 'ninjato_api')
+        ModelImporter.registerModel('user_assignment', UserAssignment, 'ninjato_api')
         # attach API route to Girder
         info['apiRoot'].user.route('GET', (':id', 'assignment'), get_user_assign_info)
         info['apiRoot'].user.route('POST', (':id', 'annotation'), save_user_annotation)
@@ -323,6 +387,7 @@ class NinjatoPlugin(GirderPlugin):
         info['apiRoot'].user.route('POST', (':id', 'request_assignment'),
                                    request_region_assignment)
         info['apiRoot'].system.route('GET', ('subvolume_ids',), get_subvolume_ids)
+        info['apiRoot'].system.route('GET', ('subvolume_info',), get_subvolumes_info)
         info['apiRoot'].item.route('GET', (':id', 'subvolume_info'), get_subvolume_info)
         info['apiRoot'].item.route('GET', (':id', 'subvolume_all_assignment_status'),
                                    get_subvolume_all_assign_status)
@@ -334,3 +399,16 @@ class NinjatoPlugin(GirderPlugin):
         # attach admin only API route to Girder for admin task on an as-needed basis
         info['apiRoot'].item.route('POST', (':id', 'update_whole_subvolume_mask'),
                                    update_whole_subvolume)
+        info['apiRoot'].item.route('POST', (':id', 'label_index'), build_label_index)
+        info['apiRoot'].system.route('GET', ('crop_cache_stats',), get_crop_cache_info)
+        # clean up volume sidecars of whole item files when the files are removed
+        events.bind('model.file.remove', 'ninjato_api', remove_volume_sidecar)
+        # drop items memoized while handling a request when they are saved or removed
+        events.bind('model.item.save.after', 'ninjato_api', invalidate_loaded_item)
+        events.bind('model.item.remove', 'ninjato_api', invalidate_loaded_item)
+        # load lazily loaded whole item metadata sections before an item is saved as a whole
+        events.bind('model.item.save', 'ninjato_api', load_lazy_meta)
+        # invalidate cached subvolume item ids when the subvolume hierarchy changes
+        for event_name in ('model.folder.save.created', 'model.folder.remove',
+                           'model.item.save.created', 'model.item.remove'):
+            events.bind(event_name, 'ninjato_api', invalidate_subvolume_ids_cache)
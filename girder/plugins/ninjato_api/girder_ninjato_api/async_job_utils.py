@@ -1,44 +1,133 @@
-from girder.models.item import Item
-from bson.objectid import ObjectId
-from .utils import create_region_files, REVIEW_APPROVE_KEY, \
-    update_user_mask_from_updated_mask, get_label_ids
+import os
+import time
+import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from girder.models.file import File
+from girder_jobs.models.job import Job
+from . import propagation_queue
+from .item_loader import ItemLoader
+from .utils import REVIEW_APPROVE_KEY, WHOLE_ITEM_LAZY_META, DATA_PATH, get_label_ids, \
+    find_overlapping_assignment_ids, prepare_region_files, share_crop_sources, \
+    write_region_crop, import_region_files, get_user_mask_file_path, paste_updated_user_mask
+
+
+# maximum number of worker processes regenerating assignment masks in a propagation job
+PROPAGATION_WORKERS = min(4, os.cpu_count() or 1)
+# directory of whole volume blocks shared by the crops of propagation jobs
+SHARED_BLOCK_PATH = os.path.join(DATA_PATH, '_propagation_blocks')
+
+
+def regenerate_assignment_files(task):
+    """
+    write the region file crops of an assignment and update its user mask with the labels of the
+    updated region mask. It does not access the database so that it can run in a worker process.
+    :param task: dict with assign_item_id, crops as returned by prepare_region_files, user_path as
+    returned by get_user_mask_file_path or None, and lbl_ids keys
+    :return: tuple of whether the user mask is updated and the elapsed time in seconds
+    """
+    start = time.perf_counter()
+    mask_path = None
+    for crop in task['crops']:
+        write_region_crop(crop)
+        if crop['name'].endswith('_masks_regions.tif'):
+            mask_path = crop['out_path']
+    updated = paste_updated_user_mask(mask_path, task['user_path'], task['lbl_ids'])
+    return updated, time.perf_counter() - start
+
+
+def _prepare_assignment_task(assign_item, whole_item, lbl_ids):
+    user_path = None
+    for file in File().find({'itemId': assign_item['_id']}):
+        if file['name'].endswith('_user.tif'):
+            user_path = get_user_mask_file_path(file)
+    return {
+        'assign_item_id': str(assign_item['_id']),
+        'crops': prepare_region_files(assign_item, whole_item),
+        'user_path': user_path,
+        'lbl_ids': lbl_ids
+    }
 
 
 def update_all_assignment_masks(job):
-    whole_item, saved_assign_item_id = job['args']
-    if not whole_item or not saved_assign_item_id:
+    """
+    local job function that propagates the masks of all saved assignments of a subvolume merged
+    into the job by propagation_queue to the other assignments overlapping them. Jobs of the same
+    subvolume run one at a time, and saved assignments are taken once the job gets to run so that
+    saves submitted while it waits are propagated by this job as well.
+    :param job: local job with the whole subvolume item id as its argument. Jobs created before
+    the propagation queue existed also have the saved assignment item id as their second argument.
+    :return:
+    """
+    whole_item_id = job['args'][0]
+    if not whole_item_id:
         return
-    updated_assign_item_ids = []
-    for key, val in whole_item['meta']['regions'].items():
-        if 'item_id' not in val:
-            continue
+    with propagation_queue.get_run_lock(whole_item_id):
+        saved_assign_item_ids = propagation_queue.take_pending(whole_item_id)
+        if len(job['args']) > 1 and job['args'][1]:
+            saved_assign_item_ids.add(str(job['args'][1]))
+        if saved_assign_item_ids:
+            _propagate_assignment_masks(job, whole_item_id, saved_assign_item_ids)
 
-        if val['item_id'] == saved_assign_item_id or val['item_id'] in updated_assign_item_ids:
-            continue
 
-        assign_item_id = ObjectId(val['item_id'])
-        # update corresponding assignment mask
-        assign_item = Item().findOne({'_id': assign_item_id})
+def _propagate_assignment_masks(job, whole_item_id, saved_assign_item_ids):
+    job_model = Job()
+    item_loader = ItemLoader()
+    # load the latest whole item rather than the one at the time of the saves
+    whole_item = item_loader.load(whole_item_id, lazy_meta=WHOLE_ITEM_LAZY_META)
+    if not whole_item:
+        return
+    saved_assign_items = item_loader.load_many(saved_assign_item_ids)
+    # overlapping assignment item id to label ids of the saved assignments overlapping it
+    overlap_label_ids = {}
+    for saved_id, saved_assign_item in saved_assign_items.items():
+        saved_label_ids = get_label_ids(saved_assign_item)
+        # only assignments whose extents overlap the saved assignment extent need updating
+        for aid in find_overlapping_assignment_ids(
+                whole_item, saved_assign_item['meta']['coordinates'], item_loader=item_loader):
+            if aid != saved_id:
+                lbl_ids = overlap_label_ids.setdefault(aid, [])
+                lbl_ids.extend(lid for lid in saved_label_ids if lid not in lbl_ids)
+    overlap_ids = list(overlap_label_ids)
+    assign_items = item_loader.load_many(overlap_ids)
+    tasks = []
+    for aid in overlap_ids:
+        assign_item = assign_items.get(aid)
+        if not assign_item or not assign_item['meta'].get('region_ids'):
+            continue
         if REVIEW_APPROVE_KEY in assign_item['meta'] and \
             assign_item['meta'][REVIEW_APPROVE_KEY] == 'true':
             # if annotation is already review approved, does not update
             continue
+        tasks.append(_prepare_assignment_task(assign_item, whole_item, overlap_label_ids[aid]))
 
-        saved_assign_item = Item().findOne({'_id': ObjectId(saved_assign_item_id)})
-        saved_assign_item_extent = saved_assign_item['meta']['coordinates']
-        assign_item_extent = assign_item['meta']['coordinates']
-        # check if two extents overlap and there is no need for updating if extents don't overlap
-        if (assign_item_extent["x_max"] <= saved_assign_item_extent["x_min"]) or \
-           (assign_item_extent["y_max"] <= saved_assign_item_extent["y_min"]) or \
-           (assign_item_extent["z_max"] <= saved_assign_item_extent["z_min"]) or \
-           (assign_item_extent["x_min"] >= saved_assign_item_extent["x_max"]) or \
-           (assign_item_extent["y_min"] >= saved_assign_item_extent["y_max"]) or \
-           (assign_item_extent["z_min"] >= saved_assign_item_extent["z_max"]):
-            continue
-        create_region_files(assign_item, whole_item)
-        update_user_mask_from_updated_mask(assign_item_id, get_label_ids(saved_assign_item))
-
-        updated_assign_item_ids.append(val['item_id'])
-        print(f"updated assignment masks for {val['item_id']} in whole item {whole_item['_id']}",
-              flush=True)
+    start = time.perf_counter()
+    block_dir = os.path.join(SHARED_BLOCK_PATH, str(job['_id']))
+    executor = None
+    try:
+        # read each whole item file once and cut the crops of all assignments from it
+        share_crop_sources([crop for task in tasks for crop in task['crops']], block_dir)
+        job = job_model.updateJob(job, log=f'read whole item files for {len(tasks)} assignments '
+                                           f'in {time.perf_counter() - start:.2f}s\n')
+        if len(tasks) > 1 and PROPAGATION_WORKERS > 1:
+            # spawn rather than fork worker processes since the server process runs other threads
+            executor = ProcessPoolExecutor(max_workers=min(PROPAGATION_WORKERS, len(tasks)),
+                                           mp_context=multiprocessing.get_context('spawn'))
+            results = executor.map(regenerate_assignment_files, tasks)
+        else:
+            results = map(regenerate_assignment_files, tasks)
+        # results come back in task order, so assignment files are imported in order
+        for task, (updated, seconds) in zip(tasks, results):
+            import_region_files(assign_items[task['assign_item_id']], task['crops'])
+            job = job_model.updateJob(
+                job, log=f"updated assignment masks for {task['assign_item_id']} in whole item "
+                         f"{whole_item['_id']} in {seconds:.2f}s"
+                         f"{'' if updated else ' without user mask update'}\n")
+    finally:
+        if executor:
+            executor.shutdown()
+        shutil.rmtree(block_dir, ignore_errors=True)
+    job_model.updateJob(job, log=f'updated {len(tasks)} of {len(overlap_ids)} assignments '
+                                 f'overlapping {len(saved_assign_items)} saved assignments in '
+                                 f'{time.perf_counter() - start:.2f}s\n')
     return
@@ -0,0 +1,239 @@
+import os
+import json
+import uuid
+import fcntl
+import shutil
+from contextlib import contextmanager
+import numpy as np
+from libtiff import TIFF
+
+
+# whole subvolume masks are split into fixed size ZYX chunks stored as one .npy file per chunk in a
+# Zarr-like layout. Chunks that are all zeros are not stored, so the chunk files present in the
+# store directory together with the index file describe the whole volume. A store is a cache of
+# its source file, which is the source of truth, and records the source file version it is in sync
+# with. Stores are created, updated, and read under a lock file next to the store directory so
+# that processes never see a store that is partially updated.
+CHUNK_SIZE = 64
+INDEX_FILE_NAME = 'index.json'
+
+
+def _get_index_path(store_path):
+    return os.path.join(store_path, INDEX_FILE_NAME)
+
+
+def _get_chunk_path(store_path, cz, cy, cx):
+    return os.path.join(store_path, f'{cz}.{cy}.{cx}.npy')
+
+
+@contextmanager
+def _lock_store(store_path, exclusive=True):
+    os.makedirs(os.path.dirname(store_path), exist_ok=True)
+    with open(f'{store_path}.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f'{path}.{uuid.uuid4()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _write_chunk(chunk_path, chunk):
+    """
+    write a chunk to a temporary path and rename it so that readers never see a partial chunk.
+    All zero chunks are removed instead of written
+    :param chunk_path: path of the chunk file
+    :param chunk: ZYX chunk numpy array
+    :return:
+    """
+    if not chunk.any():
+        if os.path.isfile(chunk_path):
+            os.remove(chunk_path)
+        return
+    tmp_path = f'{chunk_path}.{uuid.uuid4()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.ascontiguousarray(chunk))
+    os.replace(tmp_path, chunk_path)
+
+
+def read_index(store_path):
+    """
+    read the chunk index of a store
+    :param store_path: chunk store directory
+    :return: index dict with shape, dtype, chunk_size and source_version keys or None if the store
+    does not exist
+    """
+    index_path = _get_index_path(store_path)
+    if not os.path.isfile(index_path):
+        return None
+    with open(index_path) as f:
+        return json.load(f)
+
+
+def _set_source_version(store_path, index, source_version):
+    index['source_version'] = source_version
+    _write_json_atomic(_get_index_path(store_path), index)
+
+
+def create_store(store_path, volume, source_version, chunk_size=CHUNK_SIZE):
+    """
+    create a chunk store from a ZYX volume, replacing the store if it already exists
+    :param store_path: chunk store directory
+    :param volume: ZYX numpy array or np.memmap to split into chunks
+    :param source_version: version string of the source file the volume is read from
+    :param chunk_size: edge length of the cubic chunks
+    :return:
+    """
+    with _lock_store(store_path):
+        _create_store(store_path, volume, source_version, chunk_size)
+
+
+def _create_store(store_path, volume, source_version, chunk_size):
+    tmp_store_path = f'{store_path}.{uuid.uuid4()}.tmp'
+    os.makedirs(tmp_store_path)
+    for cz in range(0, volume.shape[0], chunk_size):
+        # read one layer of chunks at a time to bound memory use
+        slab = np.asarray(volume[cz:cz + chunk_size])
+        for cy in range(0, volume.shape[1], chunk_size):
+            for cx in range(0, volume.shape[2], chunk_size):
+                _write_chunk(_get_chunk_path(tmp_store_path, cz // chunk_size, cy // chunk_size,
+                                             cx // chunk_size),
+                             slab[:, cy:cy + chunk_size, cx:cx + chunk_size])
+    _write_json_atomic(_get_index_path(tmp_store_path), {
+        'shape': list(volume.shape),
+        'dtype': np.dtype(volume.dtype).str,
+        'chunk_size': chunk_size,
+        'source_version': source_version
+    })
+    if os.path.isdir(store_path):
+        old_store_path = f'{store_path}.{uuid.uuid4()}.old'
+        os.replace(store_path, old_store_path)
+        os.replace(tmp_store_path, store_path)
+        shutil.rmtree(old_store_path, ignore_errors=True)
+    else:
+        os.replace(tmp_store_path, store_path)
+
+
+def _overlapping_chunks(index, min_z, max_z, min_y, max_y, min_x, max_x):
+    """
+    yield chunk coordinates and the overlap of each chunk with an inclusive extent
+    :return: generator of (cz, cy, cx), (z0, z1, y0, y1, x0, x1) with exclusive overlap ends in
+    volume coordinates
+    """
+    cs = index['chunk_size']
+    for cz in range(min_z // cs, max_z // cs + 1):
+        for cy in range(min_y // cs, max_y // cs + 1):
+            for cx in range(min_x // cs, max_x // cs + 1):
+                yield (cz, cy, cx), (max(min_z, cz * cs), min(max_z + 1, (cz + 1) * cs),
+                                     max(min_y, cy * cs), min(max_y + 1, (cy + 1) * cs),
+                                     max(min_x, cx * cs), min(max_x + 1, (cx + 1) * cs))
+
+
+def read_region(store_path, min_z, max_z, min_y, max_y, min_x, max_x):
+    """
+    read a region with inclusive bounds from a chunk store, reading only overlapping chunks
+    :param store_path: chunk store directory
+    :return: ZYX numpy array of the region
+    """
+    with _lock_store(store_path, exclusive=False):
+        return _read_region(store_path, min_z, max_z, min_y, max_y, min_x, max_x)
+
+
+def _read_region(store_path, min_z, max_z, min_y, max_y, min_x, max_x):
+    index = read_index(store_path)
+    shape = index['shape']
+    max_z = min(max_z, shape[0] - 1)
+    max_y = min(max_y, shape[1] - 1)
+    max_x = min(max_x, shape[2] - 1)
+    cs = index['chunk_size']
+    region = np.zeros((max_z - min_z + 1, max_y - min_y + 1, max_x - min_x + 1),
+                      dtype=np.dtype(index['dtype']))
+    chunks = _overlapping_chunks(index, min_z, max_z, min_y, max_y, min_x, max_x)
+    for (cz, cy, cx), (z0, z1, y0, y1, x0, x1) in chunks:
+        chunk_path = _get_chunk_path(store_path, cz, cy, cx)
+        if not os.path.isfile(chunk_path):
+            continue
+        chunk = np.load(chunk_path, mmap_mode='r')
+        region[z0 - min_z:z1 - min_z, y0 - min_y:y1 - min_y, x0 - min_x:x1 - min_x] = \
+            chunk[z0 - cz * cs:z1 - cz * cs, y0 - cy * cs:y1 - cy * cs, x0 - cx * cs:x1 - cx * cs]
+    return region
+
+
+def read_pages(store_path, min_z, max_z):
+    """
+    read full z pages in [min_z, max_z] from a chunk store
+    :param store_path: chunk store directory
+    :return: ZYX numpy array of the pages
+    """
+    _, y_size, x_size = read_index(store_path)['shape']
+    return read_region(store_path, min_z, max_z, 0, y_size - 1, 0, x_size - 1)
+
+
+def update_region(store_path, block, min_z, min_y, min_x, source_version, new_source_version):
+    """
+    write a ZYX block into a chunk store, reading and rewriting only the chunks it overlaps, once
+    the block has been committed to a new version of the source file. The store is only updated
+    if it is still in sync with the source file version the block was applied to; otherwise, it is
+    left to be rebuilt from the source file.
+    :param store_path: chunk store directory
+    :param block: ZYX numpy array to write
+    :param min_z: minimum z of the block in the volume
+    :param min_y: minimum y of the block in the volume
+    :param min_x: minimum x of the block in the volume
+    :param source_version: version string of the source file the block was applied to
+    :param new_source_version: version string of the new source file including the block
+    :return: True if the store is updated, False otherwise
+    """
+    with _lock_store(store_path):
+        index = read_index(store_path)
+        if not index or index['source_version'] != source_version:
+            return False
+        _write_region(store_path, index, block, min_z, min_y, min_x)
+        _set_source_version(store_path, index, new_source_version)
+    return True
+
+
+def _write_region(store_path, index, block, min_z, min_y, min_x):
+    cs = index['chunk_size']
+    shape = index['shape']
+    dtype = np.dtype(index['dtype'])
+    max_z = min_z + block.shape[0] - 1
+    max_y = min_y + block.shape[1] - 1
+    max_x = min_x + block.shape[2] - 1
+    chunks = _overlapping_chunks(index, min_z, max_z, min_y, max_y, min_x, max_x)
+    for (cz, cy, cx), (z0, z1, y0, y1, x0, x1) in chunks:
+        chunk_path = _get_chunk_path(store_path, cz, cy, cx)
+        if os.path.isfile(chunk_path):
+            chunk = np.load(chunk_path)
+        else:
+            chunk = np.zeros((min(cs, shape[0] - cz * cs), min(cs, shape[1] - cy * cs),
+                              min(cs, shape[2] - cx * cs)), dtype=dtype)
+        chunk[z0 - cz * cs:z1 - cz * cs, y0 - cy * cs:y1 - cy * cs, x0 - cx * cs:x1 - cx * cs] = \
+            block[z0 - min_z:z1 - min_z, y0 - min_y:y1 - min_y, x0 - min_x:x1 - min_x]
+        _write_chunk(chunk_path, chunk)
+
+
+def export_tiff(store_path, out_path):
+    """
+    export a chunk store as a multi-page TIFF file with one page per z slice
+    :param store_path: chunk store directory
+    :param out_path: path of the TIFF file to write
+    :return:
+    """
+    out_tif = TIFF.open(out_path, mode='w')
+    with _lock_store(store_path, exclusive=False):
+        index = read_index(store_path)
+        z_size, y_size, x_size = index['shape']
+        cs = index['chunk_size']
+        for cz in range(0, z_size, cs):
+            slab = _read_region(store_path, cz, min(cz + cs, z_size) - 1, 0, y_size - 1, 0,
+                                x_size - 1)
+            for img in slab:
+                out_tif.write_image(img)
+    out_tif.close()
@@ -0,0 +1,3 @@
+# root directory of the region files, volume sidecars, chunk stores, and caches written by the
+# plugin on the girder server
+DATA_PATH = '/girder/data'
@@ -0,0 +1,132 @@
+import os
+import uuid
+import shutil
+import hashlib
+import threading
+from .constants import DATA_PATH
+
+
+# region crop TIFF files extracted from whole item files are cached on disk keyed by the whole
+# item file id, the file version, and the crop extent. The least recently used crops are evicted
+# when the total cache size exceeds MAX_CACHE_BYTES.
+CACHE_PATH = os.path.join(DATA_PATH, '_crop_cache')
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+
+_lock = threading.Lock()
+_stats = {
+    'hits': 0,
+    'misses': 0,
+    'evictions': 0
+}
+# total size of cached crops which is computed by scanning the cache directory on first use
+_total_bytes = None
+
+
+def get_cache_key(item_file, extent):
+    """
+    get cache key of a crop of a whole item file
+    :param item_file: whole item file the crop is extracted from
+    :param extent: (min_z, max_z, min_y, max_y, min_x, max_x) inclusive extent of the crop
+    :return: cache key string
+    """
+    version = item_file.get('sha512') or \
+        f"{item_file.get('updated', item_file.get('created'))}_{item_file.get('size')}"
+    key = f"{item_file['_id']}_{version}_{'_'.join(str(int(v)) for v in extent)}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _get_cache_file_path(key):
+    return os.path.join(CACHE_PATH, f'{key}.tif')
+
+
+def _init_total_bytes():
+    global _total_bytes
+    if _total_bytes is not None:
+        return
+    _total_bytes = 0
+    if os.path.isdir(CACHE_PATH):
+        for entry in os.scandir(CACHE_PATH):
+            if entry.name.endswith('.tif'):
+                _total_bytes += entry.stat().st_size
+
+
+def get(key, out_path):
+    """
+    copy a cached crop to out_path if the crop is in the cache
+    :param key: crop cache key
+    :param out_path: path to copy the cached crop TIFF file to
+    :return: True if it is a cache hit; otherwise, return False
+    """
+    cache_file_path = _get_cache_file_path(key)
+    try:
+        shutil.copyfile(cache_file_path, out_path)
+        # the modification time records the last use for LRU eviction
+        os.utime(cache_file_path)
+    except FileNotFoundError:
+        with _lock:
+            _stats['misses'] += 1
+        return False
+    with _lock:
+        _stats['hits'] += 1
+    return True
+
+
+def put(key, crop_path):
+    """
+    add a crop TIFF file to the cache and evict least recently used crops as needed
+    :param key: crop cache key
+    :param crop_path: path of the crop TIFF file to be cached
+    :return:
+    """
+    global _total_bytes
+    size = os.path.getsize(crop_path)
+    if size > MAX_CACHE_BYTES:
+        return
+    os.makedirs(CACHE_PATH, exist_ok=True)
+    cache_file_path = _get_cache_file_path(key)
+    tmp_path = f'{cache_file_path}.{uuid.uuid4()}.tmp'
+    shutil.copyfile(crop_path, tmp_path)
+    with _lock:
+        _init_total_bytes()
+        if os.path.isfile(cache_file_path):
+            _total_bytes -= os.path.getsize(cache_file_path)
+        os.replace(tmp_path, cache_file_path)
+        _total_bytes += size
+        if _total_bytes > MAX_CACHE_BYTES:
+            _evict()
+
+
+def _evict():
+    """
+    evict least recently used crops until the cache size is within MAX_CACHE_BYTES. It has to be
+    called with the lock held
+    :return:
+    """
+    global _total_bytes
+    entries = [entry for entry in os.scandir(CACHE_PATH) if entry.name.endswith('.tif')]
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries:
+        if _total_bytes <= MAX_CACHE_BYTES:
+            break
+        try:
+            size = entry.stat().st_size
+            os.remove(entry.path)
+        except FileNotFoundError:
+            continue
+        _total_bytes -= size
+        _stats['evictions'] += 1
+
+
+def get_stats():
+    """
+    get crop cache statistics for sizing the cache
+    :return: dict of hit, miss and eviction counters along with cache size info
+    """
+    with _lock:
+        _init_total_bytes()
+        stats = dict(_stats)
+        stats['total_bytes'] = _total_bytes
+        stats['max_bytes'] = MAX_CACHE_BYTES
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0
+    return stats
@@ -1,4 +1,3 @@
-import random
 from datetime import datetime
 from girder.models.item import Item
 from girder.models.user import User
@@ -6,47 +5,34 @@ from bson.objectid import ObjectId
 from girder.models.collection import Collection
 from girder.models.folder import Folder
 from girder.exceptions import RestException
+from girder.constants import AccessType
+from .region_ids import allocate_region_ids
+from .request_context import request_scope, get_item_loader
 from .utils import TRAINING_COLLECTION_NAME, COLLECTION_NAME, ANNOT_ASSIGN_KEY, TRAINING_KEY, \
     ANNOT_COMPLETE_KEY, REVIEW_ASSIGN_KEY, REVIEW_COMPLETE_KEY, REVIEW_DONE_KEY, \
-    REVIEW_APPROVE_KEY, ASSIGN_COUNT_FOR_REVIEW, get_training_info_id_list, get_max_region_id, \
-    set_max_region_id, remove_region_from_active_assignment, merge_region_to_active_assignment, \
+    REVIEW_APPROVE_KEY, ASSIGN_COUNT_FOR_REVIEW, get_training_info_id_list, \
+    remove_region_from_active_assignment, merge_region_to_active_assignment, \
     set_assignment_meta, get_history_info, assign_region_to_user, add_meta_to_history, \
     check_subvolume_done, reject_assignment, update_assignment_in_whole_item, \
-    get_assignment_status, WHOLE_ITEM_NAME, save_content_data, save_added_and_removed_regions, \
-    get_completed_assignment_items, update_all_assignment_masks_async
+    WHOLE_ITEM_NAME, save_content_data, save_added_and_removed_regions, \
+    get_completed_assignment_items, update_all_assignment_masks_async, get_assignment_status_docs, \
+    update_assignment_approval_status, get_subvolume_history, get_region_comments, \
+    get_user_assignments, get_subvolumes_assignment_status_docs, get_subvolumes_history, \
+    load_whole_item, find_whole_item, get_whole_item_region, pick_available_region
 
 
 def get_available_region_ids(whole_item, count=1):
     """
-    return max region id followed by increasing max region id by delta in an atomic operation
+    return available region ids by reusing removed region ids first followed by increasing max
+    region id in an atomic operation
     :param whole_item: whole item to get available region ids
     :param count: number of available ids to get
     :return: available count number of region ids
     """
-    max_id = get_max_region_id(whole_item)
-    if 'removed_region_ids' in whole_item['meta'] and whole_item['meta']['removed_region_ids']:
-        id_list = whole_item['meta']['removed_region_ids']
-        id_list_cnt = len(id_list)
-        if id_list_cnt == count:
-            whole_item['meta']['removed_region_ids'] = []
-            Item().save(whole_item)
-            return id_list
-        if id_list_cnt > count:
-            whole_item['meta']['removed_region_ids'] = id_list[count:]
-            Item().save(whole_item)
-            return id_list[:count]
-        # id_list_cnt < count, so append more available ids
-        whole_item['meta']['removed_region_ids'] = []
-        Item().save(whole_item)
-        id_list.extend([max_id + 1 + i for i in range(count - id_list_cnt)])
-        set_max_region_id(whole_item, max_id + count - id_list_cnt)
-        return id_list
-
-    id_list = [max_id + 1 + i for i in range(count)]
-    set_max_region_id(whole_item, max_id + count)
-    return id_list
+    return allocate_region_ids(whole_item, count)
 
 
+@request_scope
 def remove_region_from_item_assignment(user, subvolume_id, active_assignment_id, region_id,
                                        current_region_ids, content_data):
     """
@@ -60,7 +46,7 @@ def remove_region_from_item_assignment(user, subvolume_id, active_assignment_id,
     :return: a dict with status
     """
     ret_dict = {}
-    whole_item = Item().findOne({'_id': ObjectId(subvolume_id)})
+    whole_item = load_whole_item(subvolume_id)
     region_id = str(region_id)
     assign_info = get_history_info(whole_item, active_assignment_id, ANNOT_ASSIGN_KEY)
     if assign_info:
@@ -84,6 +70,7 @@ def remove_region_from_item_assignment(user, subvolume_id, active_assignment_id,
         raise RestException('input region id to be removed is not currently assigned', code=400)
 
 
+@request_scope
 def claim_assignment(user, subvolume_id, active_assignment_id, claim_region_id,
                      current_region_ids, content_data):
     """
@@ -97,12 +84,12 @@ def claim_assignment(user, subvolume_id, active_assignment_id, claim_region_id,
     :return: a dict with status and assigned_user_info keys
     """
     ret_dict = {}
-    whole_item = Item().findOne({'_id': ObjectId(subvolume_id)})
+    whole_item = load_whole_item(subvolume_id)
     claim_region_id = str(claim_region_id)
-    if claim_region_id not in whole_item['meta']['regions']:
+    val = get_whole_item_region(whole_item, claim_region_id)
+    if val is None:
         raise RestException('input region id to be claimed is invalid', code=400)
     else:
-        val = whole_item['meta']['regions'][claim_region_id]
         if REVIEW_APPROVE_KEY in val and val[REVIEW_APPROVE_KEY] == 'true':
             # claimed region has been verified
             raise RestException(f'The claimed region has been verified', code=400)
@@ -140,6 +127,7 @@ def claim_assignment(user, subvolume_id, active_assignment_id, claim_region_id,
         return ret_dict
 
 
+@request_scope
 def request_assignment(user, subvolume_id, assign_item_id, request_region_id,
                        request_review_assignment):
     """
@@ -156,7 +144,7 @@ def request_assignment(user, subvolume_id, assign_item_id, request_region_id,
         raise RestException('Either assign_item_id or region_id has to be provided in order to '
                             'identify the assignment to get info for', code=400)
 
-    whole_item = Item().findOne({'_id': ObjectId(subvolume_id)})
+    whole_item = load_whole_item(subvolume_id)
     # check if the requesting user already has active assignment, and if yes, this user cannot
     # request other assignment
     uid = user['_id']
@@ -166,22 +154,22 @@ def request_assignment(user, subvolume_id, assign_item_id, request_region_id,
                 annot_info = get_history_info(whole_item, item_id, ANNOT_ASSIGN_KEY)
                 review_assign_info = get_history_info(whole_item, item_id, REVIEW_ASSIGN_KEY)
                 if annot_info and annot_info[0]['user'] == user['login'] and \
-                    (not review_assign_info or review_assign_info[0]['user'] != user['login']):
+                        (not review_assign_info or review_assign_info[0]['user'] != user['login']):
                     raise RestException('Requesting user already has active annotation assignment '
                                         'so cannot request a new annotation assignment', code=400)
 
     ret_dict = {}
     if not assign_item_id:
         request_region_id = str(request_region_id)
-        if request_region_id not in whole_item['meta']['regions']:
+        val = get_whole_item_region(whole_item, request_region_id)
+        if val is None:
             raise RestException('The requested region id is not valid', code=400)
-        val = whole_item['meta']['regions'][request_region_id]
         if REVIEW_APPROVE_KEY in val and val[REVIEW_APPROVE_KEY] == 'true':
             raise RestException('The requested region has been approved outside Ninjato', code=400)
         assign_item_id = val['item_id'] if 'item_id' in val else ''
 
     if assign_item_id:
-        assign_item = Item().findOne({'_id': ObjectId(assign_item_id)})
+        assign_item = get_item_loader().load(assign_item_id)
         complete_info = get_history_info(whole_item, assign_item_id, ANNOT_COMPLETE_KEY)
         review_complete_info = get_history_info(whole_item, assign_item_id, REVIEW_COMPLETE_KEY)
         if review_complete_info and complete_info[0]['time'] < review_complete_info[0]['time']:
@@ -193,8 +181,8 @@ def request_assignment(user, subvolume_id, assign_item_id, request_region_id,
             # request annotation assignment
             ret_dict['status'] = 'failure'
             if REVIEW_APPROVE_KEY in assign_item['meta'] and \
-                assign_item['meta'][REVIEW_APPROVE_KEY] == 'false' and \
-                user['login'] == complete_info[0]['user']:
+                    assign_item['meta'][REVIEW_APPROVE_KEY] == 'false' and \
+                    user['login'] == complete_info[0]['user']:
                 ret_dict['status'] = 'success'
 
             ret_dict['assigned_user_info'] = complete_info[0]
@@ -268,10 +256,28 @@ def request_assignment(user, subvolume_id, assign_item_id, request_region_id,
 
 
 def get_region_comment_info(item, region_label):
-    if 'comment_history' in item['meta'] and region_label in item['meta']['comment_history']:
-        return item['meta']['comment_history'][region_label]
-    else:
-        return []
+    return get_region_comments(item, region_label)
+
+
+# cached subvolume item ids keyed by the training flag with values of tuples of the collection
+# id and the subvolume item id list, which are invalidated when folders or whole items under the
+# collection are created or removed
+_subvolume_ids_cache = {}
+
+
+def invalidate_subvolume_ids_cache(event):
+    """
+    event handler to invalidate cached subvolume item ids when a folder or a whole item under a
+    cached collection is created or removed
+    :param event: girder folder or item save or remove event with the document as info
+    :return:
+    """
+    doc = event.info
+    if 'folderId' in doc and doc.get('name') != WHOLE_ITEM_NAME:
+        return
+    for training, (coll_id, _) in list(_subvolume_ids_cache.items()):
+        if doc.get('baseParentId') == coll_id:
+            _subvolume_ids_cache.pop(training, None)
 
 
 def get_subvolume_item_ids(training):
@@ -281,38 +287,39 @@ def get_subvolume_item_ids(training):
     :return: array of dicts with 'id' key indicate subvolume item id and 'parent_id' key indicates
      folder id so that subvolumes can be grouped into a hierachy if needed
     """
-    ret_data = []
+    if training in _subvolume_ids_cache:
+        return [dict(val) for val in _subvolume_ids_cache[training][1]]
     if training:
         coll = Collection().findOne({'name': TRAINING_COLLECTION_NAME})
     else:
         coll = Collection().findOne({'name': COLLECTION_NAME})
     if not coll:
-        return ret_data
-    vol_folders = Folder().find({
-        'parentId': coll['_id'],
-        'parentCollection': 'collection'
-    })
-    for vol_folder in vol_folders:
-        sub_vol_folders = Folder().find({
-            'parentId': vol_folder['_id'],
-            'parentCollection': 'folder'
-        })
-        for sub_vol_folder in sub_vol_folders:
-            folders = Folder().find({
-                'parentId': sub_vol_folder['_id'],
-                'parentCollection': 'folder'
-            })
-            for folder in folders:
-                whole_item = Item().findOne({'folderId': ObjectId(folder['_id']),
-                                             'name': WHOLE_ITEM_NAME})
-                ret_data.append({
-                    'id': whole_item['_id'],
-                    'parent_id': folder['_id']
-                })
-
-    return ret_data
-
-
+        return []
+    # get all folders in the collection with one query and resolve the volume folder ->
+    # subvolume folder -> folder hierarchy from their parent ids
+    child_folders = {}
+    for folder in Folder().find({'baseParentId': coll['_id']},
+                                fields=['parentId', 'parentCollection']):
+        parent_id = coll['_id'] if folder['parentCollection'] == 'collection' else \
+            folder['parentId']
+        child_folders.setdefault(parent_id, []).append(folder['_id'])
+    folder_ids = [folder_id
+                  for vol_folder_id in child_folders.get(coll['_id'], [])
+                  for sub_vol_folder_id in child_folders.get(vol_folder_id, [])
+                  for folder_id in child_folders.get(sub_vol_folder_id, [])]
+    whole_item_ids = {item['folderId']: item['_id'] for item in Item().find({
+        'folderId': {'$in': folder_ids},
+        'name': WHOLE_ITEM_NAME
+    }, fields=['folderId'])}
+    ret_data = [{
+        'id': whole_item_ids[folder_id],
+        'parent_id': folder_id
+    } for folder_id in folder_ids if folder_id in whole_item_ids]
+    _subvolume_ids_cache[training] = (coll['_id'], ret_data)
+    return [dict(val) for val in ret_data]
+
+
+@request_scope
 def get_item_assignment(user, subvolume_id, request_new, training):
     """
     get region assignment in a subvolume for annotation task. If user has multiple active
@@ -333,27 +340,28 @@ def get_item_assignment(user, subvolume_id, request_new, training):
     if user['login'] == 'admin':
         return ret_data
 
-    id_list = []
-    filtered_id_list = []
     if not subvolume_id:
-        subvolume_ids = get_subvolume_item_ids(training)
-        for id_item in subvolume_ids:
-            id_list.append(id_item['id'])
-    else:
-        id_list.append(subvolume_id)
+        # return all assignments the user has a role with across all subvolumes
+        return get_user_assignments(user['login'],
+                                    [id_item['id'] for id_item in get_subvolume_item_ids(training)])
+
+    id_list = [subvolume_id]
+    filtered_id_list = []
 
     uid = str(user['_id'])
     annot_done_key = 'annotation_done'
 
     for sub_id in id_list:
-        whole_item = Item().findOne({'_id': ObjectId(sub_id)})
-        if subvolume_id and REVIEW_APPROVE_KEY in whole_item['meta'] and \
-            whole_item['meta'][REVIEW_APPROVE_KEY] == 'true':
+        whole_item = load_whole_item(sub_id)
+        if REVIEW_APPROVE_KEY in whole_item['meta'] and \
+                whole_item['meta'][REVIEW_APPROVE_KEY] == 'true':
             continue
 
-        if subvolume_id and uid in whole_item['meta']:
+        if uid in whole_item['meta']:
+            assign_items = get_item_loader().load_many(
+                whole_item['meta'][uid], fields=[f'meta.{annot_done_key}', 'meta.region_ids'])
             for assign_item_id in whole_item['meta'][uid]:
-                assign_item = Item().findOne({'_id': ObjectId(assign_item_id)})
+                assign_item = assign_items[str(assign_item_id)]
                 ret_type = ANNOT_ASSIGN_KEY
                 if annot_done_key in assign_item['meta'] and \
                         assign_item['meta'][annot_done_key] == 'true':
@@ -375,22 +383,8 @@ def get_item_assignment(user, subvolume_id, request_new, training):
                 # only return the user's active assignment
                 continue
 
-        if not subvolume_id and 'history' in whole_item['meta']:
-            # check other potential assignment the user is involved with
-            for assign_item_id, info_ary in whole_item['meta']['history'].items():
-                for info in info_ary:
-                    if info['user'] == user['login']:
-                        assign_item = Item().findOne({'_id': ObjectId(assign_item_id)})
-                        ret_data.append({
-                            'type': info['type'],
-                            'status': get_assignment_status(whole_item, assign_item_id),
-                            'item_id': assign_item_id,
-                            'subvolume_id': whole_item['_id'],
-                            'region_ids': assign_item['meta']['region_ids']
-                        })
-
         filtered_id_list.append(sub_id)
-    if not request_new or not subvolume_id:
+    if not request_new:
         # return the user's assignments
         return ret_data
 
@@ -400,7 +394,7 @@ def get_item_assignment(user, subvolume_id, request_new, training):
 
     # this user has no active assignment, assign a new region to the user
     sub_id = filtered_id_list[0]
-    whole_item = Item().findOne({'_id': ObjectId(sub_id)})
+    whole_item = load_whole_item(sub_id)
 
     # if TRAINING_INFO key is in metadata, make sure the available region to assign is part of
     # assigned training module regions
@@ -409,63 +403,29 @@ def get_item_assignment(user, subvolume_id, request_new, training):
     else:
         training_region_ids = []
 
-    # no region has been assigned to the user yet, look into the whole partition
-    # item to find a region for assignment
-    # filter out those regions unavailable for assignment first
-    avail_region_items = {}
-    for key, val in whole_item['meta']['regions'].items():
-        if REVIEW_APPROVE_KEY in val and val[REVIEW_APPROVE_KEY] == 'true':
-            # if a region is approved/verified outside ninjato, this review_approved_key can be
-            # set to true for the region metadata, so this region will not be assigned to new users
-            continue
-
-        # if a region is rejected by the user, continue to check another region
-        if 'item_id' in val:
-            reject_by_info = get_history_info(whole_item, val['item_id'],
-                                              'annotation_rejected_by')
-            if reject_by_info:
-                user_rejected = False
-                for reject_dict in reject_by_info:
-                    if reject_dict['user'] == str(user['login']):
-                        # this assignment has been rejected by this user
-                        user_rejected = True
-                        break
-                if user_rejected:
-                    # user rejected this assignment, continue to check another assignment
-                    continue
-            if get_history_info(whole_item, val['item_id'], ANNOT_ASSIGN_KEY):
-                continue
-        if not training_region_ids or int(key) in training_region_ids:
-            avail_region_items[key] = val
-
-    # randomize available item to assign to users to minimize adjacent region assignment
-    if len(avail_region_items) > 0:
-        if not training_region_ids:
-            key, _ = random.choice(list(avail_region_items.items()))
-        else:
-            key = ''
-            for tid in training_region_ids:
-                if str(tid) in avail_region_items:
-                    key = str(tid)
-                    break
-        if key:
-            # this region can be assigned to a user
-            region_item = assign_region_to_user(whole_item, user, key)
-            assigned_region_id = region_item['_id']
-            assign_regions = region_item['meta']['region_ids']
-            if assigned_region_id:
-                item_dict = {
-                    'type': ANNOT_ASSIGN_KEY,
-                    'status': 'active',
-                    'item_id': assigned_region_id,
-                    'subvolume_id': subvolume_id,
-                    'regions': assign_regions
-                }
-                ret_data.append(item_dict)
+    # no region has been assigned to the user yet, pick a region available for assignment from
+    # the available region pool of the whole partition item, which is randomized to minimize
+    # adjacent region assignment
+    key = pick_available_region(whole_item, str(user['login']), training_region_ids)
+    if key:
+        # this region can be assigned to a user
+        region_item = assign_region_to_user(whole_item, user, key)
+        assigned_region_id = region_item['_id']
+        assign_regions = region_item['meta']['region_ids']
+        if assigned_region_id:
+            item_dict = {
+                'type': ANNOT_ASSIGN_KEY,
+                'status': 'active',
+                'item_id': assigned_region_id,
+                'subvolume_id': subvolume_id,
+                'regions': assign_regions
+            }
+            ret_data.append(item_dict)
 
     return ret_data
 
 
+@request_scope
 def save_user_annotation_as_item(user, item_id, done, reject, comment, color, current_region_ids,
                                  content_data):
     """
@@ -482,9 +442,8 @@ def save_user_annotation_as_item(user, item_id, done, reject, comment, color, cu
     """
     uid = user['_id']
     uname = user['login']
-    item = Item().findOne({'_id': ObjectId(item_id)})
-    whole_item = Item().findOne({'folderId': ObjectId(item['folderId']),
-                                 'name': WHOLE_ITEM_NAME})
+    item = get_item_loader().load(item_id)
+    whole_item = find_whole_item(item['folderId'])
     if reject:
         # reject the annotation
         reject_assignment(user, item, whole_item, True, comment)
@@ -537,6 +496,7 @@ def save_user_annotation_as_item(user, item_id, done, reject, comment, color, cu
                     REVIEW_DONE_KEY: 'false'
                 }
                 Item().setMetadata(item, add_meta)
+                update_assignment_approval_status(whole_item, item)
                 # update whole volume masks with annotations
                 if annot_file_name:
                     update_assignment_in_whole_item(whole_item, item_id,
@@ -562,6 +522,7 @@ def save_user_annotation_as_item(user, item_id, done, reject, comment, color, cu
     }
 
 
+@request_scope
 def save_user_review_result_as_item(user, item_id, done, reject, comment, approve,
                                     current_region_ids, content_data):
     """
@@ -578,9 +539,8 @@ def save_user_review_result_as_item(user, item_id, done, reject, comment, approv
     """
     uid = user['_id']
     uname = user['login']
-    item = Item().findOne({'_id': ObjectId(item_id)})
-    whole_item = Item().findOne({'folderId': ObjectId(item['folderId']),
-                                 'name': WHOLE_ITEM_NAME})
+    item = get_item_loader().load(item_id)
+    whole_item = find_whole_item(item['folderId'])
     if reject:
         # reject the review assignment
         reject_assignment(user, item, whole_item, False, comment, task='review')
@@ -613,12 +573,11 @@ def save_user_review_result_as_item(user, item_id, done, reject, comment, approv
             add_meta[REVIEW_DONE_KEY] = 'true'
 
     for comment_key, comment_val in comment.items():
-        add_meta_to_history(whole_item,
-                             str(comment_key),
-                             {'comment': comment_val,
-                              'user': uname,
-                              'time': datetime.now().strftime("%m/%d/%Y %H:%M:%S")},
-                             key='comment_history')
+        add_meta_to_history(whole_item, str(comment_key), {
+            'comment': comment_val,
+            'user': uname,
+            'time': datetime.now().strftime("%m/%d/%Y %H:%M:%S")
+        }, key='comment_history')
     whole_item = save_added_and_removed_regions(whole_item, item, current_region_ids,
                                                 done, uid, add_meta)
     if done:
@@ -644,15 +603,35 @@ def save_user_review_result_as_item(user, item_id, done, reject, comment, approv
     }
 
 
-def get_subvolume_item_info(item):
+def _needs_info_field(fields, field_filter):
+    return fields is None or any(field_filter(field) for field in fields)
+
+
+def _needs_region_counts(fields):
+    return _needs_info_field(fields, lambda f: f.startswith('total_') and f != 'total_regions')
+
+
+def get_subvolume_item_info(item, folder_name=None, status_docs=None, history=None, fields=None):
     """
     get subvolume item info
     :param item: subvolume item id
+    :param folder_name: prefetched name of the subvolume folder, which is looked up if None
+    :param status_docs: prefetched dict of assignment item id to assignment status document of the
+    subvolume, which is looked up if None
+    :param history: prefetched assignment history of the subvolume, which is looked up if None
+    :param fields: list of info keys to return besides id. All keys are returned if None
     :return: item info dict including name, description, location, total_regions,
     total_annotation_completed_regions, total_annotation_active_regions,
     total_annotation_available_regions, total_review_completed_regions, total_review_active_regions,
     total_review_available_regions
     """
+    info = _get_subvolume_item_info(item, folder_name, status_docs, history, fields)
+    if fields is None:
+        return info
+    return {key: val for key, val in info.items() if key == 'id' or key in fields}
+
+
+def _get_subvolume_item_info(item, folder_name, status_docs, history, fields):
     item_id = item['_id']
     region_dict = item['meta']['regions']
 
@@ -665,16 +644,18 @@ def get_subvolume_item_info(item):
 
     ret_dict = {
         'id': item_id,
-        'name': Folder().findOne({'_id': item['folderId']})['name'],
+        'name': folder_name if folder_name is not None else
+        Folder().findOne({'_id': item['folderId']})['name'],
         'description': item['description'],
         'location': item['meta']['coordinates'],
         'total_regions': total_regions,
         'intensity_ranges': item['meta']['intensity_range_per_slice'],
         'training_user': item['meta']['training_user'] if 'training_user' in item['meta'] else '',
         'gold_standard_mask_item_id': item['meta']['gold_standard_mask_item_id']
-        if 'gold_standard_mask_item_id' in item['meta'] else '',
-        'history': item['meta']['history'] if 'history' in item['meta'] else {}
+        if 'gold_standard_mask_item_id' in item['meta'] else ''
     }
+    if _needs_info_field(fields, lambda f: f == 'history'):
+        ret_dict['history'] = history if history is not None else get_subvolume_history(item)
     annot_done_key = 'annotation_done'
     annot_done = False
     review_done = False
@@ -700,15 +681,22 @@ def get_subvolume_item_info(item):
     total_reviewed_regions_done = 0
     total_reviewed_regions_at_work = 0
     total_unassigned_item_ids = []
+    if not _needs_region_counts(fields):
+        return ret_dict
+    if status_docs is None:
+        # get status of all assignments in the subvolume with one query
+        status_docs = get_assignment_status_docs(
+            item, list({val['item_id'] for val in region_dict.values() if 'item_id' in val}))
     for key, val in region_dict.items():
         if 'item_id' in val:
-            assign_status = get_assignment_status(item, val['item_id'])
+            assign_status = status_docs[val['item_id']]['status']
             if assign_status == 'inactive':
                 if val['item_id'] not in total_unassigned_item_ids:
                     total_unassigned_item_ids.append(val['item_id'])
                     total_regions_available += 1
                 continue
-            review_complete_info = get_history_info(item, val['item_id'], REVIEW_COMPLETE_KEY)
+            review_complete_info = \
+                status_docs[val['item_id']]['history_info'].get(REVIEW_COMPLETE_KEY)
         else:
             if REVIEW_APPROVE_KEY in val and val[REVIEW_APPROVE_KEY] == 'true':
                 total_regions_review_approved += 1
@@ -743,9 +731,8 @@ def get_subvolume_item_info(item):
         ret_dict['total_review_completed_regions'] = total_reviewed_regions_done
         ret_dict['total_review_active_regions'] = total_reviewed_regions_at_work
         ret_dict['total_review_approved_regions'] = total_regions_review_approved
-        ret_dict['total_review_available_regions'] = total_regions_done - \
-                                                     total_regions_review_approved - \
-                                                     total_reviewed_regions_at_work
+        ret_dict['total_review_available_regions'] = \
+            total_regions_done - total_regions_review_approved - total_reviewed_regions_at_work
         return ret_dict
 
     # both annotation and review are not done
@@ -760,6 +747,61 @@ def get_subvolume_item_info(item):
     return ret_dict
 
 
+def get_subvolumes_item_info(user, training=False, ids=None, fields=None):
+    """
+    get subvolume item info of multiple subvolumes with database reads shared across subvolumes
+    :param user: requesting user
+    :param training: whether to get subvolumes from training data collection or not if ids is
+    not set
+    :param ids: list of whole subvolume item ids. All subvolumes in the collection are included
+    if it is empty
+    :param fields: list of info keys to return besides id. All keys are returned if None
+    :return: list of subvolume item info dicts as returned by get_subvolume_item_info. A
+    subvolume whose info cannot be computed is reported with id and error keys only so that the
+    other subvolumes are still returned.
+    """
+    if ids:
+        invalid_ids = [str(item_id) for item_id in ids if not ObjectId.is_valid(str(item_id))]
+        if invalid_ids:
+            raise RestException(f'Invalid subvolume item ids: {", ".join(invalid_ids)}',
+                                code=400)
+        item_ids = [ObjectId(str(item_id)) for item_id in ids]
+    else:
+        item_ids = [sub_vol['id'] for sub_vol in get_subvolume_item_ids(training)]
+    if not item_ids:
+        return []
+    order = {item_id: i for i, item_id in enumerate(item_ids)}
+    items = sorted(Item().filterResultsByPermission(Item().find({'_id': {'$in': item_ids}}),
+                                                    user, AccessType.READ),
+                   key=lambda item: order[item['_id']])
+    if _needs_info_field(fields, lambda f: f == 'name'):
+        folder_names = {folder['_id']: folder['name'] for folder in Folder().find(
+            {'_id': {'$in': list({item['folderId'] for item in items})}}, fields=['name'])}
+    else:
+        folder_names = {}
+    status_docs = histories = {}
+    try:
+        if _needs_region_counts(fields):
+            status_docs = get_subvolumes_assignment_status_docs(items)
+        if _needs_info_field(fields, lambda f: f == 'history'):
+            histories = get_subvolumes_history(items)
+    except Exception:
+        # some subvolume fails, so look up each subvolume on its own to isolate the failure
+        status_docs = histories = None
+    info_list = []
+    for item in items:
+        try:
+            info_list.append(get_subvolume_item_info(
+                item, folder_name=folder_names.get(item['folderId'], ''),
+                status_docs=status_docs.get(str(item['_id']), {}) if status_docs is not None
+                else None,
+                history=histories.get(str(item['_id']), {}) if histories is not None else None,
+                fields=fields))
+        except Exception as e:
+            info_list.append({'id': item['_id'], 'error': f'Failed to get subvolume info: {e}'})
+    return info_list
+
+
 def get_subvolume_all_assignment_status(item):
     """
     get all assignment status in a subvolume
@@ -767,13 +809,12 @@ def get_subvolume_all_assignment_status(item):
     :return: all assignment dict in the form of key value pair as "assignment item id": "status"
     """
     region_dict = item['meta']['regions']
-    assign_status_dict = {}
-    for key, val in region_dict.items():
-        if 'item_id' in val:
-            assign_status_dict[val['item_id']] = get_assignment_status(item, val['item_id'])
-    return assign_status_dict
+    status_docs = get_assignment_status_docs(
+        item, list({val['item_id'] for val in region_dict.values() if 'item_id' in val}))
+    return {aid: doc['status'] for aid, doc in status_docs.items()}
 
 
+@request_scope
 def get_region_or_assignment_info(item, assign_item_id, region_id):
     """
     get region info or assignment info if the region is part of the assignment
@@ -804,7 +845,7 @@ def get_region_or_assignment_info(item, assign_item_id, region_id):
         else:
             raise RestException('no assignment found', code=400)
 
-    region_item = Item().findOne({'_id': ObjectId(assign_item_id)}) if assign_item_id else None
+    region_item = get_item_loader().load(assign_item_id) if assign_item_id else None
     if not region_item:
         raise RestException('no assignment found', code=400)
 
@@ -825,14 +866,16 @@ def get_region_or_assignment_info(item, assign_item_id, region_id):
             if current_region in regions:
                 regions.remove(current_region)
 
-    assign_info = get_history_info(item, assign_item_id, ANNOT_ASSIGN_KEY)
+    status_doc = get_assignment_status_docs(item, [assign_item_id])[str(assign_item_id)]
+    assign_info = get_history_info(item, assign_item_id, ANNOT_ASSIGN_KEY, status_doc=status_doc)
     annotator_info = {}
     reviewer_info = {}
     if assign_info:
         annotator_username = assign_info[-1]['user']
         annotator_info['login'] = annotator_username
         annotator_info['id'] = User().findOne({'login': annotator_username})['_id']
-        review_info = get_history_info(item, assign_item_id, REVIEW_ASSIGN_KEY)
+        review_info = get_history_info(item, assign_item_id, REVIEW_ASSIGN_KEY,
+                                       status_doc=status_doc)
         if review_info:
             review_username = review_info[-1]['user']
             reviewer_info['login'] = review_username
@@ -847,15 +890,16 @@ def get_region_or_assignment_info(item, assign_item_id, region_id):
         'location': region_item['meta']['coordinates'] if region_item else {},
         'last_updated_time': region_item['updated'] if region_item else '',
         'regions': regions,
-        'color': region_item['meta']['color'] \
+        'color': region_item['meta']['color']
         if region_item and 'color' in region_item['meta'] else {},
-        'status': get_assignment_status(item, assign_item_id) if region_item else 'inactive'
+        'status': status_doc['status'] if region_item else 'inactive'
     }
     if TRAINING_KEY in region_item['meta']:
         ret_dict[TRAINING_KEY] = region_item['meta'][TRAINING_KEY]
     return ret_dict
 
 
+@request_scope
 def get_all_avail_items_for_review(item):
     """
     Get all finished annotation assignments that are available for review
@@ -864,23 +908,35 @@ def get_all_avail_items_for_review(item):
     """
     region_dict = item['meta']['regions']
     avail_item_list = []
-    for key, val in region_dict.items():
+    assign_item_ids = list({val['item_id'] for val in region_dict.values() if 'item_id' in val})
+    assign_items = get_item_loader().load_many(assign_item_ids,
+                                               fields=[f'meta.{REVIEW_APPROVE_KEY}'])
+    status_docs = get_assignment_status_docs(item, assign_item_ids)
+    for val in region_dict.values():
         if 'item_id' in val:
-            assign_item = Item().findOne({'_id': ObjectId(val['item_id'])})
+            assign_item = assign_items.get(val['item_id'])
+            if not assign_item:
+                continue
             if REVIEW_APPROVE_KEY in assign_item['meta'] and \
-                assign_item['meta'][REVIEW_APPROVE_KEY] == 'true':
+                    assign_item['meta'][REVIEW_APPROVE_KEY] == 'true':
                 continue
-            complete_info = get_history_info(item, val['item_id'], ANNOT_COMPLETE_KEY)
-            review_assign_info = get_history_info(item, val['item_id'], REVIEW_ASSIGN_KEY)
+            status_doc = status_docs[val['item_id']]
+            complete_info = get_history_info(item, val['item_id'], ANNOT_COMPLETE_KEY,
+                                             status_doc=status_doc)
+            review_assign_info = get_history_info(item, val['item_id'], REVIEW_ASSIGN_KEY,
+                                                  status_doc=status_doc)
             if not complete_info:
                 continue
             add_metadata = {
                 'id': val['item_id'],
                 'annotation_completed_by': complete_info,
                 'annotation_rejected_by': get_history_info(item, val['item_id'],
-                                                           'annotation_rejected_by'),
-                'review_rejected_by': get_history_info(item, val['item_id'], 'review_rejected_by'),
-                'annotation_assigned_to': get_history_info(item, val['item_id'], ANNOT_ASSIGN_KEY)
+                                                           'annotation_rejected_by',
+                                                           status_doc=status_doc),
+                'review_rejected_by': get_history_info(item, val['item_id'], 'review_rejected_by',
+                                                       status_doc=status_doc),
+                'annotation_assigned_to': get_history_info(item, val['item_id'], ANNOT_ASSIGN_KEY,
+                                                           status_doc=status_doc)
             }
             if not review_assign_info:
                 avail_item_list.append(add_metadata)
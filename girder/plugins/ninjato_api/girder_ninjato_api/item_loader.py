@@ -0,0 +1,264 @@
+from bson.objectid import ObjectId
+from girder.models.item import Item
+
+
+class PartialSection(dict):
+    """
+    entries of a lazy metadata section that is not loaded yet which are fetched or changed on
+    their own, where None marks an entry that does not exist. Removing an entry marks it so that
+    the removal is kept once the section is loaded.
+    """
+
+    def pop(self, key, *args):
+        value = super().get(key, *args)
+        self[key] = None
+        return value
+
+
+class LazyMeta(dict):
+    """
+    item metadata dict loaded with a projection that leaves out heavy sections, which are fetched
+    from the database on first access. A single entry of a section that is not loaded yet can be
+    fetched on its own by get_path, and entries of such a section are changed on their own through
+    get_partial without loading the section.
+    """
+
+    def __init__(self, item_id, meta, lazy_keys):
+        super().__init__(meta)
+        self._item_id = item_id
+        self._lazy_keys = {key for key in lazy_keys if key not in meta}
+        # section key to the dict of entries fetched or changed on their own, where None marks
+        # an entry that does not exist
+        self._partial = {}
+
+    def _load(self, keys):
+        keys = [key for key in keys if key in self._lazy_keys]
+        if not keys:
+            return
+        doc = Item().collection.find_one({'_id': self._item_id},
+                                         projection={f'meta.{key}': True for key in keys})
+        meta = doc.get('meta', {}) if doc else {}
+        for key in keys:
+            self._lazy_keys.discard(key)
+            if key in meta:
+                super().__setitem__(key, meta[key])
+        # keep entries fetched or changed on their own so that the documents already handed out
+        # and the changes not written yet stay in use
+        for key in keys:
+            entries = self._partial.pop(key, {})
+            if not entries:
+                continue
+            section = super().setdefault(key, {})
+            if not isinstance(section, dict):
+                continue
+            for sub_key, val in entries.items():
+                if val is None:
+                    section.pop(sub_key, None)
+                else:
+                    section[sub_key] = val
+
+    def load_all(self):
+        self._load(list(self._lazy_keys))
+
+    def is_loaded(self, key):
+        return key not in self._lazy_keys
+
+    def get_path(self, key, sub_key):
+        """
+        get an entry of a metadata section, e.g., a region under regions, fetching only the entry
+        if the section is not loaded yet
+        :param key: metadata section key
+        :param sub_key: entry key in the section
+        :return: the entry or None if it does not exist
+        """
+        sub_key = str(sub_key)
+        if self.is_loaded(key):
+            section = super().get(key)
+            return section.get(sub_key) if isinstance(section, dict) else None
+        entries = self.get_partial(key)
+        if sub_key not in entries:
+            doc = Item().collection.find_one({'_id': self._item_id},
+                                             projection={f'meta.{key}.{sub_key}': True})
+            section = doc.get('meta', {}).get(key, {}) if doc else {}
+            entries[sub_key] = section.get(sub_key) if isinstance(section, dict) else None
+        return entries[sub_key]
+
+    def get_partial(self, key):
+        """
+        get the entries of a metadata section that is not loaded yet which are fetched or changed
+        on their own. Entries set in the returned dict replace the stored entries and entries set
+        to None are removed once the section is loaded.
+        :param key: metadata section key
+        :return: dict of entry key to entry or None if the entry does not exist
+        """
+        return self._partial.setdefault(key, PartialSection())
+
+    def __getitem__(self, key):
+        self._load([key])
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        self._lazy_keys.discard(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._load([key])
+        super().__delitem__(key)
+
+    def __contains__(self, key):
+        self._load([key])
+        return super().__contains__(key)
+
+    def get(self, key, default=None):
+        self._load([key])
+        return super().get(key, default)
+
+    def pop(self, key, *args):
+        self._load([key])
+        return super().pop(key, *args)
+
+    def setdefault(self, key, default=None):
+        self._load([key])
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        for key in dict(*args, **kwargs):
+            self._lazy_keys.discard(key)
+        super().update(*args, **kwargs)
+
+    def __iter__(self):
+        self.load_all()
+        return super().__iter__()
+
+    def __len__(self):
+        self.load_all()
+        return super().__len__()
+
+    def keys(self):
+        self.load_all()
+        return super().keys()
+
+    def values(self):
+        self.load_all()
+        return super().values()
+
+    def items(self):
+        self.load_all()
+        return super().items()
+
+    def copy(self):
+        self.load_all()
+        return dict(super().items())
+
+    def __eq__(self, other):
+        self.load_all()
+        return super().__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        self.load_all()
+        return super().__repr__()
+
+
+def load_lazy_meta(event):
+    """
+    event handler to load all lazy metadata sections of an item before the item is saved as a
+    whole, since the BSON encoder reads the underlying dict without loading them
+    :param event: girder model.item.save event with the item document as info
+    :return:
+    """
+    meta = event.info.get('meta')
+    if isinstance(meta, LazyMeta):
+        meta.load_all()
+
+
+class ItemLoader:
+    """
+    batching loader of item documents that fetches all requested items with one $in query and a
+    projection of only the needed fields, and memoizes loaded documents so that later loads of
+    the same items do not query the database again. Within a request, it serves as an identity
+    map so that repeated lookups of an item return the same document.
+    """
+
+    def __init__(self):
+        # item id string to the tuple of loaded fields, which is None if the full document is
+        # loaded, and the loaded document, which is None if the item does not exist
+        self._docs = {}
+        # (folder id string, item name) to the item id string of items found by name
+        self._names = {}
+
+    def _is_loaded(self, item_id, fields):
+        if item_id not in self._docs:
+            return False
+        loaded_fields = self._docs[item_id][0]
+        return loaded_fields is None or (fields is not None and set(fields) <= loaded_fields)
+
+    def load_many(self, item_ids, fields=None, lazy_meta=None):
+        """
+        load items by ids
+        :param item_ids: list of item ids
+        :param fields: list of fields such as meta.region_ids to load. Full documents are loaded
+        if it is None
+        :param lazy_meta: list of keys of heavy metadata sections that are left out when full
+        documents are loaded and fetched on first access instead
+        :return: dict keyed by item id string with item document values. Items that do not exist
+        are not included.
+        """
+        item_ids = [str(item_id) for item_id in item_ids]
+        fields = None if fields is None else set(fields)
+        missing_ids = [item_id for item_id in dict.fromkeys(item_ids)
+                       if not self._is_loaded(item_id, fields)]
+        if missing_ids:
+            query_fields = fields
+            if query_fields is not None:
+                # load fields loaded previously as well so that the memoized document keeps them
+                for item_id in missing_ids:
+                    if item_id in self._docs:
+                        query_fields = query_fields | self._docs[item_id][0]
+            if query_fields is not None:
+                projection = list(query_fields)
+            elif lazy_meta:
+                projection = {f'meta.{key}': False for key in lazy_meta}
+            else:
+                projection = None
+            docs = {str(doc['_id']): doc for doc in Item().find(
+                {'_id': {'$in': [ObjectId(item_id) for item_id in missing_ids]}},
+                fields=projection)}
+            if query_fields is None and lazy_meta:
+                for doc in docs.values():
+                    doc['meta'] = LazyMeta(doc['_id'], doc.get('meta', {}), lazy_meta)
+            for item_id in missing_ids:
+                self._docs[item_id] = (query_fields, docs.get(item_id))
+        return {item_id: self._docs[item_id][1] for item_id in item_ids
+                if self._docs[item_id][1] is not None}
+
+    def load(self, item_id, fields=None, lazy_meta=None):
+        """
+        load an item by id
+        :param item_id: item id
+        :param fields: list of fields to load. The full document is loaded if it is None
+        :param lazy_meta: list of keys of heavy metadata sections to be fetched on first access
+        :return: item document or None if the item does not exist
+        """
+        return self.load_many([item_id], fields=fields, lazy_meta=lazy_meta).get(str(item_id))
+
+    def find_in_folder(self, folder_id, name, lazy_meta=None):
+        """
+        find the full document of an item by name in a folder
+        :param folder_id: folder id
+        :param name: item name
+        :param lazy_meta: list of keys of heavy metadata sections to be fetched on first access
+        :return: item document or None if the item does not exist
+        """
+        key = (str(folder_id), name)
+        if key not in self._names:
+            doc = Item().findOne({'folderId': ObjectId(folder_id), 'name': name},
+                                 fields=['_id'])
+            if doc is None:
+                return None
+            self._names[key] = str(doc['_id'])
+        return self.load(self._names[key], lazy_meta=lazy_meta)
+
+    def invalidate(self, item_id):
+        self._docs.pop(str(item_id), None)
@@ -0,0 +1,183 @@
+from datetime import datetime
+from .item_loader import LazyMeta
+
+
+# version field of item documents which is incremented by every metadata mutation write
+VERSION_KEY = 'metaVersion'
+
+
+class MetaMutation:
+    """
+    changes to the metadata of an item gathered as targeted update operators on dotted paths
+    under meta and flushed as a single update_one, so the size of the write matches the change
+    rather than the document. Changes are applied to the in-memory item document right away so
+    that the rest of the request sees them. Changes to entries of a lazy metadata section that is
+    not loaded are applied to the entries of the section kept on their own, so that recording
+    them does not load the section.
+    """
+
+    def __init__(self, item):
+        self.item = item
+        # list of (update operator, dotted path under meta, value) in the order of the changes
+        self._ops = []
+        # list of (dotted path under meta, value) to unset only if the path still has the value
+        # in the database when the other changes have been written
+        self._conditional_unsets = []
+
+    def _get_parent(self, path, create=False):
+        """
+        get the in-memory dict holding the last key of a dotted meta path
+        :return: parent dict and the last key, where the parent dict is None if it does not exist
+        and create is False
+        """
+        keys = path.split('.')
+        parent = self.item['meta']
+        if isinstance(parent, LazyMeta) and len(keys) > 1 and not parent.is_loaded(keys[0]):
+            if len(keys) > 2:
+                # fetch only the entry that is changed
+                parent.get_path(keys[0], keys[1])
+            parent = parent.get_partial(keys[0])
+            keys = keys[1:]
+        for key in keys[:-1]:
+            if parent.get(key) is None:
+                if not create:
+                    return None, keys[-1]
+                parent[key] = {}
+            parent = parent[key]
+        return parent, keys[-1]
+
+    def set(self, path, value):
+        parent, key = self._get_parent(path, create=True)
+        parent[key] = value
+        self._ops.append(('$set', path, value))
+
+    def unset(self, path):
+        parent, key = self._get_parent(path)
+        if parent is not None:
+            parent.pop(key, None)
+        self._ops.append(('$unset', path, ''))
+
+    def push(self, path, value):
+        parent, key = self._get_parent(path, create=True)
+        parent.setdefault(key, []).append(value)
+        self._ops.append(('$push', path, value))
+
+    def add_to_set(self, path, value):
+        parent, key = self._get_parent(path, create=True)
+        values = parent.setdefault(key, [])
+        if value not in values:
+            values.append(value)
+        self._ops.append(('$addToSet', path, value))
+
+    def pull(self, path, value):
+        parent, key = self._get_parent(path)
+        if parent is not None and isinstance(parent.get(key), list):
+            parent[key] = [val for val in parent[key] if val != value]
+        self._ops.append(('$pull', path, value))
+
+    def unset_if(self, path, value):
+        """
+        unset a path only if it still has the value in the database once the other changes are
+        written, e.g., a user key whose assignment list has become empty, which another request
+        may have added an assignment to in the meantime
+        :param path: dotted path under meta
+        :param value: value the path must have to be unset
+        :return:
+        """
+        parent, key = self._get_parent(path)
+        if parent is not None and parent.get(key) == value:
+            parent.pop(key, None)
+        self._conditional_unsets.append((path, value))
+
+    def has_changes(self):
+        return bool(self._ops)
+
+    def get_ops(self):
+        return list(self._ops)
+
+    def get_conditional_unsets(self):
+        return list(self._conditional_unsets)
+
+    def replay(self, ops):
+        """
+        apply recorded changes of other mutations to the item of this mutation in order
+        :param ops: list of (update operator, dotted path, value) returned by get_ops
+        :return:
+        """
+        for op, path, value in ops:
+            if op == '$set':
+                self.set(path, value)
+            elif op == '$unset':
+                self.unset(path)
+            elif op == '$push':
+                self.push(path, value)
+            elif op == '$addToSet':
+                self.add_to_set(path, value)
+            else:
+                self.pull(path, value)
+
+    def _get_groups(self):
+        """
+        group changed paths under the top-most changed path they are nested in
+        :return: dict of top-most path to the list of changed paths under it, and dict of changed
+        path to its list of (update operator, value)
+        """
+        ops_by_path = {}
+        for op, path, value in self._ops:
+            ops_by_path.setdefault(path, []).append((op, value))
+        groups = {}
+        for path in sorted(ops_by_path, key=lambda p: p.count('.')):
+            root = next((r for r in groups if path == r or path.startswith(f'{r}.')), path)
+            groups.setdefault(root, []).append(path)
+        return groups, ops_by_path
+
+    def needs_base(self):
+        """
+        whether the update depends on the in-memory item, i.e., some changes cannot be expressed
+        as update operators and fall back to a $set of the in-memory value
+        :return: True or False
+        """
+        groups, ops_by_path = self._get_groups()
+        return any(len(paths) > 1 or len({op for op, _ in ops_by_path[root]}) > 1
+                   for root, paths in groups.items())
+
+    def get_update(self):
+        """
+        get the update document combining all gathered changes. Changes to the same path with
+        different operators or to nested paths cannot be combined in one update, so they fall back
+        to a $set of the in-memory value of their top-most path.
+        :return: update document for update_one or None if there are no changes
+        """
+        if not self._ops:
+            return None
+        groups, ops_by_path = self._get_groups()
+        update = {'$set': {'updated': datetime.utcnow()}}
+        for root, paths in groups.items():
+            ops = ops_by_path[root]
+            if len(paths) > 1 or len({op for op, _ in ops}) > 1:
+                parent, key = self._get_parent(root)
+                if parent is not None and parent.get(key) is not None:
+                    update['$set'][f'meta.{root}'] = parent[key]
+                else:
+                    update.setdefault('$unset', {})[f'meta.{root}'] = ''
+                continue
+            op = ops[0][0]
+            values = [value for _, value in ops]
+            if op in ('$set', '$unset'):
+                update.setdefault(op, {})[f'meta.{root}'] = values[-1]
+            elif op == '$pull':
+                update.setdefault(op, {})[f'meta.{root}'] = {'$in': values}
+            else:
+                update.setdefault(op, {})[f'meta.{root}'] = {'$each': values}
+        return update
+
+    def clear(self, version=None):
+        """
+        clear gathered changes after they are written
+        :param version: the item version after the write
+        :return:
+        """
+        self._ops = []
+        self._conditional_unsets = []
+        if version is not None:
+            self.item[VERSION_KEY] = version
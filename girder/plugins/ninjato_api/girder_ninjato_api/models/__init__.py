@@ -0,0 +1,9 @@
+from .assignment_extent import AssignmentExtent
+from .assignment_status import AssignmentStatus
+from .history import History
+from .label_index import LabelIndex
+from .region_pool import RegionPool
+from .user_assignment import UserAssignment
+
+__all__ = ['AssignmentExtent', 'AssignmentStatus', 'History', 'LabelIndex', 'RegionPool',
+           'UserAssignment']
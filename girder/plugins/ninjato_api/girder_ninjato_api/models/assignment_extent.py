@@ -0,0 +1,87 @@
+from datetime import datetime
+from bson.objectid import ObjectId
+from pymongo import UpdateOne, ASCENDING
+from girder.models.model_base import Model
+
+
+AXES = ('x', 'y', 'z')
+
+
+class AssignmentExtent(Model):
+    """
+    bounding box extent of each assignment of a whole subvolume item to find assignments that
+    overlap an extent with an index range query instead of loading all assignment items. Extents
+    are recorded whenever assignment coordinates change. Extents of assignments created before
+    the index existed are recorded once per subvolume, which is recorded by a marker document with
+    no assignmentId.
+    """
+
+    def initialize(self):
+        self.name = 'ninjato_assignment_extent'
+        self.ensureIndices([
+            ([('subvolumeId', ASCENDING), ('assignmentId', ASCENDING)], {'unique': True}),
+            ([('subvolumeId', ASCENDING), ('x_min', ASCENDING), ('x_max', ASCENDING)], {})
+        ])
+
+    def validate(self, doc):
+        return doc
+
+    @staticmethod
+    def _get_extent_fields(extent):
+        return {f'{axis}_{bound}': int(extent[f'{axis}_{bound}'])
+                for axis in AXES for bound in ('min', 'max')}
+
+    def is_built(self, subvolume_id):
+        return self.collection.find_one({'subvolumeId': ObjectId(subvolume_id),
+                                         'assignmentId': None},
+                                        projection={'_id': True}) is not None
+
+    def build(self, subvolume_id, extents):
+        """
+        record extents of existing assignments of a subvolume without overwriting extents that
+        are already recorded, which are up to date
+        :param subvolume_id: whole subvolume item id
+        :param extents: dict of assignment item id to coordinates dict
+        :return:
+        """
+        subvolume_id = ObjectId(subvolume_id)
+        ops = [UpdateOne({'subvolumeId': subvolume_id, 'assignmentId': ObjectId(aid)},
+                         {'$setOnInsert': self._get_extent_fields(extent)}, upsert=True)
+               for aid, extent in extents.items()]
+        ops.append(UpdateOne({'subvolumeId': subvolume_id, 'assignmentId': None},
+                             {'$set': {'updated': datetime.utcnow()}}, upsert=True))
+        self.collection.bulk_write(ops, ordered=False)
+
+    def set_extent(self, subvolume_id, assign_item_id, extent):
+        """
+        record the extent of an assignment
+        :param subvolume_id: whole subvolume item id
+        :param assign_item_id: assignment item id
+        :param extent: assignment coordinates dict with x_min, x_max, y_min, y_max, z_min, and
+        z_max keys
+        :return:
+        """
+        self.collection.update_one(
+            {'subvolumeId': ObjectId(subvolume_id), 'assignmentId': ObjectId(assign_item_id)},
+            {'$set': self._get_extent_fields(extent)}, upsert=True)
+
+    def remove_assignments(self, subvolume_id, assign_item_ids):
+        self.collection.delete_many({
+            'subvolumeId': ObjectId(subvolume_id),
+            'assignmentId': {'$in': [ObjectId(aid) for aid in assign_item_ids]}
+        })
+
+    def find_overlapping(self, subvolume_id, extent):
+        """
+        find assignments of a subvolume whose extents overlap an extent. Extents that only touch
+        at a boundary do not overlap.
+        :param subvolume_id: whole subvolume item id
+        :param extent: coordinates dict with x_min, x_max, y_min, y_max, z_min, and z_max keys
+        :return: list of assignment item id strings
+        """
+        query = {'subvolumeId': ObjectId(subvolume_id), 'assignmentId': {'$ne': None}}
+        for axis in AXES:
+            query[f'{axis}_min'] = {'$lt': int(extent[f'{axis}_max'])}
+            query[f'{axis}_max'] = {'$gt': int(extent[f'{axis}_min'])}
+        return [str(doc['assignmentId']) for doc in self.collection.find(
+            query, projection={'assignmentId': True})]
@@ -0,0 +1,203 @@
+from datetime import datetime
+from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
+from girder.models.model_base import Model
+from girder.exceptions import RestException
+from .history import parse_time
+
+
+MAX_RETRIES = 5
+
+
+class AssignmentStatus(Model):
+    """
+    status of each assignment derived from the assignment history of its whole subvolume item.
+    Each document holds the currently valid history info list per history type, newest first,
+    as well as the assignment status so that status queries do not need to walk the history.
+    Documents are written whole with an optimistic check of their version field so that
+    concurrent updates of the same assignment are reapplied rather than lost.
+    """
+
+    def initialize(self):
+        self.name = 'ninjato_assignment_status'
+        self.ensureIndices([
+            ([('subvolumeId', 1), ('assignmentId', 1)], {'unique': True}),
+            ([('subvolumeId', 1), ('status', 1)], {})
+        ])
+
+    def validate(self, doc):
+        return doc
+
+    @staticmethod
+    def apply_info(doc, info):
+        """
+        apply a new history info to the currently valid history info lists of a status document.
+        A rejection of a task invalidates all previous history info of the task.
+        :param doc: assignment status document
+        :param info: history info dict with type, user and time keys
+        :return:
+        """
+        task = info['type'].split('_')[0]
+        rejected_by_key = f'{task}_rejected_by'
+        history_info = doc['history_info']
+        if info['type'] == rejected_by_key:
+            for in_type in list(history_info):
+                if in_type.split('_')[0] == task:
+                    del history_info[in_type]
+            history_info[rejected_by_key] = [info]
+        else:
+            history_info[info['type']] = [info] + history_info.get(info['type'], [])
+
+    @staticmethod
+    def derive_status(doc):
+        """
+        derive assignment status from the history info lists and approval of a status document
+        :param doc: assignment status document
+        :return: completed, inactive, active, awaiting review, or under review
+        """
+        if doc['approved']:
+            return 'completed'
+        history_info = doc['history_info']
+        assign_info = history_info.get('annotation_assigned_to')
+        complete_info = history_info.get('annotation_completed_by')
+        if not assign_info:
+            return 'inactive'
+        if not complete_info:
+            return 'active'
+        if not history_info.get('review_assigned_to'):
+            return 'awaiting review'
+        review_complete_info = history_info.get('review_completed_by')
+        if not review_complete_info:
+            return 'under review'
+        if parse_time(complete_info[0]['time']) < parse_time(review_complete_info[0]['time']):
+            # assignment is reassigned to user after reviewer disapproved the annotation
+            return 'active'
+        # assignment is annotated again, not assigned for review yet
+        return 'awaiting review'
+
+    def _save_status(self, doc):
+        """
+        save a status document only if it is unchanged in the database since it was read
+        :param doc: assignment status document
+        :return: saved document or None if it was changed by another writer
+        """
+        version = doc.get('version', 0)
+        query = {'subvolumeId': doc['subvolumeId'], 'assignmentId': doc['assignmentId'],
+                 'version': version if version else {'$exists': False}}
+        new_doc = dict(doc, status=self.derive_status(doc), updated=datetime.utcnow(),
+                       version=version + 1)
+        try:
+            # the upsert hits the unique index if the document exists with another version
+            self.collection.replace_one(query, new_doc, upsert=True)
+        except DuplicateKeyError:
+            return None
+        doc.update(new_doc)
+        return doc
+
+    def _update_status(self, doc, func):
+        """
+        apply a change to a status document and save it, reapplying the change to the latest
+        document when another writer got in between
+        :param doc: assignment status document
+        :param func: function applying the change to a status document in place
+        :return: saved document
+        """
+        for _ in range(MAX_RETRIES):
+            func(doc)
+            saved = self._save_status(doc)
+            if saved is not None:
+                return saved
+            doc = self.collection.find_one({'subvolumeId': doc['subvolumeId'],
+                                            'assignmentId': doc['assignmentId']})
+            if doc is None:
+                # the assignment has been removed
+                return None
+        raise RestException('Failed to update assignment status due to concurrent updates. '
+                            'Please try again.', code=409)
+
+    def build(self, subvolume_id, assign_item_id, history, approved):
+        """
+        create the status document of an assignment from its full history. If another request
+        has created it in the meantime, that document is returned instead.
+        :param subvolume_id: whole subvolume item id
+        :param assign_item_id: assignment item id
+        :param history: full history info list of the assignment in chronological order
+        :param approved: whether the assignment is review approved
+        :return: assignment status document
+        """
+        doc = {
+            'subvolumeId': ObjectId(subvolume_id),
+            'assignmentId': ObjectId(assign_item_id),
+            'history_info': {},
+            'approved': approved
+        }
+        for info in history:
+            self.apply_info(doc, info)
+        saved = self._save_status(doc)
+        if saved is None:
+            saved = self.collection.find_one({'subvolumeId': doc['subvolumeId'],
+                                              'assignmentId': doc['assignmentId']})
+        return saved
+
+    def get_status_docs(self, subvolume_id, assign_item_ids=None):
+        """
+        get status documents of assignments in a subvolume
+        :param subvolume_id: whole subvolume item id
+        :param assign_item_ids: list of assignment item ids. All assignments in the subvolume are
+        returned if it is None
+        :return: dict keyed by assignment item id string with status document values
+        """
+        query = {'subvolumeId': ObjectId(subvolume_id)}
+        if assign_item_ids is not None:
+            query['assignmentId'] = {'$in': [ObjectId(aid) for aid in assign_item_ids]}
+        return {str(doc['assignmentId']): doc for doc in self.find(query)}
+
+    def get_assignment_ids_by_status(self, subvolume_id, statuses):
+        """
+        get ids of assignments in a subvolume with any of the given statuses
+        :param subvolume_id: whole subvolume item id
+        :param statuses: list of assignment statuses such as active
+        :return: list of assignment item id strings
+        """
+        return [str(doc['assignmentId']) for doc in self.collection.find(
+            {'subvolumeId': ObjectId(subvolume_id), 'status': {'$in': statuses}},
+            projection={'assignmentId': True})]
+
+    def get_status_docs_by_assignment(self, assign_item_ids):
+        """
+        get status documents of assignments across subvolumes with one query
+        :param assign_item_ids: list of assignment item ids
+        :return: dict keyed by assignment item id string with status document values
+        """
+        return {str(doc['assignmentId']): doc for doc in self.find(
+            {'assignmentId': {'$in': [ObjectId(aid) for aid in assign_item_ids]}})}
+
+    def get_subvolumes_status_docs(self, subvolume_ids):
+        """
+        get status documents of all assignments in multiple subvolumes with one query
+        :param subvolume_ids: list of whole subvolume item ids
+        :return: dict keyed by subvolume item id string with values of dicts keyed by assignment
+        item id string with status document values
+        """
+        docs = {str(sid): {} for sid in subvolume_ids}
+        for doc in self.find({'subvolumeId': {'$in': [ObjectId(sid) for sid in subvolume_ids]}}):
+            docs[str(doc['subvolumeId'])][str(doc['assignmentId'])] = doc
+        return docs
+
+    def add_info(self, doc, info):
+        """
+        apply a new history info to an assignment status document and save it
+        :param doc: assignment status document
+        :param info: history info dict with type, user and time keys
+        :return: updated assignment status document
+        """
+        return self._update_status(doc, lambda status_doc: self.apply_info(status_doc, info))
+
+    def set_approved(self, doc, approved):
+        return self._update_status(doc, lambda status_doc: status_doc.update(approved=approved))
+
+    def remove_assignments(self, subvolume_id, assign_item_ids):
+        self.collection.delete_many({
+            'subvolumeId': ObjectId(subvolume_id),
+            'assignmentId': {'$in': [ObjectId(aid) for aid in assign_item_ids]}
+        })
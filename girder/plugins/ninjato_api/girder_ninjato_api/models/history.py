@@ -0,0 +1,152 @@
+from datetime import datetime
+from bson.objectid import ObjectId
+from pymongo import UpdateOne, ASCENDING
+from girder.models.model_base import Model
+
+
+# type of comment history events which do not have a type in their info
+COMMENT_TYPE = 'comment'
+
+
+def parse_time(time_str):
+    """
+    parse a history info time string which may or may not include seconds
+    :param time_str: time string in the form of %m/%d/%Y %H:%M:%S or %m/%d/%Y %H:%M
+    :return: datetime or None if the time string cannot be parsed
+    """
+    for time_format in ("%m/%d/%Y %H:%M:%S", "%m/%d/%Y %H:%M"):
+        try:
+            return datetime.strptime(time_str, time_format)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def to_assign_key(assign_key):
+    """
+    convert an assignment item id to the ObjectId it is stored as while region labels of comment
+    events are stored as strings
+    :param assign_key: assignment item id or region label
+    :return: ObjectId or region label string
+    """
+    return ObjectId(assign_key) if ObjectId.is_valid(str(assign_key)) else str(assign_key)
+
+
+class History(Model):
+    """
+    assignment history and region comment history events of whole subvolume items with one
+    document per event. For assignment history events, assignmentId is the assignment item id
+    stored as an ObjectId as in the other ninjato collections, and for comment events, it is the
+    region label string the comment is added to.
+    """
+
+    def initialize(self):
+        self.name = 'ninjato_history'
+        self.ensureIndices([
+            ([('subvolumeId', ASCENDING), ('assignmentId', ASCENDING), ('type', ASCENDING),
+              ('time', ASCENDING)], {}),
+            ([('user', ASCENDING), ('type', ASCENDING)], {})
+        ])
+
+    def validate(self, doc):
+        return doc
+
+    @staticmethod
+    def _to_doc(subvolume_id, assign_key, info):
+        return {
+            'subvolumeId': ObjectId(subvolume_id),
+            'assignmentId': to_assign_key(assign_key),
+            'type': info['type'] if 'type' in info else COMMENT_TYPE,
+            'user': info['user'] if 'user' in info else '',
+            'time': parse_time(info['time'] if 'time' in info else None),
+            'info': info
+        }
+
+    def add(self, subvolume_id, assign_key, info):
+        """
+        add a history event
+        :param subvolume_id: whole subvolume item id
+        :param assign_key: assignment item id for history events or region label for comments
+        :param info: history info dict
+        :return: added history event document
+        """
+        doc = self._to_doc(subvolume_id, assign_key, info)
+        self.collection.insert_one(doc)
+        return doc
+
+    def migrate(self, subvolume_id, history, comment_history):
+        """
+        import history and comment history dicts previously stored in whole item metadata.
+        Events that are already imported are skipped so that migration can be repeated safely.
+        :param subvolume_id: whole subvolume item id
+        :param history: dict of assignment item id to history info list in chronological order
+        :param comment_history: dict of region label to comment info list in chronological order
+        :return:
+        """
+        ops = []
+        for events in (history, comment_history):
+            for assign_key, info_list in events.items():
+                for info in info_list:
+                    doc = self._to_doc(subvolume_id, assign_key, info)
+                    ops.append(UpdateOne({
+                        'subvolumeId': doc['subvolumeId'],
+                        'assignmentId': doc['assignmentId'],
+                        'type': doc['type'],
+                        'info': info
+                    }, {'$setOnInsert': doc}, upsert=True))
+        if ops:
+            self.collection.bulk_write(ops, ordered=True)
+
+    def find_events(self, subvolume_id, assign_keys=None, types=None, exclude_types=None,
+                    user=None):
+        """
+        find history events of a subvolume in chronological order
+        :param subvolume_id: whole subvolume item id
+        :param assign_keys: list of assignment item ids or region labels to filter events
+        :param types: list of event types to filter events
+        :param exclude_types: list of event types to be excluded
+        :param user: user login name to filter events
+        :return: cursor of event documents
+        """
+        query = {'subvolumeId': ObjectId(subvolume_id)}
+        if assign_keys is not None:
+            query['assignmentId'] = {'$in': [to_assign_key(key) for key in assign_keys]}
+        if types is not None:
+            query['type'] = {'$in': types}
+        elif exclude_types is not None:
+            query['type'] = {'$nin': exclude_types}
+        if user is not None:
+            query['user'] = user
+        return self.find(query, sort=[('time', ASCENDING), ('_id', ASCENDING)])
+
+    def get_history(self, subvolume_id, assign_item_ids=None):
+        """
+        get assignment history of a subvolume in the form of the legacy history metadata
+        :param subvolume_id: whole subvolume item id
+        :param assign_item_ids: list of assignment item ids. All assignments are included if None
+        :return: dict of assignment item id to history info list in chronological order
+        """
+        history = {}
+        for doc in self.find_events(subvolume_id, assign_keys=assign_item_ids,
+                                    exclude_types=[COMMENT_TYPE]):
+            history.setdefault(str(doc['assignmentId']), []).append(doc['info'])
+        return history
+
+    def get_subvolumes_history(self, subvolume_ids):
+        """
+        get assignment history of multiple subvolumes with one query
+        :param subvolume_ids: list of whole subvolume item ids
+        :return: dict keyed by subvolume item id string with values of dicts of assignment item id
+        to history info list in chronological order
+        """
+        histories = {str(sid): {} for sid in subvolume_ids}
+        for doc in self.find({'subvolumeId': {'$in': [ObjectId(sid) for sid in subvolume_ids]},
+                              'type': {'$ne': COMMENT_TYPE}},
+                             sort=[('time', ASCENDING), ('_id', ASCENDING)]):
+            histories[str(doc['subvolumeId'])].setdefault(str(doc['assignmentId']), []).append(
+                doc['info'])
+        return histories
+
+    def get_comments(self, subvolume_id, region_label):
+        return [doc['info'] for doc in self.find_events(subvolume_id, assign_keys=[region_label],
+                                                        types=[COMMENT_TYPE])]
@@ -0,0 +1,135 @@
+from datetime import datetime
+from pymongo import UpdateOne, DeleteOne, DeleteMany
+from girder.models.model_base import Model
+
+
+class LabelIndex(Model):
+    """
+    per-label statistics of whole subvolume masks with one document per label holding the label
+    bounding box, voxel count and centroid so that label extents can be looked up without
+    scanning the mask. A bounding box that may be larger than the label after an incremental
+    update is flagged with exact set to False until it is tightened. A built index is recorded by
+    a marker document with no label so that masks without any labels are not indexed again.
+    """
+
+    def initialize(self):
+        self.name = 'ninjato_label_index'
+        self.ensureIndices([
+            ([('itemId', 1), ('label', 1)], {'unique': True})
+        ])
+
+    def validate(self, doc):
+        return doc
+
+    def has_index(self, item_id):
+        return self.findOne({'itemId': item_id, 'label': None}, fields={'_id': True}) is not None
+
+    def get_label_stats(self, item_id, labels=None):
+        """
+        get persisted label stats of a whole item
+        :param item_id: whole item id
+        :param labels: list of labels to get stats for. All labels are returned if it is None
+        :return: dict keyed by integer label with stats dict values as computed by
+        label_stats.get_label_stats, along with an exact key set to False if the bounding box may
+        be a superset of the label
+        """
+        query = {'itemId': item_id, 'label': {'$ne': None}}
+        if labels is not None:
+            query['label'] = {'$in': [int(label) for label in labels]}
+        ret_stats = {}
+        for doc in self.find(query, fields={'_id': False, 'itemId': False}):
+            ret_stats[doc.pop('label')] = doc
+        return ret_stats
+
+    def build(self, item_id, stats):
+        """
+        replace the label index of a whole item with idempotent upserts so that concurrent builds
+        of the same index on first access do not conflict
+        :param item_id: whole item id
+        :param stats: label stats of the whole item mask as computed by label_stats.get_label_stats
+        :return:
+        """
+        ops = [UpdateOne({'itemId': item_id, 'label': int(label)},
+                         {'$set': dict(label_stats, exact=True)}, upsert=True)
+               for label, label_stats in stats.items()]
+        ops.append(DeleteMany({'itemId': item_id,
+                               'label': {'$nin': [int(label) for label in stats] + [None]}}))
+        # the marker is written last so that the index is only considered built once it is
+        # complete
+        ops.append(UpdateOne({'itemId': item_id, 'label': None},
+                             {'$set': {'built': datetime.utcnow()}}, upsert=True))
+        self.collection.bulk_write(ops, ordered=True)
+
+    def set_exact_stats(self, item_id, stats, labels):
+        """
+        replace the stats of labels with exact stats computed from the mask
+        :param item_id: whole item id
+        :param stats: exact label stats as computed by label_stats.get_label_stats
+        :param labels: labels the stats were computed for, where labels not in stats are removed
+        :return:
+        """
+        ops = [UpdateOne({'itemId': item_id, 'label': int(label)},
+                         {'$set': dict(stats[label], exact=True)}) if label in stats else
+               DeleteOne({'itemId': item_id, 'label': int(label)}) for label in labels]
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+
+    def update_block(self, item_id, old_stats, new_stats, extent):
+        """
+        incrementally update the label index after a block of the whole item mask is rewritten.
+        Voxel counts and centroids are updated exactly. Bounding boxes are exact for labels that
+        were entirely inside the block and are the union of the old and new boxes otherwise, which
+        is flagged as not exact if the label may have shrunk.
+        :param item_id: whole item id
+        :param old_stats: label stats of the block before the write in volume coordinates
+        :param new_stats: label stats of the block after the write in volume coordinates
+        :param extent: dict with z_min, z_max, y_min, y_max, x_min, x_max keys of the block
+        :return:
+        """
+        touched_labels = [label for label in set(old_stats) | set(new_stats)
+                          if old_stats.get(label) != new_stats.get(label)]
+        if not touched_labels:
+            return
+        cur_stats = self.get_label_stats(item_id, touched_labels)
+        ops = []
+        for label in touched_labels:
+            cur = cur_stats.get(label)
+            old = old_stats.get(label)
+            new = new_stats.get(label)
+            count = (cur['count'] if cur else 0) - (old['count'] if old else 0) + \
+                (new['count'] if new else 0)
+            if count <= 0:
+                ops.append(DeleteOne({'itemId': item_id, 'label': label}))
+                continue
+            centroid = {}
+            for axis in ('x', 'y', 'z'):
+                weighted_sum = (cur['count'] * cur['centroid'][axis] if cur else 0) - \
+                    (old['count'] * old['centroid'][axis] if old else 0) + \
+                    (new['count'] * new['centroid'][axis] if new else 0)
+                centroid[axis] = weighted_sum / count
+            exact = True
+            if cur and all(extent[f'{axis}_min'] <= cur[f'{axis}_min']
+                           and cur[f'{axis}_max'] <= extent[f'{axis}_max'] for axis in 'xyz'):
+                # all voxels of the label were in the block, so the new block stats are exact
+                cur = None
+            elif cur:
+                # the union is exact only if the label did not lose voxels at its block boundary
+                exact = cur.get('exact', True) and (not old or new and all(
+                    new[f'{axis}_min'] <= old[f'{axis}_min']
+                    and old[f'{axis}_max'] <= new[f'{axis}_max'] for axis in 'xyz'))
+            if not cur and not new:
+                ops.append(DeleteOne({'itemId': item_id, 'label': label}))
+                continue
+            box = {}
+            for axis in ('x', 'y', 'z'):
+                min_key = f'{axis}_min'
+                max_key = f'{axis}_max'
+                boxes = [s for s in (cur, new) if s]
+                box[min_key] = min(s[min_key] for s in boxes)
+                box[max_key] = max(s[max_key] for s in boxes)
+            box['count'] = count
+            box['centroid'] = centroid
+            box['exact'] = bool(exact)
+            ops.append(UpdateOne({'itemId': item_id, 'label': label}, {'$set': box},
+                                 upsert=True))
+        self.collection.bulk_write(ops, ordered=False)
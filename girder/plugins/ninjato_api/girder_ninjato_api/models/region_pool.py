@@ -0,0 +1,113 @@
+import random
+from datetime import datetime
+from bson.objectid import ObjectId
+from pymongo import UpdateOne, DeleteOne, DeleteMany, ASCENDING, DESCENDING
+from girder.models.model_base import Model
+
+
+class RegionPool(Model):
+    """
+    regions of each whole subvolume item that are available for new annotation assignments, i.e.,
+    regions that are neither approved nor assigned for annotation. Each document holds the region
+    label, the users who rejected the region assignment last, and a random number to pick a
+    region at random with an index seek. A marker document with no label records that the pool of
+    a subvolume has been built.
+    """
+
+    def initialize(self):
+        self.name = 'ninjato_region_pool'
+        self.ensureIndices([
+            ([('subvolumeId', ASCENDING), ('label', ASCENDING)], {'unique': True}),
+            ([('subvolumeId', ASCENDING), ('random', ASCENDING)], {})
+        ])
+
+    def validate(self, doc):
+        return doc
+
+    def is_built(self, subvolume_id):
+        return self.collection.find_one({'subvolumeId': ObjectId(subvolume_id), 'label': None},
+                                        projection={'_id': True}) is not None
+
+    def build(self, subvolume_id, regions):
+        """
+        create or replace the pool of a subvolume with idempotent upserts so that concurrent
+        builds of the same pool on first use do not conflict
+        :param subvolume_id: whole subvolume item id
+        :param regions: dict of available region label to the list of users who rejected it last
+        :return:
+        """
+        subvolume_id = ObjectId(subvolume_id)
+        labels = [str(label) for label in regions]
+        ops = [UpdateOne({'subvolumeId': subvolume_id, 'label': str(label)}, {
+            '$set': {'rejectedBy': rejected_by},
+            '$setOnInsert': {'random': random.random()}
+        }, upsert=True) for label, rejected_by in regions.items()]
+        ops.append(DeleteMany({'subvolumeId': subvolume_id, 'label': {'$nin': labels + [None]}}))
+        ops.append(UpdateOne({'subvolumeId': subvolume_id, 'label': None},
+                             {'$set': {'updated': datetime.utcnow()}}, upsert=True))
+        self.collection.bulk_write(ops, ordered=True)
+
+    def update_regions(self, subvolume_id, regions):
+        """
+        add, update, or remove regions in the pool of a subvolume
+        :param subvolume_id: whole subvolume item id
+        :param regions: dict of region label to the list of users who rejected it last if the
+        region is available or None if the region is not available
+        :return:
+        """
+        subvolume_id = ObjectId(subvolume_id)
+        ops = []
+        for label, rejected_by in regions.items():
+            query = {'subvolumeId': subvolume_id, 'label': str(label)}
+            if rejected_by is None:
+                ops.append(DeleteOne(query))
+            else:
+                ops.append(UpdateOne(query, {
+                    '$set': {'rejectedBy': rejected_by},
+                    '$setOnInsert': {'random': random.random()}
+                }, upsert=True))
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+
+    def sample(self, subvolume_id, username, count):
+        """
+        sample available regions of a subvolume at random that the user did not reject last
+        :param subvolume_id: whole subvolume item id
+        :param username: login name of the user to sample regions for
+        :param count: number of random picks, where picking the same region more than once
+        returns fewer regions
+        :return: list of distinct region labels
+        """
+        labels = []
+        for _ in range(count):
+            label = self.pick(subvolume_id, username)
+            if label is None:
+                break
+            if label not in labels:
+                labels.append(label)
+        return labels
+
+    def pick(self, subvolume_id, username, labels=None):
+        """
+        pick an available region of a subvolume at random that the user did not reject last
+        :param subvolume_id: whole subvolume item id
+        :param username: login name of the user to pick a region for
+        :param labels: list of region labels to pick the first available one from in order
+        instead of picking at random
+        :return: region label or None if no region is available
+        """
+        query = {'subvolumeId': ObjectId(subvolume_id), 'rejectedBy': {'$ne': username}}
+        if labels is not None:
+            query['label'] = {'$in': [str(label) for label in labels]}
+            avail_labels = {doc['label'] for doc in self.collection.find(
+                query, projection={'label': True})}
+            return next((str(label) for label in labels if str(label) in avail_labels), None)
+        query['label'] = {'$ne': None}
+        rand = random.random()
+        for cond, order in (('$gte', ASCENDING), ('$lt', DESCENDING)):
+            doc = self.collection.find_one(dict(query, random={cond: rand}),
+                                           projection={'label': True},
+                                           sort=[('random', order)])
+            if doc:
+                return doc['label']
+        return None
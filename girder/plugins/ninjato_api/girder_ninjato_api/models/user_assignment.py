@@ -0,0 +1,81 @@
+from datetime import datetime
+from bson.objectid import ObjectId
+from pymongo import UpdateOne, ASCENDING
+from girder.models.model_base import Model
+from .history import History, COMMENT_TYPE
+
+
+class UserAssignment(Model):
+    """
+    reverse index of the assignment history from each user to the assignments the user has a role
+    with, holding one document per user and assignment with the latest history event type of the
+    user as the role. Assignment history events recorded before the index existed are indexed
+    once per user, which is recorded by a marker document with no subvolumeId.
+    """
+
+    def initialize(self):
+        self.name = 'ninjato_user_assignment'
+        self.ensureIndices([
+            ([('user', ASCENDING), ('subvolumeId', ASCENDING), ('assignmentId', ASCENDING)],
+             {'unique': True})
+        ])
+
+    def validate(self, doc):
+        return doc
+
+    @staticmethod
+    def _to_update(event):
+        return UpdateOne({
+            'user': event['user'],
+            'subvolumeId': event['subvolumeId'],
+            'assignmentId': ObjectId(event['assignmentId'])
+        }, {'$set': {
+            'type': event['type'],
+            'time': event['time'],
+            'updated': datetime.utcnow()
+        }}, upsert=True)
+
+    def add_events(self, events):
+        """
+        index assignment history events
+        :param events: iterable of history event documents in chronological order
+        :return:
+        """
+        ops = [self._to_update(event) for event in events
+               if event['type'] != COMMENT_TYPE and event['user']]
+        if ops:
+            self.collection.bulk_write(ops, ordered=True)
+
+    def _backfill(self, username):
+        """
+        index all assignment history events of a user that are not indexed yet
+        :param username: user login name
+        :return:
+        """
+        marker = {'user': username, 'subvolumeId': None, 'assignmentId': None}
+        if self.collection.find_one(marker, projection={'_id': True}):
+            return
+        self.add_events(History().find({'user': username, 'type': {'$ne': COMMENT_TYPE}},
+                                       sort=[('time', ASCENDING), ('_id', ASCENDING)]))
+        self.collection.update_one(marker, {'$set': {'updated': datetime.utcnow()}},
+                                   upsert=True)
+
+    def find_user_assignments(self, username, subvolume_ids):
+        """
+        find assignments a user has a role with in the given subvolumes
+        :param username: user login name
+        :param subvolume_ids: list of whole subvolume item ids to find assignments in
+        :return: list of index documents with subvolumeId, assignmentId ObjectId and type keys in
+        chronological order of their latest event
+        """
+        self._backfill(username)
+        return list(self.find({
+            'user': username,
+            'subvolumeId': {'$in': [ObjectId(sid) for sid in subvolume_ids]}
+        }, sort=[('time', ASCENDING), ('_id', ASCENDING)]))
+
+    def remove_assignments(self, subvolume_id, assign_item_ids):
+        self.collection.delete_many({
+            'subvolumeId': ObjectId(subvolume_id),
+            'assignmentId': {'$in': [ObjectId(aid) for aid in assign_item_ids]}
+        })
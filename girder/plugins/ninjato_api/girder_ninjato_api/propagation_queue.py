@@ -0,0 +1,77 @@
+import threading
+from girder import logger
+from girder.models.user import User
+from girder_jobs.models.job import Job
+
+
+# saves of the same subvolume within the delay are propagated to other assignments by one job
+DEBOUNCE_DELAY = 2.0
+
+_lock = threading.Lock()
+# whole item id to the set of saved assignment item ids of its pending propagation job which has
+# not started yet
+_pending = {}
+# whole item ids whose pending propagation job is scheduled or waiting for DEBOUNCE_DELAY
+_scheduled = set()
+# whole item id to the lock that keeps propagation jobs of a subvolume from running concurrently
+_run_locks = {}
+
+
+def _schedule_job(whole_item_id):
+    job_model = Job()
+    try:
+        job = job_model.createLocalJob(title='update assignment files', type='local',
+                                       user=User().getAdmins()[0],
+                                       args=(whole_item_id,),
+                                       module='girder_ninjato_api.async_job_utils',
+                                       function='update_all_assignment_masks')
+        job_model.scheduleJob(job)
+    except Exception:
+        # keep the pending saves so that the next save of the subvolume schedules them again
+        logger.exception(f'Failed to schedule propagation job of subvolume {whole_item_id}')
+        with _lock:
+            _scheduled.discard(whole_item_id)
+
+
+def submit(whole_item_id, saved_assign_item_id):
+    """
+    request propagation of a saved assignment mask to other assignments of its subvolume. The
+    saved assignment is merged into the pending propagation job of the subvolume if there is one;
+    otherwise, a propagation job is scheduled after DEBOUNCE_DELAY. Saves left pending by a job
+    that failed to be scheduled are merged into the job scheduled by the next save.
+    :param whole_item_id: whole subvolume item id
+    :param saved_assign_item_id: assignment item id that already has updated masks
+    :return:
+    """
+    whole_item_id = str(whole_item_id)
+    with _lock:
+        _pending.setdefault(whole_item_id, set()).add(str(saved_assign_item_id))
+        if whole_item_id in _scheduled:
+            return
+        _scheduled.add(whole_item_id)
+    timer = threading.Timer(DEBOUNCE_DELAY, _schedule_job, (whole_item_id,))
+    timer.daemon = True
+    timer.start()
+
+
+def take_pending(whole_item_id):
+    """
+    take the saved assignment ids of the pending propagation job of a subvolume when the job
+    starts, so that later saves schedule a new job
+    :param whole_item_id: whole subvolume item id
+    :return: set of saved assignment item ids
+    """
+    whole_item_id = str(whole_item_id)
+    with _lock:
+        _scheduled.discard(whole_item_id)
+        return _pending.pop(whole_item_id, set())
+
+
+def get_run_lock(whole_item_id):
+    """
+    get the lock held while a propagation job of a subvolume runs
+    :param whole_item_id: whole subvolume item id
+    :return: threading.Lock
+    """
+    with _lock:
+        return _run_locks.setdefault(str(whole_item_id), threading.Lock())
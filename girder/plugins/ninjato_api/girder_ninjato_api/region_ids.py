@@ -0,0 +1,163 @@
+from pymongo import ReturnDocument
+from girder.models.item import Item
+from girder.exceptions import RestException
+from .write_coalescer import MAX_RETRIES
+
+
+# freed region ids of a whole item are kept as a sorted list of non-overlapping inclusive
+# [start, end] ranges under this metadata key
+FREE_RANGES_KEY = 'removed_region_id_ranges'
+# legacy metadata key of the freed region id list which is migrated to ranges when first touched
+LEGACY_FREE_IDS_KEY = 'removed_region_ids'
+# the freed region id ranges and max_region_id are only written here, each by compare-and-swap or
+# $inc on its own key, so these writes leave the metadata version of the item alone and do not
+# conflict with metadata mutations of the same request
+
+
+def add_ids_to_ranges(ranges, ids):
+    """
+    add region ids to sorted region id ranges, merging adjacent and overlapping ranges
+    :param ranges: sorted list of inclusive [start, end] ranges
+    :param ids: iterable of region ids to add
+    :return: new sorted list of merged ranges
+    """
+    all_ranges = sorted([list(r) for r in ranges] + [[int(rid), int(rid)] for rid in ids])
+    merged = []
+    for start, end in all_ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def take_ids_from_ranges(ranges, count):
+    """
+    take up to count smallest region ids from sorted region id ranges
+    :param ranges: sorted list of inclusive [start, end] ranges
+    :param count: number of region ids to take
+    :return: list of taken region ids and the list of remaining ranges
+    """
+    ids = []
+    remaining = []
+    for start, end in ranges:
+        take = min(count - len(ids), end - start + 1)
+        ids.extend(range(start, start + take))
+        if start + take <= end:
+            remaining.append([start + take, end])
+    return ids, remaining
+
+
+def _get_free_state(item_id):
+    """
+    get the current freed region id ranges of a whole item along with the query that matches the
+    item only if they are unchanged
+    :return: tuple of ranges, compare-and-swap query, and update document that clears the legacy
+    freed id list, or None if the item does not exist
+    """
+    doc = Item().collection.find_one({'_id': item_id}, projection={
+        f'meta.{FREE_RANGES_KEY}': True, f'meta.{LEGACY_FREE_IDS_KEY}': True})
+    if doc is None:
+        return None
+    meta = doc.get('meta', {})
+    ranges = meta.get(FREE_RANGES_KEY, [])
+    legacy_ids = meta.get(LEGACY_FREE_IDS_KEY)
+    query = {'_id': item_id}
+    if FREE_RANGES_KEY in meta:
+        query[f'meta.{FREE_RANGES_KEY}'] = ranges
+    else:
+        query[f'meta.{FREE_RANGES_KEY}'] = {'$exists': False}
+    update = {}
+    if legacy_ids is not None:
+        query[f'meta.{LEGACY_FREE_IDS_KEY}'] = legacy_ids
+        update['$unset'] = {f'meta.{LEGACY_FREE_IDS_KEY}': ''}
+        if legacy_ids:
+            ranges = add_ids_to_ranges(ranges, legacy_ids)
+    else:
+        query[f'meta.{LEGACY_FREE_IDS_KEY}'] = {'$exists': False}
+    return ranges, query, update
+
+
+def _update_free_ranges(whole_item, func):
+    """
+    atomically replace the freed region id ranges of a whole item by compare-and-swap
+    :param whole_item: whole subvolume item
+    :param func: function taking the current ranges and returning a tuple of the new ranges and
+    a result to return
+    :return: result returned by func
+    """
+    for _ in range(MAX_RETRIES):
+        state = _get_free_state(whole_item['_id'])
+        if state is None:
+            raise RestException('The whole subvolume item does not exist', code=400)
+        ranges, query, update = state
+        new_ranges, result = func(ranges)
+        if new_ranges == ranges and not update:
+            return result
+        update['$set'] = {f'meta.{FREE_RANGES_KEY}': new_ranges}
+        if Item().collection.update_one(query, update).matched_count:
+            whole_item['meta'][FREE_RANGES_KEY] = new_ranges
+            whole_item['meta'].pop(LEGACY_FREE_IDS_KEY, None)
+            return result
+    raise RestException('Failed to update removed region ids due to concurrent updates. Please '
+                        'try again.', code=409)
+
+
+def free_region_ids(whole_item, region_ids):
+    """
+    add region ids of removed regions to the freed region id pool of a whole item
+    :param whole_item: whole subvolume item
+    :param region_ids: list of region ids that are freed
+    :return:
+    """
+    if region_ids:
+        _update_free_ranges(whole_item, lambda ranges: (add_ids_to_ranges(ranges, region_ids),
+                                                        None))
+
+
+def _init_max_region_id(whole_item):
+    """
+    make sure max_region_id of a whole item is stored as an integer so that it can be incremented
+    atomically
+    """
+    max_id = whole_item['meta'].get('max_region_id')
+    if isinstance(max_id, int):
+        return
+    query = {'_id': whole_item['_id']}
+    if max_id is None:
+        query['meta.max_region_id'] = {'$exists': False}
+        new_max_id = len(whole_item['meta']['regions'])
+    else:
+        query['meta.max_region_id'] = max_id
+        new_max_id = int(max_id)
+    # if the query does not match, another request has already initialized it
+    Item().collection.update_one(query, {'$set': {'meta.max_region_id': new_max_id}})
+
+
+def allocate_region_ids(whole_item, count):
+    """
+    allocate a block of count region ids from a whole item without any lock, reusing freed
+    region ids first and then incrementing max_region_id with a single atomic update
+    :param whole_item: whole subvolume item
+    :param count: number of region ids to allocate
+    :return: list of allocated region ids
+    """
+    if count <= 0:
+        return []
+
+    def _take(ranges):
+        ids, remaining = take_ids_from_ranges(ranges, count)
+        return remaining, ids
+
+    id_list = _update_free_ranges(whole_item, _take)
+    remain_count = count - len(id_list)
+    if remain_count > 0:
+        _init_max_region_id(whole_item)
+        doc = Item().collection.find_one_and_update(
+            {'_id': whole_item['_id']},
+            {'$inc': {'meta.max_region_id': remain_count}},
+            projection={'meta.max_region_id': True}, return_document=ReturnDocument.AFTER)
+        max_id = int(doc['meta']['max_region_id'])
+        whole_item['meta']['max_region_id'] = max_id
+        id_list.extend(range(max_id - remain_count + 1, max_id + 1))
+    return id_list
@@ -0,0 +1,113 @@
+import threading
+from functools import wraps
+from . import write_coalescer
+from .item_loader import ItemLoader
+from .meta_mutation import MetaMutation
+
+
+# state of the request being handled by the current server thread
+_local = threading.local()
+
+
+def _get_scope():
+    return getattr(_local, 'scope', None)
+
+
+def request_scope(func):
+    """
+    decorate an endpoint function to gather item metadata mutations made while handling a request
+    and flush them once the function returns, and to memoize items loaded while handling the
+    request. Mutations gathered by a request that raises are discarded. Nested calls share the
+    scope of the outermost decorated function.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if _get_scope() is not None:
+            return func(*args, **kwargs)
+        _local.scope = {
+            'mutations': {},
+            'item_loader': ItemLoader()
+        }
+        try:
+            result = func(*args, **kwargs)
+            flush()
+            return result
+        finally:
+            _local.scope = None
+    return wrapper
+
+
+def get_meta_mutation(item):
+    """
+    get the metadata mutation of an item to record changes to. In a request scope, all changes to
+    the same item share one mutation which is flushed at the end of the request.
+    :param item: item document to mutate
+    :return: MetaMutation of the item
+    """
+    scope = _get_scope()
+    if scope is None:
+        return MetaMutation(item)
+    mutation = scope['mutations'].get(item['_id'])
+    if mutation is None:
+        mutation = MetaMutation(item)
+        scope['mutations'][item['_id']] = mutation
+    else:
+        mutation.item = item
+    return mutation
+
+
+def save_meta_mutation(mutation):
+    """
+    save the changes of a metadata mutation right away if there is no request scope; otherwise,
+    they are saved when the request scope ends
+    :param mutation: MetaMutation to save
+    :return:
+    """
+    if _get_scope() is None:
+        write_coalescer.submit(mutation)
+
+
+def flush():
+    """
+    flush all pending metadata mutations of the current request scope, e.g., before handing
+    items over to jobs that read them from the database. A failing mutation does not keep the
+    mutations of other items from being flushed, and the first failure is raised afterwards.
+    :return:
+    """
+    scope = _get_scope()
+    if scope is None:
+        return
+    error = None
+    for mutation in scope['mutations'].values():
+        try:
+            write_coalescer.submit(mutation)
+        except Exception as e:
+            if error is None:
+                error = e
+    if error is not None:
+        raise error
+
+
+def get_item_loader():
+    """
+    get the item loader of the current request scope, or a new item loader if there is no
+    request scope
+    :return: ItemLoader
+    """
+    scope = _get_scope()
+    if scope is None:
+        return ItemLoader()
+    return scope['item_loader']
+
+
+def invalidate_loaded_item(event):
+    """
+    event handler to drop an item memoized by the item loader of the current request scope when
+    the item is saved or removed while handling the request
+    :param event: girder model.item.save.after or model.item.remove event with the item document
+    as info
+    :return:
+    """
+    scope = _get_scope()
+    if scope is not None and '_id' in event.info:
+        scope['item_loader'].invalidate(event.info['_id'])
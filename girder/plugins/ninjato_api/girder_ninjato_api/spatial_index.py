@@ -0,0 +1,124 @@
+import math
+
+
+AXES = ('x', 'y', 'z')
+# maximum number of grid cells along each axis to bound the cost of sparse queries
+MAX_CELLS_PER_AXIS = 64
+
+
+def to_box(extent):
+    """
+    convert an extent dict with x_min, x_max, y_min, y_max, z_min, and z_max keys to a box tuple
+    :param extent: extent dict such as region metadata or assignment coordinates
+    :return: tuple of (mins, maxs) where mins and maxs are (x, y, z) tuples
+    """
+    return (tuple(int(extent[f'{axis}_min']) for axis in AXES),
+            tuple(int(extent[f'{axis}_max']) for axis in AXES))
+
+
+def box_distance(box1, box2):
+    """
+    get the Euclidean distance between two boxes, which is 0 if they overlap
+    :param box1: box as returned by to_box
+    :param box2: box as returned by to_box
+    :return: Euclidean distance between the boxes
+    """
+    gaps = [max(box1[0][i] - box2[1][i], box2[0][i] - box1[1][i], 0) for i in range(3)]
+    return math.sqrt(sum(gap * gap for gap in gaps))
+
+
+class BoxGrid:
+    """
+    uniform grid spatial index of boxes for nearest box distance queries. Each box is registered
+    in all grid cells it overlaps, and a query visits cells in rings of increasing distance around
+    the query box until no unvisited box can be closer than the nearest box found.
+    """
+
+    def __init__(self, boxes, cell_size=None):
+        """
+        :param boxes: list of boxes as returned by to_box
+        :param cell_size: grid cell edge length. It is the mean box edge length if None
+        """
+        self._boxes = list(boxes)
+        if cell_size is None:
+            edges = [box[1][i] - box[0][i] + 1 for box in self._boxes for i in range(3)]
+            cell_size = sum(edges) / len(edges) if edges else 1
+        if self._boxes:
+            span = max(max(box[1][i] for box in self._boxes) - min(box[0][i] for box in self._boxes)
+                       for i in range(3))
+            cell_size = max(cell_size, span / MAX_CELLS_PER_AXIS)
+        self._cell_size = max(cell_size, 1)
+        self._cells = {}
+        for idx, box in enumerate(self._boxes):
+            lo, hi = self._get_cell_range(box)
+            for ix in range(lo[0], hi[0] + 1):
+                for iy in range(lo[1], hi[1] + 1):
+                    for iz in range(lo[2], hi[2] + 1):
+                        self._cells.setdefault((ix, iy, iz), []).append(idx)
+        if self._cells:
+            self._cell_lo = tuple(min(cell[i] for cell in self._cells) for i in range(3))
+            self._cell_hi = tuple(max(cell[i] for cell in self._cells) for i in range(3))
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def _get_cell_range(self, box):
+        return (tuple(math.floor(box[0][i] / self._cell_size) for i in range(3)),
+                tuple(math.floor(box[1][i] / self._cell_size) for i in range(3)))
+
+    def _get_ring_cells(self, lo, hi, ring):
+        """
+        get the cells on the shell of the query cell range expanded by ring cells, clipped to the
+        occupied part of the grid
+        """
+        rlo = [max(lo[i] - ring, self._cell_lo[i]) for i in range(3)]
+        rhi = [min(hi[i] + ring, self._cell_hi[i]) for i in range(3)]
+        for ix in range(rlo[0], rhi[0] + 1):
+            for iy in range(rlo[1], rhi[1] + 1):
+                if ring == 0 or ix in (lo[0] - ring, hi[0] + ring) or \
+                        iy in (lo[1] - ring, hi[1] + ring):
+                    z_range = range(rlo[2], rhi[2] + 1)
+                else:
+                    # only the two z faces of the shell are on the ring
+                    z_range = [iz for iz in {lo[2] - ring, hi[2] + ring}
+                               if rlo[2] <= iz <= rhi[2]]
+                for iz in z_range:
+                    yield ix, iy, iz
+
+    def nearest_distance(self, box):
+        """
+        get the distance from a box to the nearest box in the grid
+        :param box: query box as returned by to_box
+        :return: nearest distance or math.inf if the grid is empty
+        """
+        if not self._cells:
+            return math.inf
+        lo, hi = self._get_cell_range(box)
+        max_ring = max(max(lo[i] - self._cell_lo[i], self._cell_hi[i] - hi[i], 0)
+                       for i in range(3))
+        nearest = math.inf
+        visited = set()
+        for ring in range(max_ring + 1):
+            for cell in self._get_ring_cells(lo, hi, ring):
+                for idx in self._cells.get(cell, []):
+                    if idx not in visited:
+                        visited.add(idx)
+                        nearest = min(nearest, box_distance(box, self._boxes[idx]))
+            # boxes in cells beyond this ring are farther than ring cells away
+            if nearest <= ring * self._cell_size:
+                break
+        return nearest
+
+    def pick_farthest(self, candidates):
+        """
+        pick the candidate farthest from its nearest box in the grid
+        :param candidates: list of (key, box) tuples
+        :return: key of the farthest candidate or None if there are no candidates
+        """
+        farthest_key = None
+        farthest_dist = -1
+        for key, box in candidates:
+            dist = self.nearest_distance(box)
+            if dist > farthest_dist:
+                farthest_key, farthest_dist = key, dist
+        return farthest_key
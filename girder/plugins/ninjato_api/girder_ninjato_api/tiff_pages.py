@@ -0,0 +1,191 @@
+import struct
+
+
+# byte size of each TIFF field type
+TYPE_SIZES = {
+    1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4
+}
+# tags pointing to page image data along with the tags holding the byte counts of the data
+DATA_OFFSET_TAGS = {
+    273: 279,  # StripOffsets and StripByteCounts
+    324: 325   # TileOffsets and TileByteCounts
+}
+# tags pointing to data or IFDs that cannot be relocated by copying their raw values
+UNSUPPORTED_TAGS = (288, 289, 330, 513, 514, 34665, 34853)
+SHORT_TYPE = 3
+LONG_TYPE = 4
+
+
+class TiffPage:
+    """
+    a TIFF page read from a classic TIFF file with its IFD entries and the raw bytes of its image
+    data segments so that it can be copied byte by byte
+    """
+
+    def __init__(self, entries, segments):
+        # list of (tag, type, count, raw value bytes)
+        self.entries = entries
+        # dict of data offset tag to the list of raw image data segments
+        self.segments = segments
+
+
+def _read(f, size):
+    # a short read means the file is truncated or an offset points past its end
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError('truncated TIFF file')
+    return data
+
+
+def _read_header(f):
+    byte_order = f.read(2)
+    if byte_order == b'II':
+        endian = '<'
+    elif byte_order == b'MM':
+        endian = '>'
+    else:
+        raise ValueError('not a TIFF file')
+    magic, first_ifd = struct.unpack(f'{endian}HI', _read(f, 6))
+    if magic != 42:
+        # BigTIFF or other variants are not supported
+        raise ValueError(f'unsupported TIFF version {magic}')
+    return endian, first_ifd
+
+
+def _unpack_values(endian, field_type, count, raw):
+    if field_type == SHORT_TYPE:
+        return struct.unpack(f'{endian}{count}H', raw)
+    if field_type == LONG_TYPE:
+        return struct.unpack(f'{endian}{count}I', raw)
+    raise ValueError(f'unsupported offset field type {field_type}')
+
+
+def _read_page(f, endian, ifd_offset):
+    """
+    read a page IFD and its image data segments
+    :return: TiffPage and offset of the next IFD
+    """
+    f.seek(ifd_offset)
+    entry_count = struct.unpack(f'{endian}H', _read(f, 2))[0]
+    raw_entries = [struct.unpack(f'{endian}HHI4s', _read(f, 12)) for _ in range(entry_count)]
+    next_ifd = struct.unpack(f'{endian}I', _read(f, 4))[0]
+    entries = []
+    for tag, field_type, count, value in raw_entries:
+        if tag in UNSUPPORTED_TAGS:
+            raise ValueError(f'unsupported TIFF tag {tag}')
+        size = TYPE_SIZES.get(field_type)
+        if size is None:
+            raise ValueError(f'unsupported TIFF field type {field_type}')
+        size *= count
+        if size > 4:
+            f.seek(struct.unpack(f'{endian}I', value)[0])
+            value = _read(f, size)
+        else:
+            value = value[:size]
+        entries.append((tag, field_type, count, value))
+
+    values = {tag: (field_type, count, value) for tag, field_type, count, value in entries}
+    segments = {}
+    for offset_tag, count_tag in DATA_OFFSET_TAGS.items():
+        if offset_tag not in values:
+            continue
+        offsets = _unpack_values(endian, *values[offset_tag])
+        byte_counts = _unpack_values(endian, *values[count_tag])
+        segments[offset_tag] = []
+        for offset, byte_count in zip(offsets, byte_counts):
+            f.seek(offset)
+            segments[offset_tag].append(_read(f, byte_count))
+    return TiffPage(entries, segments), next_ifd
+
+
+def iter_pages(path):
+    """
+    iterate over the pages of a classic TIFF file
+    :param path: TIFF file path
+    :return: generator of TiffPage. ValueError is raised for TIFF files that cannot be parsed
+    """
+    with open(path, 'rb') as f:
+        endian, ifd_offset = _read_header(f)
+        while ifd_offset:
+            try:
+                page, ifd_offset = _read_page(f, endian, ifd_offset)
+            except struct.error as e:
+                raise ValueError(f'malformed TIFF page: {e}') from e
+            yield page
+
+
+def get_byte_order(path):
+    with open(path, 'rb') as f:
+        return _read_header(f)[0]
+
+
+def _align(f):
+    # TIFF requires offsets to be on word boundaries
+    if f.tell() % 2:
+        f.write(b'\0')
+
+
+def _write_page(f, endian, page):
+    """
+    write a page with its image data segments copied byte by byte and its offsets relocated
+    :return: file offset of the next IFD pointer of the written page
+    """
+    values = {}
+    for offset_tag, segments in page.segments.items():
+        offsets = []
+        for segment in segments:
+            _align(f)
+            offsets.append(f.tell())
+            f.write(segment)
+        values[offset_tag] = (LONG_TYPE, len(offsets),
+                              struct.pack(f'{endian}{len(offsets)}I', *offsets))
+    entries = []
+    for tag, field_type, count, value in page.entries:
+        if tag in values:
+            field_type, count, value = values[tag]
+        if len(value) > 4:
+            _align(f)
+            offset = f.tell()
+            f.write(value)
+            value = struct.pack(f'{endian}I', offset)
+        entries.append((tag, field_type, count, value.ljust(4, b'\0')))
+    _align(f)
+    ifd_offset = f.tell()
+    f.write(struct.pack(f'{endian}H', len(entries)))
+    for tag, field_type, count, value in entries:
+        f.write(struct.pack(f'{endian}HHI', tag, field_type, count) + value)
+    next_ifd_pointer = f.tell()
+    f.write(struct.pack(f'{endian}I', 0))
+    return ifd_offset, next_ifd_pointer
+
+
+def replace_pages(src_path, pages_path, first_page, out_path):
+    """
+    write a copy of a multi-page TIFF file with consecutive pages starting at first_page replaced
+    by the pages of another TIFF file. All other pages are copied byte by byte without decoding.
+    :param src_path: source multi-page TIFF file path
+    :param pages_path: TIFF file path containing the replacement pages in order
+    :param first_page: index of the first source page to be replaced
+    :param out_path: output TIFF file path
+    :return:
+    """
+    endian = get_byte_order(src_path)
+    if get_byte_order(pages_path) != endian:
+        raise ValueError('source and replacement TIFF files have different byte orders')
+    replacements = list(iter_pages(pages_path))
+    last_page = first_page + len(replacements) - 1
+    with open(out_path, 'wb') as f:
+        f.write((b'II' if endian == '<' else b'MM') + struct.pack(f'{endian}HI', 42, 0))
+        prev_pointer = 4
+        index = -1
+        for index, page in enumerate(iter_pages(src_path)):
+            if first_page <= index <= last_page:
+                page = replacements[index - first_page]
+            ifd_offset, next_pointer = _write_page(f, endian, page)
+            f.seek(prev_pointer)
+            f.write(struct.pack(f'{endian}I', ifd_offset))
+            f.seek(0, 2)
+            prev_pointer = next_pointer
+    if index < last_page:
+        raise ValueError(f'replacement pages end at page {last_page} past the last source page '
+                         f'{index}')
@@ -12,23 +12,47 @@ from girder.models.folder import Folder
 from girder.exceptions import RestException
 from girder.utility import assetstore_utilities
 from girder.utility import path as path_util
-from girder_jobs.models.job import Job
+from ninjato_label_stats import label_stats
+from . import chunk_store, crop_cache, propagation_queue, spatial_index, tiff_pages
+from .constants import DATA_PATH
+from .item_loader import LazyMeta
+from .models.assignment_extent import AssignmentExtent
+from .models.assignment_status import AssignmentStatus
+from .models.history import History, COMMENT_TYPE
+from .models.label_index import LabelIndex
+from .models.region_pool import RegionPool
+from .models.user_assignment import UserAssignment
+from .region_ids import free_region_ids
+from .request_context import get_meta_mutation, save_meta_mutation, get_item_loader, \
+    flush as flush_request
 
 
 COLLECTION_NAME = 'nuclei_image_collection'
 TRAINING_COLLECTION_NAME = 'nuclei_image_training_collection'
 WHOLE_ITEM_NAME = '_whole'
 BUFFER_FACTOR = 3
-DATA_PATH = '/girder/data'
 ANNOT_ASSIGN_KEY = 'annotation_assigned_to'
 ANNOT_COMPLETE_KEY = 'annotation_completed_by'
+ANNOT_REJECT_KEY = 'annotation_rejected_by'
 REVIEW_ASSIGN_KEY = 'review_assigned_to'
 REVIEW_COMPLETE_KEY = 'review_completed_by'
 REVIEW_DONE_KEY = 'review_done'
 REVIEW_APPROVE_KEY = 'review_approved'
 ASSIGN_COUNT_FOR_REVIEW = 10
 TRAINING_KEY = 'training_info'
+# number of random available regions to choose the one farthest from active assignments from
+PICK_CANDIDATE_COUNT = 8
+# heavy whole item metadata sections which are fetched on first access rather than with the item
+WHOLE_ITEM_LAZY_META = ['regions', 'intensity_range_per_slice']
 INTERMEDIATE_SUFFIX = '_user_intermediate.tif'
+# whole item files are mirrored into uncompressed ZYX .npy sidecars that can be memory mapped.
+# Set USE_VOLUME_SIDECAR to False to always decode the TIFF files instead.
+USE_VOLUME_SIDECAR = True
+SIDECAR_PATH = os.path.join(DATA_PATH, '_volume_sidecars')
+# whole item mask files are also kept in chunk stores so that region reads and writes only touch
+# the chunks overlapping the region. The TIFF mask files are exported from the chunk stores.
+USE_CHUNK_STORE = True
+CHUNK_STORE_PATH = os.path.join(DATA_PATH, '_chunk_stores')
 
 
 def flatten(iterable):
@@ -59,6 +83,261 @@ def _get_tif_file_content_and_path(item_file):
     return tif, file_path
 
 
+def _get_local_file_path(item_file):
+    """
+    get the local file system path of an item file
+    :param item_file: a file in an item
+    :return: local path of the file
+    """
+    file = File().load(item_file['_id'], force=True)
+    return File().getLocalFilePath(file)
+
+
+def _get_volume_sidecar_path(item_file):
+    return os.path.join(SIDECAR_PATH, f'{item_file["_id"]}.npy')
+
+
+def _build_volume_sidecar(file_path, sidecar_path):
+    """
+    decode a multi-page TIFF page by page into an uncompressed C-ordered ZYX .npy sidecar. The
+    sidecar is written to a temporary path first and then renamed so that concurrent readers
+    never see a partially written sidecar
+    :param file_path: local path of the TIFF file to build the sidecar from
+    :param sidecar_path: path of the .npy sidecar to build
+    :return:
+    """
+    if not os.path.isdir(SIDECAR_PATH):
+        os.makedirs(SIDECAR_PATH, exist_ok=True)
+    tif = TIFF.open(file_path, mode="r")
+    page_count = _get_tif_page_count(tif)
+    first_page = _get_tif_sub_volume(tif, 0, 0)[0]
+    tmp_path = f'{sidecar_path}.{uuid.uuid4()}.tmp'
+    volume = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=first_page.dtype,
+                                       shape=(page_count,) + first_page.shape)
+    volume[0] = first_page
+    for z in range(1, page_count):
+        volume[z] = _get_tif_sub_volume(tif, z, z)[0]
+    tif.close()
+    volume.flush()
+    del volume
+    os.replace(tmp_path, sidecar_path)
+
+
+def get_whole_volume_array(item_file):
+    """
+    get the ZYX volume of a whole item file. If USE_VOLUME_SIDECAR is True, the volume is returned
+    as a read-only np.memmap of the file's .npy sidecar which is built on first access and rebuilt
+    when the source file has changed, so slicing it only touches the pages of the slice;
+    otherwise, the whole TIFF file is decoded.
+    :param item_file: a file in the whole item
+    :return: ZYX numpy array or read-only np.memmap
+    """
+    return _load_volume(_get_local_file_path(item_file), _get_volume_sidecar_path(item_file))
+
+
+def _load_volume(file_path, sidecar_path):
+    """
+    get the ZYX volume of a local TIFF file as get_whole_volume_array does without any database
+    access so that it can run in worker processes
+    :param file_path: local path of the TIFF file
+    :param sidecar_path: path of the .npy sidecar of the TIFF file
+    :return: ZYX numpy array or read-only np.memmap
+    """
+    if not USE_VOLUME_SIDECAR:
+        tif = TIFF.open(file_path, mode="r")
+        volume = np.array(_get_tif_sub_volume(tif))
+        tif.close()
+        return volume
+    if not os.path.isfile(sidecar_path) or \
+            os.path.getmtime(sidecar_path) < os.path.getmtime(file_path):
+        _build_volume_sidecar(file_path, sidecar_path)
+    return np.load(sidecar_path, mmap_mode='r')
+
+
+def get_whole_volume_region(item_file, min_z, max_z, min_y, max_y, min_x, max_x):
+    """
+    get a region of a whole item file volume with inclusive bounds. Mask regions are read from
+    the overlapping chunks of the mask chunk store if USE_CHUNK_STORE is True. Otherwise, the
+    region is sliced from the memory mapped sidecar if USE_VOLUME_SIDECAR is True or only the
+    pages and window of the region are decoded from the TIFF file.
+    :return: ZYX numpy array of the region
+    """
+    return _read_volume_region(_get_volume_source(item_file), min_z, max_z, min_y, max_y, min_x,
+                               max_x)
+
+
+def _get_volume_source(item_file):
+    """
+    resolve where regions of a whole item file volume are read from, creating the mask chunk
+    store if needed, so that regions can then be read without any database access
+    :param item_file: a file in the whole item
+    :return: dict with a store_path key for a mask chunk store, or file_path and sidecar_path keys
+    """
+    if USE_CHUNK_STORE and '_masks' in item_file['name']:
+        return {'store_path': _get_whole_mask_chunk_store(item_file)}
+    return {
+        'file_path': _get_local_file_path(item_file),
+        'sidecar_path': _get_volume_sidecar_path(item_file)
+    }
+
+
+def _read_volume_region(source, min_z, max_z, min_y, max_y, min_x, max_x):
+    """
+    read a region of a whole item file volume with inclusive bounds from its source as returned
+    by _get_volume_source or from a shared block file set by share_crop_sources
+    :return: ZYX numpy array of the region
+    """
+    if 'block_path' in source:
+        off_z, off_y, off_x = source['offset']
+        block = np.load(source['block_path'], mmap_mode='r')
+        return block[min_z - off_z:max_z - off_z + 1, min_y - off_y:max_y - off_y + 1,
+                     min_x - off_x:max_x - off_x + 1]
+    if 'store_path' in source:
+        return chunk_store.read_region(source['store_path'], min_z, max_z, min_y, max_y, min_x,
+                                       max_x)
+    if not USE_VOLUME_SIDECAR:
+        tif = TIFF.open(source['file_path'], mode="r")
+        images = _get_tif_sub_volume(tif, min_z, max_z, min_y, max_y, min_x, max_x)
+        tif.close()
+        return np.array(images)
+    volume = _load_volume(source['file_path'], source['sidecar_path'])
+    return volume[min_z:max_z + 1, min_y:max_y + 1, min_x:max_x + 1]
+
+
+def _get_chunk_store_path(item_file):
+    return os.path.join(CHUNK_STORE_PATH, str(item_file['itemId']),
+                        os.path.splitext(item_file['name'])[0])
+
+
+def _get_whole_mask_chunk_store(item_file):
+    """
+    get the chunk store of a whole item mask file, creating it on first access or recreating it
+    when it is not in sync with the file, which is keyed by the file id since every change of a
+    whole item mask saves a new file
+    :param item_file: a mask file in the whole item
+    :return: chunk store directory path
+    """
+    store_path = _get_chunk_store_path(item_file)
+    index = chunk_store.read_index(store_path)
+    if not index or index['source_version'] != str(item_file['_id']):
+        chunk_store.create_store(store_path, get_whole_volume_array(item_file),
+                                 str(item_file['_id']))
+    return store_path
+
+
+def _write_volume_with_block(volume, block, min_z, min_y, min_x, out_path):
+    """
+    write a ZYX volume to a TIFF file with a ZYX block pasted into it
+    :param volume: ZYX numpy array or read-only np.memmap of the volume
+    :param block: ZYX numpy array to paste into the volume
+    :param min_z: minimum z of the block in the volume
+    :param min_y: minimum y of the block in the volume
+    :param min_x: minimum x of the block in the volume
+    :param out_path: path of the TIFF file to write
+    :return:
+    """
+    out_tif = TIFF.open(out_path, mode='w')
+    for z, img in enumerate(volume):
+        if min_z <= z < min_z + block.shape[0]:
+            # only copy the slices to be updated out of the read-only volume
+            img = np.array(img)
+            img[min_y:min_y + block.shape[1], min_x:min_x + block.shape[2]] = block[z - min_z]
+        out_tif.write_image(np.ascontiguousarray(img))
+    out_tif.close()
+
+
+def _write_patched_tiff(src_path, pages, first_page, out_path):
+    """
+    write a copy of a multi-page TIFF file with consecutive pages starting at first_page replaced.
+    Only the replaced pages are encoded while all other pages are copied byte by byte.
+    :param src_path: source multi-page TIFF file path
+    :param pages: ZYX numpy array of the replacement pages
+    :param first_page: index of the first page to replace
+    :param out_path: output TIFF file path
+    :return:
+    """
+    pages_path = f'{out_path}.pages.tif'
+    pages_tif = TIFF.open(pages_path, mode='w')
+    for img in pages:
+        pages_tif.write_image(np.ascontiguousarray(img))
+    pages_tif.close()
+    try:
+        tiff_pages.replace_pages(src_path, pages_path, first_page, out_path)
+    finally:
+        os.remove(pages_path)
+
+
+def remove_volume_sidecar(event):
+    """
+    event handler to remove the volume sidecar of a file that is being removed
+    :param event: girder model.file.remove event with the file document as info
+    :return:
+    """
+    sidecar_path = _get_volume_sidecar_path(event.info)
+    if os.path.isfile(sidecar_path):
+        os.remove(sidecar_path)
+
+
+def _get_whole_mask_file(whole_item):
+    """
+    get the whole subvolume mask file of a whole item excluding the training user intermediate
+    mask file
+    :param whole_item: whole subvolume item
+    :return: whole mask file or None if it does not exist
+    """
+    for item_file in File().find({'itemId': whole_item['_id']}):
+        if '_masks' in item_file['name'] and not item_file['name'].endswith(INTERMEDIATE_SUFFIX):
+            return item_file
+    return None
+
+
+def build_whole_item_label_index(whole_item):
+    """
+    build the persisted per-label stats index of a whole item mask in a single pass over the mask
+    :param whole_item: whole subvolume item
+    :return: number of labels indexed
+    """
+    item_file = _get_whole_mask_file(whole_item)
+    if not item_file:
+        raise RestException('The whole subvolume item does not have a mask file', code=400)
+    stats = label_stats.get_label_stats(get_whole_volume_array(item_file))
+    LabelIndex().build(whole_item['_id'], stats)
+    return len(stats)
+
+
+def get_whole_item_label_stats(whole_item, labels=None):
+    """
+    get bounding box, voxel count and centroid of labels in the whole item mask from the persisted
+    label index, which is built on first access if it does not exist yet. Bounding boxes left
+    inexact by incremental updates are tightened from the mask within the inexact box.
+    :param whole_item: whole subvolume item
+    :param labels: list of labels to get stats for. All labels are returned if it is None
+    :return: dict keyed by integer label with stats dict values
+    """
+    if not LabelIndex().has_index(whole_item['_id']):
+        build_whole_item_label_index(whole_item)
+    stats = LabelIndex().get_label_stats(whole_item['_id'], labels)
+    inexact_labels = [label for label, val in stats.items() if not val.pop('exact', True)]
+    if inexact_labels:
+        item_file = _get_whole_mask_file(whole_item)
+        exact_stats = {}
+        for label in inexact_labels:
+            box = stats[label]
+            block = np.asarray(get_whole_volume_region(item_file, box['z_min'], box['z_max'],
+                                                       box['y_min'], box['y_max'],
+                                                       box['x_min'], box['x_max']))
+            label_block = np.where(block == label, block, 0)
+            exact_stats.update(label_stats.get_label_stats(
+                label_block, offset=(box['z_min'], box['y_min'], box['x_min'])))
+        LabelIndex().set_exact_stats(whole_item['_id'], exact_stats, inexact_labels)
+        for label in inexact_labels:
+            if label in exact_stats:
+                stats[label] = exact_stats[label]
+            else:
+                del stats[label]
+    return stats
+
+
 def _get_range(whole_item):
     """
     get x, y, z range of the whole subvolume item
@@ -145,6 +424,51 @@ def _get_tif_image_array(tif_input):
     return images
 
 
+def _get_tif_page_count(tif_input):
+    """
+    count the pages of a multi-page TIFF by walking its page directories without decoding any page
+    :param tif_input: TIFF object opened for reading
+    :return: number of pages
+    """
+    tif_input.SetDirectory(0)
+    page_count = 1
+    while not tif_input.LastDirectory():
+        tif_input.ReadDirectory()
+        page_count += 1
+    return page_count
+
+
+def _get_tif_sub_volume(tif_input, min_z=0, max_z=None, min_y=0, max_y=None, min_x=0,
+                        max_x=None):
+    """
+    read a sub volume from a multi-page TIFF by seeking straight to the page directories in
+    [min_z, max_z] so that pages outside the z range are never decoded. Only the
+    [min_y:max_y, min_x:max_x] window of each decoded page is kept. All max bounds are inclusive
+    and a None max bound means up to the end along that axis.
+    :param tif_input: TIFF object opened for reading
+    :param min_z: first page to read
+    :param max_z: last page to read
+    :param min_y: minimum y of the window to keep
+    :param max_y: maximum y of the window to keep
+    :param min_x: minimum x of the window to keep
+    :param max_x: maximum x of the window to keep
+    :return: list of 2D numpy arrays in z order
+    """
+    page_count = _get_tif_page_count(tif_input)
+    last_z = page_count - 1 if max_z is None else min(max_z, page_count - 1)
+    y_end = None if max_y is None else max_y + 1
+    x_end = None if max_x is None else max_x + 1
+    images = []
+    for z in range(min_z, last_z + 1):
+        tif_input.SetDirectory(z)
+        image = tif_input.read_image()
+        if tif_input.isbyteswapped():
+            image = image.byteswap()
+        # copy the window so that the decoded full page can be released
+        images.append(np.copy(image[min_y:y_end, min_x:x_end]))
+    return images
+
+
 def create_region_files(region_item, whole_item):
     """
     extract region files from the whole subvolume item based on bounding box extent and
@@ -153,42 +477,118 @@ def create_region_files(region_item, whole_item):
     :param whole_item: whole subvolume item to extract region files
     :return:
     """
-    files = File().find({'itemId': region_item['_id']})
-    # if the region already has files, existing files need to be removed except for
-    # the user edited file before adding new ones.
-    for file in files:
-        if not file['name'].endswith('_user.tif'):
-            File().remove(file)
+    crops = prepare_region_files(region_item, whole_item)
+    for crop in crops:
+        write_region_crop(crop)
+    import_region_files(region_item, crops)
+    return
 
-    item_files = File().find({'itemId': whole_item['_id']})
-    min_x = region_item['meta']['coordinates']['x_min']
-    max_x = region_item['meta']['coordinates']['x_max']
-    min_y = region_item['meta']['coordinates']['y_min']
-    max_y = region_item['meta']['coordinates']['y_max']
-    min_z = region_item['meta']['coordinates']['z_min']
-    max_z = region_item['meta']['coordinates']['z_max']
-    admin_user = User().getAdmins()[0]
-    for item_file in item_files:
+
+def prepare_region_files(region_item, whole_item):
+    """
+    resolve the region file crops to extract from the whole subvolume item files for a region
+    item so that they can be written without any database access. Cached crops are copied to
+    their output paths here, so crop cache lookups and puts are all done by the calling process
+    and the cache statistics and size accounting cover crops written by worker processes.
+    :param region_item: region item with files to be updated
+    :param whole_item: whole subvolume item to extract region files
+    :return: list of crop dicts with the source of the whole item file volume, the inclusive
+    crop extent, the output file name and path, the crop cache key, whether the crop is cached,
+    and the assetstore id
+    """
+    coords = region_item['meta']['coordinates']
+    extent = (coords['z_min'], coords['z_max'], coords['y_min'], coords['y_max'],
+              coords['x_min'], coords['x_max'])
+    out_dir_path = os.path.join(DATA_PATH, str(region_item['_id']))
+    if not os.path.isdir(out_dir_path):
+        os.makedirs(out_dir_path)
+    crops = []
+    for item_file in File().find({'itemId': whole_item['_id']}):
         file_res_path = path_util.getResourcePath('file', item_file, force=True)
-        tif, _ = _get_tif_file_content_and_path(item_file)
-        file_name = os.path.basename(file_res_path)
-        file_base_name, file_ext = os.path.splitext(file_name)
-        out_dir_path = os.path.join(DATA_PATH, str(region_item['_id']))
+        file_base_name, file_ext = os.path.splitext(os.path.basename(file_res_path))
         output_file_name = f'{file_base_name}_regions{file_ext}'
         out_path = os.path.join(out_dir_path, output_file_name)
-        if not os.path.isdir(out_dir_path):
-            os.makedirs(out_dir_path)
-        output_tif = TIFF.open(out_path, mode="w")
-        images = _get_tif_image_array(tif)
-        for counter, image in enumerate(images):
-            if min_z <= counter <= max_z:
-                img = np.copy(image[min_y:max_y + 1, min_x:max_x + 1])
-                output_tif.write_image(img)
-            if counter > max_z:
-                break
-        assetstore_id = item_file['assetstoreId']
-        save_file(assetstore_id, region_item, out_path, admin_user, output_file_name)
-    return
+        cache_key = crop_cache.get_cache_key(item_file, extent)
+        crops.append({
+            'source': _get_volume_source(item_file),
+            'extent': extent,
+            'name': output_file_name,
+            'out_path': out_path,
+            'cache_key': cache_key,
+            'cached': crop_cache.get(cache_key, out_path),
+            'assetstore_id': item_file['assetstoreId']
+        })
+    return crops
+
+
+def share_crop_sources(crops, out_dir):
+    """
+    read each whole item file volume source once for all crops to be cut from it so that crops
+    are sliced from one shared array rather than each crop reading the source again. The union
+    extent of the crops of a mask chunk store or a TIFF file without a sidecar is read once and
+    saved as a .npy block file which crops are memory mapped from. Memory mapped sidecars are
+    shared already, so they are only built once up front. Crops that are cached are left out.
+    :param crops: list of crop dicts as returned by prepare_region_files whose sources are
+    replaced with the shared block files
+    :param out_dir: directory to save the shared block files to
+    :return: list of saved block file paths to be removed after all crops are written
+    """
+    groups = {}
+    for crop in crops:
+        if not crop['cached']:
+            groups.setdefault(tuple(sorted(crop['source'].items())), []).append(crop)
+    block_paths = []
+    for group in groups.values():
+        source = group[0]['source']
+        if 'store_path' not in source and USE_VOLUME_SIDECAR:
+            _load_volume(source['file_path'], source['sidecar_path'])
+            continue
+        if len(group) < 2:
+            continue
+        lo = [min(crop['extent'][2 * i] for crop in group) for i in range(3)]
+        hi = [max(crop['extent'][2 * i + 1] for crop in group) for i in range(3)]
+        block = _read_volume_region(source, lo[0], hi[0], lo[1], hi[1], lo[2], hi[2])
+        os.makedirs(out_dir, exist_ok=True)
+        block_path = os.path.join(out_dir, f'{uuid.uuid4()}.npy')
+        np.save(block_path, np.ascontiguousarray(block))
+        block_paths.append(block_path)
+        for crop in group:
+            crop['source'] = {'block_path': block_path, 'offset': tuple(lo)}
+    return block_paths
+
+
+def write_region_crop(crop):
+    """
+    write a region file crop as returned by prepare_region_files to its output path unless it
+    has been copied from the crop cache. It accesses neither the database nor the crop cache.
+    :param crop: crop dict
+    :return:
+    """
+    if not crop['cached']:
+        output_tif = TIFF.open(crop['out_path'], mode="w")
+        images = _read_volume_region(crop['source'], *crop['extent'])
+        for img in images:
+            output_tif.write_image(np.ascontiguousarray(img))
+        output_tif.close()
+
+
+def import_region_files(region_item, crops):
+    """
+    replace the region files of a region item with written region file crops. Existing files
+    except for the user edited file are removed before the crops are added. Crops that were not
+    cached are added to the crop cache.
+    :param region_item: region item with files to be updated
+    :param crops: list of written crop dicts as returned by prepare_region_files
+    :return:
+    """
+    for file in File().find({'itemId': region_item['_id']}):
+        if not file['name'].endswith('_user.tif'):
+            File().remove(file)
+    admin_user = User().getAdmins()[0]
+    for crop in crops:
+        if not crop['cached']:
+            crop_cache.put(crop['cache_key'], crop['out_path'])
+        save_file(crop['assetstore_id'], region_item, crop['out_path'], admin_user, crop['name'])
 
 
 def _create_region(region_key, whole_item, extent_dict):
@@ -252,42 +652,31 @@ def _create_region(region_key, whole_item, extent_dict):
                         break
 
     Item().setMetadata(region_item, add_meta)
+    AssignmentExtent().set_extent(whole_item['_id'], region_item['_id'], add_meta['coordinates'])
 
     create_region_files(region_item, whole_item)
 
     return region_item
 
 
-def reset_mask_label(mask_data, label_no, y_min, y_max, x_min, x_max):
+def paste_mask_labels(mask_data, label_ids, sub_mask_data=None):
     """
-    reset mask data slice with certain label to zero
-    :param mask_data: mask data slice 2D numpy array
-    :param label_no: integer label
-    :param y_min: extent (y_min, y_max, x_min, x_max)
-    :param y_max: extent (y_min, y_max, x_min, x_max)
-    :param x_min: extent (y_min, y_max, x_min, x_max)
-    :param x_max: extent (y_min, y_max, x_min, x_max)
-    :return: updated mask data slice
+    clear all labels in label_ids from a ZYX mask block and paste the same labels from a sub mask
+    block starting at the same origin in one pass. Labels are only pasted in the extent the two
+    blocks have in common.
+    :param mask_data: ZYX mask numpy array block to be updated in place
+    :param label_ids: list of integer labels to clear and paste
+    :param sub_mask_data: ZYX mask numpy array block to paste labels from. If it is None, labels
+    are only cleared from mask_data
+    :return: updated mask data block
     """
-    rows, cols = np.indices(mask_data.shape)
-    mask_data[(mask_data == label_no) & (rows >= y_min) & (rows <= y_max)
-              & (cols >= x_min) & (cols <= x_max)] = 0
-    return mask_data
-
-
-def set_mask_label(mask_data, label_no, sub_mask_data, y_min, x_min):
-    """
-    set mask data slice 2D numpy array based on labels in its sub mask slice for a specific label
-    :param mask_data: original mask data slice 2D numpy array
-    :param label_no: integer label to check and set data with
-    :param sub_mask_data: sub mask slice to check label against in order to set original mask data
-    :param y_min: minimum extent y of sub_mask_data in mask_data
-    :param x_min: minimum extent x of sub_mask_data in mask_data
-    :return: updated mask slice data
-    """
-    sub_indices = np.argwhere(sub_mask_data == label_no)
-    if sub_indices.shape[0] > 0:
-        mask_data[y_min + sub_indices[:, 0], x_min + sub_indices[:, 1]] = label_no
+    label_ids = np.asarray(label_ids, dtype=mask_data.dtype)
+    mask_data[np.isin(mask_data, label_ids)] = 0
+    if sub_mask_data is not None:
+        common = tuple(slice(0, min(m, s)) for m, s in zip(mask_data.shape, sub_mask_data.shape))
+        sub_mask_data = sub_mask_data[common]
+        label_mask = np.isin(sub_mask_data, label_ids)
+        mask_data[common][label_mask] = sub_mask_data[label_mask]
     return mask_data
 
 
@@ -309,7 +698,7 @@ def update_assignment_in_whole_item(whole_item, assign_item_id, mask_file_name=N
     mask file with suffix _user_intermediate.tif for training user dice score computation
     :return: True if update action succeeds; otherwise, return False
     """
-    assign_item = Item().findOne({'_id': ObjectId(assign_item_id)})
+    assign_item = get_item_loader().load(assign_item_id)
     if not assign_item['meta']['region_ids']:
         # the assignment does not have any regions, so nothing to update
         return
@@ -321,7 +710,8 @@ def update_assignment_in_whole_item(whole_item, assign_item_id, mask_file_name=N
         if mask_file_name and assign_item_file['name'] != mask_file_name:
             continue
         assign_item_tif, _ = _get_tif_file_content_and_path(assign_item_file)
-        assign_item_images = _get_tif_image_array(assign_item_tif)
+        assign_item_volume = np.array(_get_tif_image_array(assign_item_tif))
+        assign_item_tif.close()
         assign_item_region_ids = assign_item['meta']['region_ids']
 
         item_files = File().find({'itemId': whole_item['_id']})
@@ -332,46 +722,109 @@ def update_assignment_in_whole_item(whole_item, assign_item_id, mask_file_name=N
                 continue
             file_res_path = path_util.getResourcePath('file', item_file, force=True)
             file_name = os.path.basename(file_res_path)
-            whole_tif, whole_path = _get_tif_file_content_and_path(item_file)
+            whole_path = _get_local_file_path(item_file)
             out_dir_path = os.path.dirname(whole_path)
             output_path = os.path.join(out_dir_path, f'{uuid.uuid4()}_{file_name}')
-            whole_out_tif = TIFF.open(output_path, mode='w')
-            whole_images = _get_tif_image_array(whole_tif)
+            min_z = assign_item_coords['z_min']
+            max_z = assign_item_coords['z_max']
+            min_y = assign_item_coords['y_min']
+            max_y = assign_item_coords['y_max']
+            min_x = assign_item_coords['x_min']
+            max_x = assign_item_coords['x_max']
+            # only the assignment bounding box of the whole mask can change
+            block = np.array(get_whole_volume_region(item_file, min_z, max_z, min_y, max_y,
+                                                     min_x, max_x))
+            update_label_index = not intermediate and LabelIndex().has_index(whole_item['_id'])
+            if update_label_index:
+                old_block_stats = label_stats.get_label_stats(block, offset=(min_z, min_y, min_x))
             # region_imarray should be in order of ZYX
             # if assign_item_region_ids is empty, i.e., assign item does not have region_ids,
             # it means the initial region id is deleted, so need to find the original region id
             # from assign_item name and reset/delete the label from the whole volume
-            label_ids = get_label_ids(assign_item)
-            for rid in label_ids:
-                for counter, img in enumerate(whole_images):
-                    if assign_item_coords['z_min'] <= counter <= assign_item_coords['z_max']:
-                        img = reset_mask_label(img, rid, assign_item_coords['y_min'],
-                                               assign_item_coords['y_max'],
-                                               assign_item_coords['x_min'],
-                                               assign_item_coords['x_max']
-                                               )
-                        if assign_item_region_ids:
-                            img = set_mask_label(
-                                img, rid,
-                                assign_item_images[counter-assign_item_coords['z_min']],
-                                assign_item_coords['y_min'], assign_item_coords['x_min'])
-                    whole_out_tif.write_image(np.copy(img))
+            block = paste_mask_labels(block, get_label_ids(assign_item),
+                                      assign_item_volume if assign_item_region_ids else None)
 
             assetstore_id = item_file['assetstoreId']
             if intermediate and not item_file['name'].endswith(INTERMEDIATE_SUFFIX):
                 # intermediate user file does not exist yet, set the file name to be stored with
                 # intermediate file suffix pattern
                 file_name = f'{os.path.splitext(file_name)[0]}{INTERMEDIATE_SUFFIX}'
+                store_path = ''
             else:
+                store_path = _get_whole_mask_chunk_store(item_file) if USE_CHUNK_STORE else ''
+            max_z = min_z + block.shape[0] - 1
+            if store_path:
+                # the chunk store is in sync with item_file, so only the chunks overlapping the
+                # updated pages are read
+                pages = chunk_store.read_pages(store_path, min_z, max_z)
+            else:
+                pages = np.array(get_whole_volume_array(item_file)[min_z:max_z + 1])
+            pages[:, min_y:min_y + block.shape[1], min_x:min_x + block.shape[2]] = block
+            try:
+                # only re-encode the updated pages of the TIFF file for download
+                _write_patched_tiff(whole_path, pages, min_z, output_path)
+            except ValueError:
+                # the TIFF file layout cannot be patched, so write all pages
+                _write_volume_with_block(get_whole_volume_array(item_file), block, min_z, min_y,
+                                         min_x, output_path)
+            if file_name == item_file['name']:
                 # remove the original file and create new file using updated TIFF mask
                 File().remove(item_file)
-            save_file(assetstore_id, whole_item, output_path, User().getAdmins()[0], file_name)
+            new_file = save_file(assetstore_id, whole_item, output_path, User().getAdmins()[0],
+                                 file_name)
+            if store_path:
+                # the TIFF file is the source of truth, so the chunk store is updated only once
+                # the new file is saved and only if it is still in sync with the replaced file.
+                # Otherwise, it is rebuilt from the new file on next access.
+                chunk_store.update_region(store_path, block, min_z, min_y, min_x,
+                                          str(item_file['_id']), str(new_file['_id']))
+            if update_label_index:
+                # only labels in the updated block can change
+                LabelIndex().update_block(
+                    whole_item['_id'], old_block_stats,
+                    label_stats.get_label_stats(block, offset=(min_z, min_y, min_x)),
+                    {'z_min': min_z, 'z_max': max_z, 'y_min': min_y,
+                     'y_max': min_y + block.shape[1] - 1, 'x_min': min_x,
+                     'x_max': min_x + block.shape[2] - 1})
         return
 
     raise RestException('Failed to update assignment annotation mask in the whole subvolume mask',
                         code=500)
 
 
+def load_whole_item(whole_item_id):
+    """
+    load a whole subvolume item with heavy metadata sections fetched on first access
+    :param whole_item_id: whole subvolume item id
+    :return: whole item or None if it does not exist
+    """
+    return get_item_loader().load(whole_item_id, lazy_meta=WHOLE_ITEM_LAZY_META)
+
+
+def find_whole_item(folder_id):
+    """
+    find the whole subvolume item in a folder with heavy metadata sections fetched on first access
+    :param folder_id: folder id of the subvolume
+    :return: whole item or None if it does not exist
+    """
+    return get_item_loader().find_in_folder(folder_id, WHOLE_ITEM_NAME,
+                                            lazy_meta=WHOLE_ITEM_LAZY_META)
+
+
+def get_whole_item_region(whole_item, region_label):
+    """
+    get metadata of a region in a whole item, which only fetches the region if regions of the
+    whole item are not loaded yet
+    :param whole_item: whole subvolume item
+    :param region_label: region label
+    :return: region metadata dict or None if the region does not exist
+    """
+    meta = whole_item['meta']
+    if isinstance(meta, LazyMeta):
+        return meta.get_path('regions', region_label)
+    return meta['regions'].get(str(region_label))
+
+
 def find_region_item_from_label(whole_item, region_label):
     """
     return the region from the region label in a whole item
@@ -379,18 +832,48 @@ def find_region_item_from_label(whole_item, region_label):
     :param region_label: the region label in the whole item to find the region for
     :return: the region object
     """
-    if region_label in whole_item['meta']['regions'] and \
-            'item_id' in whole_item['meta']['regions'][region_label]:
-        return Item().findOne({
-            '_id': ObjectId(whole_item['meta']['regions'][region_label]['item_id'])
-        })
+    region = get_whole_item_region(whole_item, region_label)
+    if region and 'item_id' in region:
+        return get_item_loader().load(region['item_id'])
     return None
 
 
-def get_region_extent(item, region_id, user_extent=True):
-    is_whole_item = False
+def find_overlapping_assignment_ids(whole_item, extent, item_loader=None):
+    """
+    find assignments of a whole item whose extents overlap an extent with the assignment extent
+    index, recording extents of existing assignments in the index on first use
+    :param whole_item: whole subvolume item
+    :param extent: coordinates dict with x_min, x_max, y_min, y_max, z_min, and z_max keys
+    :param item_loader: item loader to load existing assignment coordinates with. The item loader
+    of the current request scope is used if it is None
+    :return: list of overlapping assignment item id strings
+    """
+    if not AssignmentExtent().is_built(whole_item['_id']):
+        if item_loader is None:
+            item_loader = get_item_loader()
+        assign_items = item_loader.load_many(
+            {val['item_id'] for val in whole_item['meta']['regions'].values() if 'item_id' in val},
+            fields=['meta.coordinates'])
+        AssignmentExtent().build(whole_item['_id'], {
+            aid: item['meta']['coordinates'] for aid, item in assign_items.items()
+            if 'coordinates' in item.get('meta', {})})
+    return AssignmentExtent().find_overlapping(whole_item['_id'], extent)
+
+
+def get_region_extents(item, region_ids, user_extent=True):
+    """
+    get extents of multiple regions of an item with a single pass over the item mask
+    :param item: whole subvolume item or assignment item
+    :param region_ids: list of region ids/labels
+    :param user_extent: whether to get extents from the user mask or the original mask
+    :return: dict keyed by region id string with extent dict values. Regions not found in the
+    mask are not included
+    """
     if item['name'] == WHOLE_ITEM_NAME:
-        is_whole_item = True
+        # whole item extents are looked up in the persisted label index
+        stats = get_whole_item_label_stats(item, region_ids)
+        return {str(label): label_stats.get_label_extent(label_stat)
+                for label, label_stat in stats.items()}
     item_files = File().find({'itemId': item['_id']})
     if user_extent:
         substr_to_check = '_masks_regions_user'
@@ -400,29 +883,34 @@ def get_region_extent(item, region_id, user_extent=True):
         if substr_to_check not in item_file['name']:
             continue
         tif, _ = _get_tif_file_content_and_path(item_file)
-        images = _get_tif_image_array(tif)
-        imarray = np.array(images)
-        level_indices = np.where(imarray == int(region_id))
-        z_min = min(level_indices[0])
-        z_max = max(level_indices[0])
-        y_min = min(level_indices[1])
-        y_max = max(level_indices[1])
-        x_min = min(level_indices[2])
-        x_max = max(level_indices[2])
-        # need to convert extent values to int from int64, otherwise, JSON serialization
-        # will raise exception when adding metadata to item
-        return {
-            "x_max": int(x_max) if is_whole_item else int(x_max)+item['meta']['coordinates']["x_min"],
-            "x_min": int(x_min) if is_whole_item else int(x_min)+item['meta']['coordinates']["x_min"],
-            "y_max": int(y_max) if is_whole_item else int(y_max)+item['meta']['coordinates']["y_min"],
-            "y_min": int(y_min) if is_whole_item else int(y_min)+item['meta']['coordinates']["y_min"],
-            "z_max": int(z_max) if is_whole_item else int(z_max)+item['meta']['coordinates']["z_min"],
-            "z_min": int(z_min) if is_whole_item else int(z_min)+item['meta']['coordinates']["z_min"]
-        }
+        imarray = np.array(_get_tif_image_array(tif))
+        tif.close()
+        coords = item['meta']['coordinates']
+        stats = label_stats.get_label_stats(imarray, offset=(coords['z_min'], coords['y_min'],
+                                                             coords['x_min']))
+        ret_extents = {}
+        for region_id in region_ids:
+            if int(region_id) in stats:
+                ret_extents[str(region_id)] = label_stats.get_label_extent(stats[int(region_id)])
+        return ret_extents
 
     return {}
 
 
+def get_region_extent(item, region_id, user_extent=True):
+    """
+    get the extent of a region of an item
+    :param item: whole subvolume item or assignment item
+    :param region_id: region id/label
+    :param user_extent: whether to get the extent from the user mask or the original mask
+    :return: extent dict with x_max, x_min, y_max, y_min, z_max, z_min keys
+    """
+    extents = get_region_extents(item, [region_id], user_extent=user_extent)
+    if str(region_id) not in extents:
+        raise ValueError(f'region {region_id} is not found in the mask of item {item["_id"]}')
+    return extents[str(region_id)]
+
+
 def remove_regions(region_list, whole_item, assigned_item_id):
     """
     remove all regions in region_list
@@ -431,12 +919,8 @@ def remove_regions(region_list, whole_item, assigned_item_id):
     :param assigned_item_id: originally assigned item id
     :return:
     """
-    if 'removed_region_ids' in whole_item['meta'] and whole_item['meta']['removed_region_ids']:
-        whole_item['meta']['removed_region_ids'].extend(region_list)
-    else:
-        whole_item['meta']['removed_region_ids'] = region_list
-
-    whole_item['meta']['removed_region_ids'] = list(set(whole_item['meta']['removed_region_ids']))
+    free_region_ids(whole_item, region_list)
+    mutation = get_meta_mutation(whole_item)
     item_list = [find_region_item_from_label(whole_item, str(rid)) for rid in region_list]
 
     # delete all the other regions in region_list to be merged
@@ -444,10 +928,15 @@ def remove_regions(region_list, whole_item, assigned_item_id):
         if item_list[i]:
             if str(item_list[i]['_id']) != str(assigned_item_id):
                 Item().remove(item_list[i])
-                del whole_item['meta']['regions'][str(rid)]
+                AssignmentStatus().remove_assignments(whole_item['_id'], [item_list[i]['_id']])
+                UserAssignment().remove_assignments(whole_item['_id'], [item_list[i]['_id']])
+                AssignmentExtent().remove_assignments(whole_item['_id'], [item_list[i]['_id']])
+                mutation.unset(f'regions.{rid}')
         elif str(rid) in whole_item['meta']['regions']:
-            del whole_item['meta']['regions'][str(rid)]
+            mutation.unset(f'regions.{rid}')
 
+    save_meta_mutation(mutation)
+    sync_region_pool(whole_item, region_list)
     return
 
 
@@ -464,12 +953,11 @@ def reject_assignment(user, item, whole_item, has_files, comment, task='annotati
     """
     # reject the task
     uid = str(user['_id'])
-    assign_count = len(whole_item['meta'][uid])
-    if assign_count <= 1:
-        Item().deleteMetadata(whole_item, [uid])
-    else:
-        whole_item['meta'][uid].remove(str(item['_id']))
-        Item().save(whole_item)
+    mutation = get_meta_mutation(whole_item)
+    mutation.pull(uid, str(item['_id']))
+    # another request may have added an assignment of the user since it was read
+    mutation.unset_if(uid, [])
+    save_meta_mutation(mutation)
     assign_item_id = item['_id']
     uname = user["login"]
     if task == 'annotation' and has_files:
@@ -490,40 +978,70 @@ def reject_assignment(user, item, whole_item, has_files, comment, task='annotati
     return
 
 
-def get_assignment_status(whole_item, assign_item_id):
+def get_assignment_status_docs(whole_item, assign_item_ids):
+    """
+    get materialized status documents of assignments in a subvolume with a single query. Status
+    documents that do not exist yet are built from the whole item history.
+    :param whole_item: whole subvolume item
+    :param assign_item_ids: list of assignment item ids
+    :return: dict keyed by assignment item id string with status document values
+    """
+    assign_item_ids = [str(aid) for aid in assign_item_ids]
+    docs = AssignmentStatus().get_status_docs(whole_item['_id'], assign_item_ids)
+    missing_ids = [aid for aid in assign_item_ids if aid not in docs]
+    if missing_ids:
+        approved_ids = [str(item['_id']) for item in Item().find({
+            '_id': {'$in': [ObjectId(aid) for aid in missing_ids]},
+            f'meta.{REVIEW_APPROVE_KEY}': 'true'
+        }, fields=['_id'])]
+        migrate_history(whole_item)
+        history = History().get_history(whole_item['_id'], missing_ids)
+        for aid in missing_ids:
+            docs[aid] = AssignmentStatus().build(whole_item['_id'], aid,
+                                                 history[aid] if aid in history else [],
+                                                 aid in approved_ids)
+    return docs
+
+
+def get_subvolumes_assignment_status_docs(whole_items):
+    """
+    get materialized status documents of all assignments in multiple subvolumes with shared
+    queries, building missing ones from the history of their subvolume
+    :param whole_items: list of whole subvolume items
+    :return: dict keyed by whole item id string with values of dicts keyed by assignment item id
+    string with status document values
+    """
+    docs = AssignmentStatus().get_subvolumes_status_docs([item['_id'] for item in whole_items])
+    for whole_item in whole_items:
+        item_docs = docs[str(whole_item['_id'])]
+        missing_ids = list({val['item_id'] for val in whole_item['meta']['regions'].values()
+                            if 'item_id' in val and val['item_id'] not in item_docs})
+        if missing_ids:
+            item_docs.update(get_assignment_status_docs(whole_item, missing_ids))
+    return docs
+
+
+def _get_assignment_status_doc(whole_item, assign_item_id):
     assign_item_id = str(assign_item_id)
-    assign_item = Item().findOne({'_id': ObjectId(assign_item_id)})
-    if REVIEW_APPROVE_KEY in assign_item['meta'] and assign_item['meta'][REVIEW_APPROVE_KEY] == 'true':
-        return 'completed'
-    assign_info = get_history_info(whole_item, assign_item_id, ANNOT_ASSIGN_KEY)
-    complete_info = get_history_info(whole_item, assign_item_id, ANNOT_COMPLETE_KEY)
-    if not assign_info:
-        return 'inactive'
-    if not complete_info:
-        return 'active'
-
-    review_assign_info = get_history_info(whole_item, assign_item_id, REVIEW_ASSIGN_KEY)
-    review_complete_info = get_history_info(whole_item, assign_item_id, REVIEW_COMPLETE_KEY)
-    if not review_assign_info:
-        return 'awaiting review'
-
-    if not review_complete_info:
-        return 'under review'
-    if len(complete_info[0]['time']) > 16:
-        complete_time = datetime.strptime(complete_info[0]['time'], "%m/%d/%Y %H:%M:%S")
-    else:
-        complete_time = datetime.strptime(complete_info[0]['time'], "%m/%d/%Y %H:%M")
-    if len(review_complete_info[0]['time']) > 16:
-        review_compl_time = datetime.strptime(review_complete_info[0]['time'], "%m/%d/%Y %H:%M:%S")
-    else:
-        review_compl_time = datetime.strptime(review_complete_info[0]['time'], "%m/%d/%Y %H:%M")
+    return get_assignment_status_docs(whole_item, [assign_item_id])[assign_item_id]
 
-    if complete_time < review_compl_time:
-        # assignment is reassigned to user after reviewer disapproved the annotation
-        return "active"
-    else:
-        # assignment is annotated again, not assigned for reivew yet
-        return 'awaiting review'
+
+def update_assignment_approval_status(whole_item, assign_item):
+    """
+    update materialized assignment status after the review approval of an assignment changes
+    :param whole_item: whole subvolume item
+    :param assign_item: assignment item with updated review approval metadata
+    :return:
+    """
+    approved = REVIEW_APPROVE_KEY in assign_item['meta'] and \
+        assign_item['meta'][REVIEW_APPROVE_KEY] == 'true'
+    doc = _get_assignment_status_doc(whole_item, assign_item['_id'])
+    if doc['approved'] != approved:
+        AssignmentStatus().set_approved(doc, approved)
+
+
+def get_assignment_status(whole_item, assign_item_id):
+    return _get_assignment_status_doc(whole_item, assign_item_id)['status']
 
 
 def save_file(as_id, item, path, user, file_name):
@@ -542,23 +1060,6 @@ def save_file(as_id, item, path, user, file_name):
     return file
 
 
-def get_max_region_id(whole_item):
-    if 'max_region_id' in whole_item['meta']:
-        return int(whole_item['meta']['max_region_id'])
-    else:
-        return set_max_region_id(whole_item)
-
-
-def set_max_region_id(whole_item, max_level=None):
-    if not max_level:
-        max_level = len(whole_item['meta']['regions'])
-    add_meta = {
-        'max_region_id': max_level
-    }
-    Item().setMetadata(whole_item, add_meta)
-    return max_level
-
-
 def assign_region_to_user(whole_item, user, region_key):
     """
     assign the region_key to the user, who could already own a region and wants to claim
@@ -569,10 +1070,12 @@ def assign_region_to_user(whole_item, user, region_key):
     :return: assigned region item
     """
     region_key = str(region_key)
-    val = whole_item['meta']['regions'][region_key]
+    val = get_whole_item_region(whole_item, region_key)
+    if val is None:
+        raise RestException(f'The region {region_key} does not exist in the subvolume', code=400)
     region_item = None
     if 'item_id' in val:
-        region_item = Item().findOne({'_id': ObjectId(val['item_id'])})
+        region_item = get_item_loader().load(val['item_id'])
     if not region_item:
         region_item = _create_region(str(region_key), whole_item,
                                      {
@@ -583,74 +1086,269 @@ def assign_region_to_user(whole_item, user, region_key):
                                         'z_min': val['z_min'],
                                         'z_max': val['z_max']
                                      })
-    val['item_id'] = str(region_item['_id'])
+    mutation = get_meta_mutation(whole_item)
+    mutation.set(f'regions.{region_key}.item_id', str(region_item['_id']))
+    save_meta_mutation(mutation)
     set_assignment_meta(whole_item, user, region_item['_id'],
                         ANNOT_ASSIGN_KEY)
 
     return region_item
 
 
-def get_history_info(whole_item, assign_item_id, in_type):
+def get_history_info(whole_item, assign_item_id, in_type, status_doc=None):
     return_info = []
     # in_type has to be not empty and contain _ to indicate the task type: annotation or review
     if not in_type or '_' not in in_type:
         return return_info
     assign_item_id = str(assign_item_id)
-    if 'history' in whole_item['meta'] and assign_item_id in whole_item['meta']['history']:
-        task = in_type.split('_')[0]
-        # need to loop through history list in reverse order to check newer actions first
-        for info in reversed(whole_item['meta']['history'][assign_item_id]):
-            rejected_by_key = f'{task}_rejected_by'
-            if info['type'] == rejected_by_key:
-                if in_type == rejected_by_key:
-                    return_info.append(info)
-                # the assignment is rejected which will invalid previous actions
-                return return_info
-            if info['type'] == in_type:
-                return_info.append(info)
-
+    if not ObjectId.is_valid(assign_item_id):
+        return return_info
+    # the status document holds the history info of each type newest first that is not
+    # invalidated by a later rejection
+    if status_doc is None:
+        status_doc = _get_assignment_status_doc(whole_item, assign_item_id)
+    history_info = status_doc['history_info']
+    if in_type in history_info:
+        return_info = list(history_info[in_type])
     return return_info
 
 
 def get_completed_assignment_items(username, whole_item, in_type=ANNOT_COMPLETE_KEY):
-    return_info = []
-    if 'history' in whole_item['meta']:
-        for assign_item_id in whole_item['meta']['history']:
-            # need to loop through history list in reverse order to check newer actions first
-            for info in whole_item['meta']['history'][assign_item_id]:
-                if info['type'] == in_type and info['user'] == username:
-                    return_info.append(assign_item_id)
-                    continue
+    migrate_history(whole_item)
+    return [str(doc['assignmentId']) for doc in History().find_events(
+        whole_item['_id'], types=[in_type], user=username)]
 
-    return return_info
+
+def migrate_history(whole_item):
+    """
+    move history and comment history stored in whole item metadata by earlier versions into the
+    history collection
+    :param whole_item: whole subvolume item
+    :return:
+    """
+    if 'history' not in whole_item['meta'] and 'comment_history' not in whole_item['meta']:
+        return
+    History().migrate(whole_item['_id'],
+                      whole_item['meta']['history'] if 'history' in whole_item['meta'] else {},
+                      whole_item['meta']['comment_history']
+                      if 'comment_history' in whole_item['meta'] else {})
+    UserAssignment().add_events(History().find_events(whole_item['_id'],
+                                                      exclude_types=[COMMENT_TYPE]))
+    Item().collection.update_one({'_id': whole_item['_id']},
+                                 {'$unset': {'meta.history': '', 'meta.comment_history': ''}})
+    whole_item['meta'].pop('history', None)
+    whole_item['meta'].pop('comment_history', None)
+
+
+def get_subvolume_history(whole_item):
+    """
+    get assignment history of all assignments in a subvolume
+    :param whole_item: whole subvolume item
+    :return: dict of assignment item id to history info list in chronological order
+    """
+    migrate_history(whole_item)
+    return History().get_history(whole_item['_id'])
+
+
+def get_subvolumes_history(whole_items):
+    """
+    get assignment history of all assignments in multiple subvolumes with one query
+    :param whole_items: list of whole subvolume items
+    :return: dict keyed by whole item id string with values of dicts of assignment item id to
+    history info list in chronological order
+    """
+    for whole_item in whole_items:
+        migrate_history(whole_item)
+    return History().get_subvolumes_history([item['_id'] for item in whole_items])
+
+
+def get_user_assignments(username, subvolume_ids):
+    """
+    get assignments a user has a role with across subvolumes from the user assignment index with
+    one batched assignment item fetch
+    :param username: user login name
+    :param subvolume_ids: list of whole subvolume item ids to get assignments in
+    :return: list of dicts with type, status, item_id, subvolume_id, and region_ids keys ordered
+    by subvolume
+    """
+    # migrate history still stored in whole item metadata so that it is indexed
+    for whole_item in Item().find({'_id': {'$in': [ObjectId(sid) for sid in subvolume_ids]},
+                                   '$or': [{'meta.history': {'$exists': True}},
+                                           {'meta.comment_history': {'$exists': True}}]}):
+        migrate_history(whole_item)
+    docs = UserAssignment().find_user_assignments(username, subvolume_ids)
+    assign_items = {str(item['_id']): item for item in Item().find(
+        {'_id': {'$in': [doc['assignmentId'] for doc in docs]}},
+        fields=['meta.region_ids', f'meta.{REVIEW_APPROVE_KEY}'])}
+    status_docs = AssignmentStatus().get_status_docs_by_assignment(list(assign_items))
+    missing_ids = {}
+    for doc in docs:
+        aid = str(doc['assignmentId'])
+        if aid in assign_items and aid not in status_docs:
+            missing_ids.setdefault(doc['subvolumeId'], set()).add(aid)
+    if missing_ids:
+        for whole_item in Item().find({'_id': {'$in': list(missing_ids)}}):
+            status_docs.update(get_assignment_status_docs(whole_item,
+                                                          list(missing_ids[whole_item['_id']])))
+    order = {str(sid): i for i, sid in enumerate(subvolume_ids)}
+    ret_data = []
+    for doc in sorted(docs, key=lambda d: order[str(d['subvolumeId'])]):
+        aid = str(doc['assignmentId'])
+        if aid not in assign_items:
+            # the assignment item has been removed
+            continue
+        ret_data.append({
+            'type': doc['type'],
+            'status': status_docs[aid]['status'],
+            'item_id': aid,
+            'subvolume_id': doc['subvolumeId'],
+            'region_ids': assign_items[aid]['meta']['region_ids']
+        })
+    return ret_data
+
+
+def get_region_comments(whole_item, region_label):
+    migrate_history(whole_item)
+    return History().get_comments(whole_item['_id'], region_label)
 
 
 def add_meta_to_history(item, assign_item_id, info, key='history'):
     """
-    add meta to whole item metadata history key with val added as a list so that
-    if key already exists, val is appended to the existing value list
-    :param item: whole subvolume item to add metadata to
-    :param label: region label
-    :param info: reject info dict to be added
-    :param key: history or comment_history to store meta to
+    add info to the history collection as a history or comment history event of the whole item
+    :param item: whole subvolume item to add history to
+    :param assign_item_id: assignment item id for history or region label for comment history
+    :param info: history or comment info dict to be added
+    :param key: history or comment_history to store info to
     :return:
     """
     assign_item_id = str(assign_item_id)
-    if key not in item['meta']:
-        item['meta'][key] = {
-            assign_item_id: [info]
-        }
-    elif assign_item_id not in item['meta'][key]:
-        item['meta'][key][assign_item_id] = [info]
-    else:
-        key_val = item['meta'][key][assign_item_id]
-        key_val.append(info)
-        item['meta'][key][assign_item_id] = key_val
-
-    Item().save(item)
+    migrate_history(item)
+    event = History().add(item['_id'], assign_item_id, info)
+    if key == 'history':
+        UserAssignment().add_events([event])
+    if key == 'history' and ObjectId.is_valid(assign_item_id):
+        # keep the materialized assignment status in sync with the history
+        docs = AssignmentStatus().get_status_docs(item['_id'], [assign_item_id])
+        if assign_item_id in docs:
+            AssignmentStatus().add_info(docs[assign_item_id], info)
+        else:
+            # the status document is built from the history which includes info already
+            get_assignment_status_docs(item, [assign_item_id])
+        if info['type'] in (ANNOT_ASSIGN_KEY, ANNOT_REJECT_KEY):
+            # the assignment becomes unavailable or available for new assignments
+            assign_item = get_item_loader().load(assign_item_id, fields=['meta.region_ids'])
+            if assign_item:
+                sync_region_pool(item, assign_item['meta']['region_ids'])
     return
 
 
+def _get_region_availability(whole_item, labels, regions=None):
+    """
+    get whether regions are available for new annotation assignments
+    :param whole_item: whole subvolume item
+    :param labels: list of region labels
+    :param regions: dict of region label to region metadata, which is looked up if None
+    :return: dict of region label to the list of users who rejected the region assignment last
+    if the region is available or None if it is not available
+    """
+    if regions is None:
+        regions = {str(label): get_whole_item_region(whole_item, label) for label in labels}
+    status_docs = get_assignment_status_docs(
+        whole_item, list({regions[str(label)]['item_id'] for label in labels
+                          if regions.get(str(label)) and 'item_id' in regions[str(label)]}))
+    availability = {}
+    for label in labels:
+        label = str(label)
+        val = regions.get(label)
+        if not val or (REVIEW_APPROVE_KEY in val and val[REVIEW_APPROVE_KEY] == 'true'):
+            # if a region is approved/verified outside ninjato, this review_approved_key can be
+            # set to true for the region metadata, so this region will not be assigned to new users
+            availability[label] = None
+            continue
+        rejected_by = []
+        if 'item_id' in val:
+            history_info = status_docs[val['item_id']]['history_info']
+            if history_info.get(ANNOT_ASSIGN_KEY):
+                availability[label] = None
+                continue
+            rejected_by = [info['user'] for info in history_info.get(ANNOT_REJECT_KEY, [])]
+        availability[label] = rejected_by
+    return availability
+
+
+def sync_region_pool(whole_item, labels):
+    """
+    update the available region pool of a whole item for regions whose availability may have
+    changed
+    :param whole_item: whole subvolume item
+    :param labels: list of region labels
+    :return:
+    """
+    if labels and RegionPool().is_built(whole_item['_id']):
+        RegionPool().update_regions(whole_item['_id'],
+                                    _get_region_availability(whole_item, labels))
+
+
+def _pick_farthest_region(whole_item, labels):
+    """
+    pick the region farthest from all currently active assignments of a whole item using a
+    spatial index of active assignment bounding boxes
+    :param whole_item: whole subvolume item
+    :param labels: list of candidate region labels
+    :return: label of the farthest region
+    """
+    active_ids = AssignmentStatus().get_assignment_ids_by_status(whole_item['_id'], ['active'])
+    if not active_ids:
+        return labels[0]
+    active_items = get_item_loader().load_many(active_ids, fields=['meta.coordinates'])
+    grid = spatial_index.BoxGrid([spatial_index.to_box(item['meta']['coordinates'])
+                                  for item in active_items.values()
+                                  if 'coordinates' in item['meta']])
+    return grid.pick_farthest([(label, spatial_index.to_box(get_whole_item_region(whole_item,
+                                                                                  label)))
+                               for label in labels])
+
+
+def pick_available_region(whole_item, username, training_region_ids=None):
+    """
+    pick a region available for a new annotation assignment from the available region pool of a
+    whole item, building the pool on first use. Out of PICK_CANDIDATE_COUNT random available
+    regions, the one farthest from all active assignments is picked to minimize adjacent region
+    assignment.
+    :param whole_item: whole subvolume item
+    :param username: login name of the user to assign the region to
+    :param training_region_ids: list of training region ids to pick the first available one from
+    instead of picking at random
+    :return: region label or None if there is no available region
+    """
+    if not RegionPool().is_built(whole_item['_id']):
+        regions = whole_item['meta']['regions']
+        RegionPool().build(whole_item['_id'], {
+            label: rejected_by for label, rejected_by in
+            _get_region_availability(whole_item, list(regions), regions=regions).items()
+            if rejected_by is not None
+        })
+    while True:
+        if training_region_ids:
+            label = RegionPool().pick(whole_item['_id'], username, labels=training_region_ids)
+            labels = [label] if label is not None else []
+        else:
+            labels = RegionPool().sample(whole_item['_id'], username, PICK_CANDIDATE_COUNT)
+        if not labels:
+            return None
+        availability = _get_region_availability(whole_item, labels)
+        avail_labels = [label for label in labels if availability[label] is not None
+                        and username not in availability[label]]
+        if len(avail_labels) < len(labels):
+            # some pool entries are out of date, e.g., regions approved outside ninjato
+            RegionPool().update_regions(whole_item['_id'], {
+                label: val for label, val in availability.items() if label not in avail_labels})
+        if len(avail_labels) == 1:
+            return avail_labels[0]
+        if avail_labels:
+            return _pick_farthest_region(whole_item, avail_labels)
+
+
 def check_subvolume_done(whole_item, task='annotation'):
     """
     check if task is done for all regions in the subvolume
@@ -662,10 +1360,18 @@ def check_subvolume_done(whole_item, task='annotation'):
     vol_approved = False
     if task == 'review':
         vol_approved = True
-    for key, val in whole_item['meta']['regions'].items():
-        if REVIEW_APPROVE_KEY in val and val[REVIEW_APPROVE_KEY] == 'true':
-            continue
-        complete_info = get_history_info(whole_item, key, f'{task}_completed_by')
+    regions = [val for val in whole_item['meta']['regions'].values()
+               if val.get(REVIEW_APPROVE_KEY) != 'true']
+    # look up the status of all assignments of the regions with one query
+    status_docs = get_assignment_status_docs(
+        whole_item, list({val['item_id'] for val in regions if 'item_id' in val}))
+    for val in regions:
+        if 'item_id' not in val:
+            # the region has never been assigned
+            complete_info = []
+        else:
+            complete_info = get_history_info(whole_item, val['item_id'], f'{task}_completed_by',
+                                             status_doc=status_docs.get(str(val['item_id'])))
         if not complete_info:
             vol_done = False
             if task == 'review':
@@ -674,59 +1380,82 @@ def check_subvolume_done(whole_item, task='annotation'):
         if task == 'review' and REVIEW_APPROVE_KEY in val and val[REVIEW_APPROVE_KEY] == 'false':
             vol_approved = False
     if vol_done:
-        add_meta = {f'{task}_done': 'true'}
+        mutation = get_meta_mutation(whole_item)
+        mutation.set(f'{task}_done', 'true')
         if task == 'review':
             if vol_approved:
-                add_meta[REVIEW_APPROVE_KEY] = 'true'
+                mutation.set(REVIEW_APPROVE_KEY, 'true')
             else:
-                add_meta[REVIEW_APPROVE_KEY] = 'false'
-        Item().setMetadata(whole_item, add_meta)
-        Item().save(whole_item)
+                mutation.set(REVIEW_APPROVE_KEY, 'false')
+        save_meta_mutation(mutation)
     return vol_done
 
 
 def update_user_mask_from_updated_mask(user_mask_id, lbl_ids):
     """
-    update user mask file from its updated mask updated from the updated whole volume including other
-    user's edits in the overlapping extent so that other users' edits will be reflected in the
-    user's mask file.
+    update user mask file from its updated mask updated from the updated whole volume including
+    other user's edits in the overlapping extent so that other users' edits will be reflected in
+    the user's mask file.
     :param user_mask_id: user mask item id
     :param lbl_ids: label ids in whole item used to update user mask file
     :return: True if user mask is updated successfully, False otherwise
     """
-    files = File().find({'itemId': user_mask_id})
-    item_images = user_images = []
-    for file in files:
+    mask_path = user_path = None
+    for file in File().find({'itemId': user_mask_id}):
         if file['name'].endswith('_masks_regions.tif'):
-            item_tif, _ = _get_tif_file_content_and_path(file)
-            item_images = _get_tif_image_array(item_tif)
+            mask_path = _get_local_file_path(file)
         elif file['name'].endswith('_user.tif'):
-            user_item_tif, user_file_path = _get_tif_file_content_and_path(file)
-            file_res_path = path_util.getResourcePath('file', file, force=True)
-            user_file_name = os.path.basename(file_res_path)
-            user_images = _get_tif_image_array(user_item_tif)
-            output_path = os.path.join(os.path.dirname(user_file_path),
-                                       f'{uuid.uuid4()}_{user_file_name}')
-            user_out_tif = TIFF.open(output_path, mode='w')
+            user_path = get_user_mask_file_path(file)
+    return paste_updated_user_mask(mask_path, user_path, lbl_ids)
 
-    if not item_images or not user_images or len(item_images) != len(user_images):
-        # no user image to update or user image cannot be updated
+
+def get_user_mask_file_path(user_file):
+    """
+    get the local path of a user mask file along with its file name in the asset store
+    :param user_file: user mask file of an assignment item
+    :return: tuple of the local path and the file name
+    """
+    file_res_path = path_util.getResourcePath('file', user_file, force=True)
+    return _get_local_file_path(user_file), os.path.basename(file_res_path)
+
+
+def paste_updated_user_mask(mask_path, user_path, lbl_ids):
+    """
+    update a user mask with the labels of its updated region mask without any database access
+    :param mask_path: local path of the updated region mask file or None if there is none
+    :param user_path: tuple of the local path and the file name of the user mask file as returned
+    by get_user_mask_file_path or None if there is none
+    :param lbl_ids: label ids in whole item used to update user mask file
+    :return: True if user mask is updated successfully, False otherwise
+    """
+    if not mask_path or not user_path:
         return False
+    item_tif = TIFF.open(mask_path, mode="r")
+    item_images = _get_tif_sub_volume(item_tif)
+    item_tif.close()
+    user_file_path, user_file_name = user_path
+    user_item_tif = TIFF.open(user_file_path, mode="r")
+    user_images = _get_tif_sub_volume(user_item_tif)
+    user_item_tif.close()
 
-    for counter, img in enumerate(user_images):
-        for rid in lbl_ids:
-            # reset rid in user image to 0 before setting the label with updated mask
-            img[img == rid] = 0
-            sub_indices = np.argwhere(item_images[counter] == rid)
-            if sub_indices.shape[0] > 0:
-                img[sub_indices[:, 0], sub_indices[:, 1]] = rid
+    if not item_images or not user_images or len(item_images) != len(user_images):
+        # no user image to update or user image cannot be updated since the slice counts of the
+        # user image and the updated mask differ
+        return False
 
-        user_out_tif.write_image(np.copy(img))
+    # reset lbl_ids in user image to 0 before setting the labels with updated mask
+    user_volume = paste_mask_labels(np.array(user_images), lbl_ids, np.array(item_images))
+    output_path = os.path.join(os.path.dirname(user_file_path),
+                               f'{uuid.uuid4()}_{user_file_name}')
+    user_out_tif = TIFF.open(output_path, mode='w')
+    for img in user_volume:
+        user_out_tif.write_image(img)
+    user_out_tif.close()
     return True
 
 
 def _update_user_mask(item_id, old_content, old_extent, new_extent=None):
-    item = Item().findOne({'_id': ObjectId(item_id)})
+    item = get_item_loader().load(item_id)
     if not new_extent:
         item_coords = item['meta']['coordinates']
         new_extent = {
@@ -755,7 +1484,8 @@ def _update_user_mask(item_id, old_content, old_extent, new_extent=None):
         assetstore_id = item_file['assetstoreId']
         item_tif, _ = _get_tif_file_content_and_path(item_file)
         # initial mask
-        item_mask = _get_tif_image_array(item_tif)
+        item_mask = _get_tif_sub_volume(item_tif)
+        item_tif.close()
         break
     # check user mask and initial mask to combine the extent to update user mask
     z = new_extent['min_z']
@@ -819,7 +1549,7 @@ def remove_region_from_active_assignment(whole_item, assign_item_id, region_id,
     :param active_content_data: active assignment mask content data
     :return: assignment item id
     """
-    assign_item = Item().findOne({'_id': ObjectId(assign_item_id)})
+    assign_item = get_item_loader().load(assign_item_id)
     if active_content_data:
         # get old_extent that corresponds to active_content_data before assign_item's coordinates
         # is updated with merged region extent
@@ -833,8 +1563,10 @@ def remove_region_from_active_assignment(whole_item, assign_item_id, region_id,
         }
     region_id = str(region_id)
     if 'item_id' in whole_item['meta']['regions'][region_id]:
-        del whole_item['meta']['regions'][region_id]['item_id']
-        Item().save(whole_item)
+        mutation = get_meta_mutation(whole_item)
+        mutation.unset(f'regions.{region_id}.item_id')
+        save_meta_mutation(mutation)
+        sync_region_pool(whole_item, [region_id])
 
     if 'removed_region_ids' in assign_item['meta']:
         rid_list = assign_item['meta']['removed_region_ids']
@@ -864,12 +1596,6 @@ def remove_region_from_active_assignment(whole_item, assign_item_id, region_id,
     for item_file in item_files:
         if '_masks' not in item_file['name'] or item_file['name'].endswith(INTERMEDIATE_SUFFIX):
             continue
-        tif, _ = _get_tif_file_content_and_path(item_file)
-        images = _get_tif_image_array(tif)
-        imarray = np.array(images)
-        levels = imarray[np.nonzero(imarray)]
-        min_level = min(levels)
-        max_level = max(levels)
         min_z_ary = []
         max_z_ary = []
         min_y_ary = []
@@ -878,18 +1604,15 @@ def remove_region_from_active_assignment(whole_item, assign_item_id, region_id,
         max_x_ary = []
         # find the range after the region is removed from the assigned item
         x_range, y_range, z_range = _get_range(whole_item)
-        for lev in range(min_level, max_level + 1):
-            if str(lev) not in region_levels:
+        # look up extents of the remaining regions of the assignment in the label index
+        stats = get_whole_item_label_stats(whole_item, region_levels)
+        for lev in region_levels:
+            if int(lev) not in stats:
                 continue
-            level_indices = np.where(imarray == lev)
-            min_z = min(level_indices[0])
-            max_z = max(level_indices[0])
-            min_y = min(level_indices[1])
-            max_y = max(level_indices[1])
-            min_x = min(level_indices[2])
-            max_x = max(level_indices[2])
+            extent = stats[int(lev)]
             min_x, max_x, min_y, max_y, min_z, max_z = _get_buffered_extent(
-                min_x, max_x, min_y, max_y, min_z, max_z, x_range, y_range, z_range)
+                extent['x_min'], extent['x_max'], extent['y_min'], extent['y_max'],
+                extent['z_min'], extent['z_max'], x_range, y_range, z_range)
             min_z_ary.append(min_z)
             max_z_ary.append(max_z)
             min_y_ary.append(min_y)
@@ -913,6 +1636,9 @@ def remove_region_from_active_assignment(whole_item, assign_item_id, region_id,
                 "z_min": min_z
             }
         assign_item = Item().save(assign_item)
+        if min_z_ary:
+            AssignmentExtent().set_extent(whole_item['_id'], assign_item['_id'],
+                                          assign_item['meta']['coordinates'])
         # update assign_item based on updated extent that has region removed
         if min_z_ary:
             create_region_files(assign_item, whole_item)
@@ -950,7 +1676,7 @@ def merge_region_to_active_assignment(whole_item, active_assign_id, region_id,
     :param active_content_data: active assignment mask content data
     :return: active assignment annotation assigned to info
     """
-    assign_item = Item().findOne({'_id': ObjectId(active_assign_id)})
+    assign_item = get_item_loader().load(active_assign_id)
     if active_content_data:
         # get old_extent that corresponds to active_content_data before assign_item's coordinates
         # is updated with merged region extent
@@ -995,8 +1721,12 @@ def merge_region_to_active_assignment(whole_item, active_assign_id, region_id,
     region_ids.append(region_id)
     assign_item['meta']['region_ids'] = region_ids
     Item().save(assign_item)
-    val['item_id'] = str(assign_item['_id'])
-    Item().save(whole_item)
+    AssignmentExtent().set_extent(whole_item['_id'], assign_item['_id'],
+                                  assign_item['meta']['coordinates'])
+    mutation = get_meta_mutation(whole_item)
+    mutation.set(f'regions.{region_id}.item_id', str(assign_item['_id']))
+    save_meta_mutation(mutation)
+    sync_region_pool(whole_item, [region_id])
     # update assign_item based on updated extent that includes claimed region
     create_region_files(assign_item, whole_item)
     if active_content_data:
@@ -1022,15 +1752,9 @@ def merge_region_to_active_assignment(whole_item, active_assign_id, region_id,
 
 def add_user_active_assignment_metadata(user_id, whole_item, region_item_id):
     # since a user can claim another region, user id metadata on whole_item is a list
-    if user_id in whole_item['meta']:
-        item_list = whole_item['meta'][user_id]
-        if region_item_id not in item_list:
-            item_list.append(region_item_id)
-        add_meta = {user_id: item_list}
-    else:
-        add_meta = {user_id: [region_item_id]}
-    Item().setMetadata(whole_item, add_meta)
-    Item().save(whole_item)
+    mutation = get_meta_mutation(whole_item)
+    mutation.add_to_set(user_id, region_item_id)
+    save_meta_mutation(mutation)
 
 
 def set_assignment_meta(whole_item, user, region_item_id, assign_type):
@@ -1130,7 +1854,7 @@ def save_content_data(user, item_id, content_data, review=False):
         out_path = os.path.join(out_dir_path, annot_file_name)
         if not os.path.isdir(out_dir_path):
             os.makedirs(out_dir_path)
-        item = Item().findOne({'_id': ObjectId(item_id)})
+        item = get_item_loader().load(item_id)
         _save_content_bytes_to_tiff(content, out_path, item)
         save_file(assetstore_id, item, out_path, user, annot_file_name)
     except Exception as e:
@@ -1166,8 +1890,9 @@ def save_added_and_removed_regions(whole_item, item, current_region_ids,
         removed_region_ids = removed_region_ids + [
             rid for rid in exist_region_ids if rid not in current_region_ids
         ]
-        added_region_ids = added_region_ids + \
-                           [rid for rid in current_region_ids if rid not in exist_region_ids]
+        added_region_ids = added_region_ids + [
+            rid for rid in current_region_ids if rid not in exist_region_ids
+        ]
         duplicate_ids = [elem for elem in added_region_ids if elem in removed_region_ids]
         if duplicate_ids:
             added_region_ids = [elem for elem in added_region_ids if elem not in duplicate_ids]
@@ -1180,18 +1905,24 @@ def save_added_and_removed_regions(whole_item, item, current_region_ids,
         if 'removed_region_ids' in add_meta or removed_region_ids:
             add_meta['removed_region_ids'] = removed_region_ids
     Item().setMetadata(item, add_meta)
+    if REVIEW_APPROVE_KEY in add_meta:
+        update_assignment_approval_status(whole_item, item)
 
     if done:
         if removed_region_ids:
             remove_regions(removed_region_ids, whole_item, str(item['_id']))
             del item['meta']['removed_region_ids']
 
-        for aid in added_region_ids:
-            reg_item = find_region_item_from_label(whole_item, aid)
-            if not reg_item:
+        new_region_ids = [aid for aid in added_region_ids
+                          if not find_region_item_from_label(whole_item, aid)]
+        # compute extents of all new regions in one pass over the assignment mask
+        reg_extents = get_region_extents(item, new_region_ids) if new_region_ids else {}
+        mutation = get_meta_mutation(whole_item)
+        for aid in new_region_ids:
+            if aid in reg_extents:
                 # create the region metadata in the whole subvolume
-                reg_extent = get_region_extent(item, aid)
-                whole_item['meta']['regions'][aid] = {
+                reg_extent = reg_extents[aid]
+                mutation.set(f'regions.{aid}', {
                     "item_id": str(item['_id']),
                     "x_max": reg_extent['x_max'],
                     "x_min": reg_extent['x_min'],
@@ -1199,29 +1930,27 @@ def save_added_and_removed_regions(whole_item, item, current_region_ids,
                     "y_min": reg_extent['y_min'],
                     "z_max": reg_extent['z_max'],
                     "z_min": reg_extent['z_min']
-                }
+                })
         uid = str(uid)
         if uid in whole_item['meta']:
             if str(item['_id']) in whole_item['meta'][uid]:
-                whole_item['meta'][uid].remove(str(item['_id']))
-            if not whole_item['meta'][uid]:
-                del whole_item['meta'][uid]
-        whole_item = Item().save(whole_item)
+                mutation.pull(uid, str(item['_id']))
+            # another request may have added an assignment of the user since it was read
+            mutation.unset_if(uid, [])
+        save_meta_mutation(mutation)
+        sync_region_pool(whole_item, new_region_ids)
     return whole_item
 
 
 def update_all_assignment_masks_async(whole_item, saved_assign_item_id):
     """
-    update all assignments except for the saved_assign_item_id assignment of the whole item
+    update all assignments except for the saved_assign_item_id assignment of the whole item.
+    Saves of the same whole item in short succession are propagated by a single job.
     :param whole_item: the whole subvolume item
     :param saved_assign_item_id: assignment item id that already has updated masks
     :return:
     """
-    job_model = Job()
-    job = job_model.createLocalJob(title='update assignment files', type='local',
-                                   user=User().getAdmins()[0],
-                                   args=(whole_item, saved_assign_item_id),
-                                   module='girder_ninjato_api.async_job_utils',
-                                   function='update_all_assignment_masks')
-    job_model.scheduleJob(job)
+    # the job runs in another thread, so pending metadata changes have to be saved first
+    flush_request()
+    propagation_queue.submit(whole_item['_id'], saved_assign_item_id)
     return
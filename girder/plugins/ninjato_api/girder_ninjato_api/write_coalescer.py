@@ -0,0 +1,143 @@
+import time
+import threading
+from datetime import datetime
+from pymongo import ReturnDocument
+from girder.models.item import Item
+from girder.exceptions import RestException
+from .meta_mutation import MetaMutation, VERSION_KEY
+
+
+# metadata mutations of the same item submitted by concurrent requests within the window are
+# written with a single update
+COALESCE_WINDOW = 0.005
+MAX_RETRIES = 5
+
+_lock = threading.Lock()
+# item id to the list of pending submissions, where the first submission is the leader that
+# writes the batch
+_pending = {}
+
+
+class _Submission:
+    def __init__(self, mutation):
+        self.mutation = mutation
+        self.done = threading.Event()
+        self.error = None
+
+
+def _write_operators(item_id, ops):
+    """
+    write a batch of changes that can all be expressed as update operators, which does not
+    depend on the current item content and so does not need a version check
+    :return: new item version
+    """
+    mutation = MetaMutation({'_id': item_id, 'meta': {}})
+    mutation.replay(ops)
+    update = mutation.get_update()
+    update['$inc'] = {VERSION_KEY: 1}
+    doc = Item().collection.find_one_and_update({'_id': item_id}, update,
+                                                projection={VERSION_KEY: True},
+                                                return_document=ReturnDocument.AFTER)
+    return doc.get(VERSION_KEY, 0) if doc else None
+
+
+def _write_with_version_check(item_id, ops):
+    """
+    write a batch of changes, some of which depend on the current item content, by replaying
+    them onto the latest item and writing the result only if the item version is unchanged
+    :return: new item version
+    """
+    for _ in range(MAX_RETRIES):
+        item = Item().collection.find_one({'_id': item_id},
+                                          projection={'meta': True, VERSION_KEY: True})
+        if item is None:
+            return None
+        version = item.get(VERSION_KEY, 0)
+        mutation = MetaMutation(item)
+        mutation.replay(ops)
+        update = mutation.get_update()
+        update['$inc'] = {VERSION_KEY: 1}
+        query = {'_id': item_id, VERSION_KEY: version} if version else \
+            {'_id': item_id, VERSION_KEY: {'$exists': False}}
+        if Item().collection.update_one(query, update).matched_count:
+            return version + 1
+    raise RestException('Failed to save subvolume metadata due to concurrent updates. Please '
+                        'try again.', code=409)
+
+
+def _write_conditional_unsets(item_id, unsets):
+    """
+    unset each path of an item only if it still has the expected value, leaving the path as it is
+    if another request has changed it since
+    :param item_id: item id
+    :param unsets: list of (dotted path under meta, expected value)
+    :return: new item version or None if nothing is unset
+    """
+    version = None
+    for path, value in unsets:
+        doc = Item().collection.find_one_and_update(
+            {'_id': item_id, f'meta.{path}': value},
+            {'$unset': {f'meta.{path}': ''}, '$set': {'updated': datetime.utcnow()},
+             '$inc': {VERSION_KEY: 1}},
+            projection={VERSION_KEY: True}, return_document=ReturnDocument.AFTER)
+        if doc is not None:
+            version = doc.get(VERSION_KEY, 0)
+    return version
+
+
+def _write_batch(item_id, submissions):
+    ops = []
+    needs_version_check = False
+    for submission in submissions:
+        mutation = submission.mutation
+        ops.extend(mutation.get_ops())
+        if mutation.needs_base():
+            needs_version_check = True
+    combined = MetaMutation({'_id': item_id, 'meta': {}})
+    combined.replay(ops)
+    if not needs_version_check and not combined.needs_base():
+        return _write_operators(item_id, ops)
+    return _write_with_version_check(item_id, ops)
+
+
+def _submit_ops(mutation):
+    item_id = mutation.item['_id']
+    submission = _Submission(mutation)
+    with _lock:
+        leader = item_id not in _pending
+        _pending.setdefault(item_id, []).append(submission)
+    if leader:
+        time.sleep(COALESCE_WINDOW)
+        with _lock:
+            submissions = _pending.pop(item_id)
+        version = None
+        try:
+            version = _write_batch(item_id, submissions)
+        except Exception as e:
+            for sub in submissions:
+                sub.error = e
+        for sub in submissions:
+            if not sub.error:
+                sub.mutation.clear(version)
+            sub.done.set()
+    else:
+        submission.done.wait()
+    if submission.error:
+        raise submission.error
+
+
+def submit(mutation):
+    """
+    write the changes of a metadata mutation, coalescing them with changes to the same item
+    submitted by other requests within COALESCE_WINDOW into one database write. Changes that
+    depend on the item content are replayed onto the latest item and written with an optimistic
+    version check, retrying when another writer got in between. Conditional unsets recorded by
+    MetaMutation.unset_if are written after the other changes, each on its own.
+    :param mutation: MetaMutation to write
+    :return:
+    """
+    unsets = mutation.get_conditional_unsets()
+    if mutation.has_changes():
+        _submit_ops(mutation)
+    if unsets:
+        mutation.clear(_write_conditional_unsets(mutation.item['_id'], unsets))
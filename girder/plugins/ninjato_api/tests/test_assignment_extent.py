@@ -0,0 +1,51 @@
+from bson.objectid import ObjectId
+
+from girder_ninjato_api.models import AssignmentExtent
+
+
+def _extent(x_min, x_max, y_min=0, y_max=10, z_min=0, z_max=10):
+    return {'x_min': x_min, 'x_max': x_max, 'y_min': y_min, 'y_max': y_max, 'z_min': z_min,
+            'z_max': z_max}
+
+
+def test_find_overlapping(db):
+    subvolume_id = ObjectId()
+    assign_item_ids = [str(ObjectId()) for _ in range(4)]
+    AssignmentExtent().build(subvolume_id, {
+        assign_item_ids[0]: _extent(0, 10),
+        assign_item_ids[1]: _extent(10, 20),
+        assign_item_ids[2]: _extent(5, 15, z_min=20, z_max=30),
+        assign_item_ids[3]: _extent('8', '12')
+    })
+    AssignmentExtent().build(ObjectId(), {str(ObjectId()): _extent(0, 20)})
+
+    # extents that only touch at x 10 do not overlap
+    assert sorted(AssignmentExtent().find_overlapping(subvolume_id, _extent(2, 10))) == \
+        sorted([assign_item_ids[0], assign_item_ids[3]])
+    assert AssignmentExtent().find_overlapping(subvolume_id, _extent(30, 40)) == []
+
+
+def test_build_keeps_recorded_extents(db):
+    subvolume_id = ObjectId()
+    assign_item_id = str(ObjectId())
+    assert not AssignmentExtent().is_built(subvolume_id)
+    AssignmentExtent().set_extent(subvolume_id, assign_item_id, _extent(50, 60))
+
+    AssignmentExtent().build(subvolume_id, {assign_item_id: _extent(0, 10)})
+
+    assert AssignmentExtent().is_built(subvolume_id)
+    assert AssignmentExtent().find_overlapping(subvolume_id, _extent(0, 10)) == []
+    assert AssignmentExtent().find_overlapping(subvolume_id, _extent(55, 56)) == [assign_item_id]
+
+
+def test_set_extent_and_remove_assignments(db):
+    subvolume_id = ObjectId()
+    assign_item_ids = [str(ObjectId()), str(ObjectId())]
+    AssignmentExtent().build(subvolume_id, {aid: _extent(0, 10) for aid in assign_item_ids})
+
+    AssignmentExtent().set_extent(subvolume_id, assign_item_ids[0], _extent(30, 40))
+    AssignmentExtent().remove_assignments(subvolume_id, [assign_item_ids[1]])
+
+    assert AssignmentExtent().find_overlapping(subvolume_id, _extent(0, 10)) == []
+    assert AssignmentExtent().find_overlapping(subvolume_id, _extent(35, 36)) == \
+        [assign_item_ids[0]]
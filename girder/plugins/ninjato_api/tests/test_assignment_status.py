@@ -0,0 +1,109 @@
+import pytest
+from bson.objectid import ObjectId
+
+from girder_ninjato_api.models import AssignmentStatus
+
+
+def _info(info_type, time, user='user1'):
+    return {'type': info_type, 'user': user, 'time': time}
+
+
+def _get_doc(history, approved=False):
+    doc = {'history_info': {}, 'approved': approved}
+    for info in history:
+        AssignmentStatus.apply_info(doc, info)
+    return doc
+
+
+@pytest.mark.parametrize('history,approved,status', [
+    ([], False, 'inactive'),
+    ([_info('annotation_assigned_to', '01/01/2022 10:00')], False, 'active'),
+    ([_info('annotation_assigned_to', '01/01/2022 10:00'),
+      _info('annotation_completed_by', '01/01/2022 11:00')], False, 'awaiting review'),
+    ([_info('annotation_assigned_to', '01/01/2022 10:00'),
+      _info('annotation_completed_by', '01/01/2022 11:00'),
+      _info('review_assigned_to', '01/01/2022 12:00')], False, 'under review'),
+    ([_info('annotation_assigned_to', '01/01/2022 10:00'),
+      _info('annotation_completed_by', '01/01/2022 11:00'),
+      _info('review_assigned_to', '01/01/2022 12:00'),
+      _info('review_completed_by', '01/01/2022 13:00:30')], False, 'active'),
+    ([_info('annotation_assigned_to', '01/01/2022 10:00'),
+      _info('annotation_completed_by', '01/01/2022 11:00'),
+      _info('review_assigned_to', '01/01/2022 12:00'),
+      _info('review_completed_by', '01/01/2022 13:00'),
+      _info('annotation_completed_by', '01/01/2022 14:00')], False, 'awaiting review'),
+    ([_info('annotation_assigned_to', '01/01/2022 10:00'),
+      _info('annotation_completed_by', '01/01/2022 11:00')], True, 'completed'),
+    ([_info('annotation_assigned_to', '01/01/2022 10:00'),
+      _info('annotation_completed_by', '01/01/2022 11:00'),
+      _info('annotation_rejected_by', '01/01/2022 12:00')], False, 'inactive')
+])
+def test_derive_status(history, approved, status):
+    assert AssignmentStatus.derive_status(_get_doc(history, approved)) == status
+
+
+def test_apply_info_keeps_newest_first():
+    doc = _get_doc([_info('annotation_assigned_to', '01/01/2022 10:00', 'user1'),
+                    _info('annotation_assigned_to', '01/02/2022 10:00', 'user2')])
+    assert [info['user'] for info in doc['history_info']['annotation_assigned_to']] == \
+        ['user2', 'user1']
+
+
+def test_apply_info_rejection_only_invalidates_its_task():
+    doc = _get_doc([_info('annotation_assigned_to', '01/01/2022 10:00'),
+                    _info('review_assigned_to', '01/01/2022 11:00'),
+                    _info('annotation_rejected_by', '01/01/2022 12:00')])
+    assert sorted(doc['history_info']) == ['annotation_rejected_by', 'review_assigned_to']
+
+
+def test_build_and_add_info(db):
+    subvolume_id = ObjectId()
+    assign_item_id = ObjectId()
+    doc = AssignmentStatus().build(subvolume_id, assign_item_id,
+                                   [_info('annotation_assigned_to', '01/01/2022 10:00')], False)
+    assert (doc['status'], doc['version']) == ('active', 1)
+
+    doc = AssignmentStatus().add_info(doc, _info('annotation_completed_by', '01/01/2022 11:00'))
+
+    assert (doc['status'], doc['version']) == ('awaiting review', 2)
+    assert AssignmentStatus().get_assignment_ids_by_status(
+        subvolume_id, ['awaiting review']) == [str(assign_item_id)]
+    assert AssignmentStatus().get_status_docs(subvolume_id)[str(assign_item_id)]['version'] == 2
+
+
+def test_build_returns_existing_doc(db):
+    subvolume_id = ObjectId()
+    assign_item_id = ObjectId()
+    AssignmentStatus().build(subvolume_id, assign_item_id,
+                             [_info('annotation_assigned_to', '01/01/2022 10:00')], False)
+
+    doc = AssignmentStatus().build(subvolume_id, assign_item_id, [], False)
+
+    assert (doc['status'], doc['version']) == ('active', 1)
+
+
+def test_add_info_reapplies_to_concurrently_updated_doc(db):
+    subvolume_id = ObjectId()
+    assign_item_id = ObjectId()
+    doc = AssignmentStatus().build(subvolume_id, assign_item_id,
+                                   [_info('annotation_assigned_to', '01/01/2022 10:00')], False)
+    stale_doc = AssignmentStatus().get_status_docs(subvolume_id)[str(assign_item_id)]
+    AssignmentStatus().add_info(doc, _info('annotation_completed_by', '01/01/2022 11:00'))
+
+    doc = AssignmentStatus().add_info(stale_doc, _info('review_assigned_to', '01/01/2022 12:00'))
+
+    assert (doc['status'], doc['version']) == ('under review', 3)
+    assert sorted(doc['history_info']) == ['annotation_assigned_to', 'annotation_completed_by',
+                                           'review_assigned_to']
+
+
+def test_set_approved_and_remove_assignments(db):
+    subvolume_id = ObjectId()
+    assign_item_ids = [ObjectId(), ObjectId()]
+    docs = [AssignmentStatus().build(subvolume_id, aid, [], False) for aid in assign_item_ids]
+
+    assert AssignmentStatus().set_approved(docs[0], True)['status'] == 'completed'
+
+    AssignmentStatus().remove_assignments(subvolume_id, [assign_item_ids[0]])
+    assert list(AssignmentStatus().get_subvolumes_status_docs([subvolume_id])[
+        str(subvolume_id)]) == [str(assign_item_ids[1])]
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from girder_ninjato_api import crop_cache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(crop_cache, 'CACHE_PATH', str(tmp_path / 'cache'))
+    monkeypatch.setattr(crop_cache, 'MAX_CACHE_BYTES', 250)
+    monkeypatch.setattr(crop_cache, '_total_bytes', None)
+    monkeypatch.setattr(crop_cache, '_stats', {'hits': 0, 'misses': 0, 'evictions': 0})
+    return crop_cache
+
+
+def _write_crop(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b'\1' * size)
+    return str(path)
+
+
+def _set_last_use(cache, key, mtime):
+    os.utime(cache._get_cache_file_path(key), (mtime, mtime))
+
+
+def test_cache_key_depends_on_file_version_and_extent():
+    item_file = {'_id': 'f', 'sha512': 'abc'}
+    extent = (0, 1, 2, 3, 4, 5)
+    key = crop_cache.get_cache_key(item_file, extent)
+    assert key == crop_cache.get_cache_key(dict(item_file), list(extent))
+    assert key != crop_cache.get_cache_key({'_id': 'f', 'sha512': 'def'}, extent)
+    assert key != crop_cache.get_cache_key(item_file, (0, 1, 2, 3, 4, 6))
+
+
+def test_get_copies_cached_crop(cache, tmp_path):
+    out_path = str(tmp_path / 'out.tif')
+    assert not cache.get('a', out_path)
+    cache.put('a', _write_crop(tmp_path, 'a.tif', 100))
+    assert cache.get('a', out_path)
+    assert os.path.getsize(out_path) == 100
+    stats = cache.get_stats()
+    assert (stats['hits'], stats['misses'], stats['total_bytes']) == (1, 1, 100)
+
+
+def test_put_evicts_least_recently_used_crops(cache, tmp_path):
+    cache.put('a', _write_crop(tmp_path, 'a.tif', 100))
+    cache.put('b', _write_crop(tmp_path, 'b.tif', 100))
+    _set_last_use(cache, 'a', 1000)
+    _set_last_use(cache, 'b', 2000)
+    # using a makes b the least recently used crop
+    assert cache.get('a', str(tmp_path / 'out.tif'))
+
+    cache.put('c', _write_crop(tmp_path, 'c.tif', 100))
+
+    assert os.path.isfile(cache._get_cache_file_path('a'))
+    assert not os.path.isfile(cache._get_cache_file_path('b'))
+    assert os.path.isfile(cache._get_cache_file_path('c'))
+    stats = cache.get_stats()
+    assert (stats['evictions'], stats['total_bytes']) == (1, 200)
+
+
+def test_put_replaces_crop_without_double_counting(cache, tmp_path):
+    cache.put('a', _write_crop(tmp_path, 'a.tif', 100))
+    cache.put('a', _write_crop(tmp_path, 'a2.tif', 120))
+    stats = cache.get_stats()
+    assert (stats['evictions'], stats['total_bytes']) == (0, 120)
+
+
+def test_put_skips_crops_larger_than_the_cache(cache, tmp_path):
+    cache.put('a', _write_crop(tmp_path, 'a.tif', 300))
+    assert not os.path.isfile(cache._get_cache_file_path('a'))
+
+
+def test_total_bytes_are_scanned_from_existing_cache(cache, tmp_path):
+    cache.put('a', _write_crop(tmp_path, 'a.tif', 100))
+    cache._total_bytes = None
+    assert cache.get_stats()['total_bytes'] == 100
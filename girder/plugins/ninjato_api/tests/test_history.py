@@ -0,0 +1,67 @@
+from bson.objectid import ObjectId
+
+from girder_ninjato_api.models import History
+
+
+def _info(info_type, time, user='user1'):
+    return {'type': info_type, 'user': user, 'time': time}
+
+
+def test_add_and_get_history(db):
+    subvolume_id = ObjectId()
+    assign_item_id = str(ObjectId())
+    History().add(subvolume_id, assign_item_id, _info('annotation_completed_by',
+                                                      '01/01/2022 11:00'))
+    History().add(subvolume_id, assign_item_id, _info('annotation_assigned_to',
+                                                      '01/01/2022 10:00:30'))
+    History().add(subvolume_id, '12', {'comment': 'check this', 'user': 'user2',
+                                       'time': '01/01/2022 10:30'})
+
+    history = History().get_history(subvolume_id)
+
+    assert history == {assign_item_id: [
+        _info('annotation_assigned_to', '01/01/2022 10:00:30'),
+        _info('annotation_completed_by', '01/01/2022 11:00')
+    ]}
+    assert History().get_comments(subvolume_id, 12) == [
+        {'comment': 'check this', 'user': 'user2', 'time': '01/01/2022 10:30'}]
+    event = History().findOne({'subvolumeId': subvolume_id, 'type': 'annotation_assigned_to'})
+    assert event['assignmentId'] == ObjectId(assign_item_id)
+
+
+def test_find_events_filters(db):
+    subvolume_id = ObjectId()
+    assign_item_ids = [str(ObjectId()), str(ObjectId())]
+    History().add(subvolume_id, assign_item_ids[0], _info('annotation_assigned_to',
+                                                          '01/01/2022 10:00', 'user1'))
+    History().add(subvolume_id, assign_item_ids[1], _info('annotation_assigned_to',
+                                                          '01/01/2022 11:00', 'user2'))
+    History().add(subvolume_id, assign_item_ids[1], _info('review_assigned_to',
+                                                          '01/01/2022 12:00', 'user1'))
+    History().add(ObjectId(), assign_item_ids[0], _info('annotation_assigned_to',
+                                                        '01/01/2022 10:00', 'user1'))
+
+    def find_types(**kwargs):
+        return [doc['type'] for doc in History().find_events(subvolume_id, **kwargs)]
+
+    assert find_types(assign_keys=[assign_item_ids[1]]) == \
+        ['annotation_assigned_to', 'review_assigned_to']
+    assert find_types(types=['review_assigned_to']) == ['review_assigned_to']
+    assert find_types(exclude_types=['review_assigned_to']) == ['annotation_assigned_to'] * 2
+    assert find_types(user='user1') == ['annotation_assigned_to', 'review_assigned_to']
+
+
+def test_migrate_is_idempotent(db):
+    subvolume_ids = [ObjectId(), ObjectId()]
+    assign_item_id = str(ObjectId())
+    history = {assign_item_id: [_info('annotation_assigned_to', '01/01/2022 10:00'),
+                                _info('annotation_completed_by', '01/01/2022 11:00')]}
+    comment_history = {'5': [{'comment': 'split', 'user': 'user1', 'time': '01/01/2022 10:30'}]}
+
+    History().migrate(subvolume_ids[0], history, comment_history)
+    History().migrate(subvolume_ids[0], history, comment_history)
+
+    assert History().collection.count_documents({'subvolumeId': subvolume_ids[0]}) == 3
+    assert History().get_subvolumes_history(subvolume_ids) == {str(subvolume_ids[0]): history,
+                                                               str(subvolume_ids[1]): {}}
+    assert History().get_comments(subvolume_ids[0], '5') == comment_history['5']
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+from bson.objectid import ObjectId
+
+from ninjato_label_stats import get_label_stats
+
+from girder_ninjato_api.models import LabelIndex
+
+
+def _get_volume():
+    volume = np.zeros((6, 8, 8), dtype=np.uint16)
+    volume[0:2, 0:2, 0:2] = 1
+    volume[1:5, 3:7, 3:7] = 2
+    volume[5, 7, 7] = 3
+    return volume
+
+
+def _get_block_stats(volume, extent):
+    block = volume[extent['z_min']:extent['z_max'] + 1, extent['y_min']:extent['y_max'] + 1,
+                   extent['x_min']:extent['x_max'] + 1]
+    return get_label_stats(block, offset=(extent['z_min'], extent['y_min'], extent['x_min']))
+
+
+def _assert_stats_equal(index_stats, stats):
+    assert set(index_stats) == set(stats)
+    for label, label_stats in stats.items():
+        index_label_stats = dict(index_stats[label])
+        centroid = index_label_stats.pop('centroid')
+        assert index_label_stats.pop('exact')
+        assert index_label_stats == {k: v for k, v in label_stats.items() if k != 'centroid'}
+        assert centroid == pytest.approx(label_stats['centroid'])
+
+
+def test_build(db):
+    item_id = ObjectId()
+    volume = _get_volume()
+    stats = get_label_stats(volume)
+    assert not LabelIndex().has_index(item_id)
+
+    LabelIndex().build(item_id, stats)
+
+    assert LabelIndex().has_index(item_id)
+    _assert_stats_equal(LabelIndex().get_label_stats(item_id), stats)
+    assert list(LabelIndex().get_label_stats(item_id, [3])) == [3]
+
+
+def test_build_removes_stale_labels(db):
+    item_id = ObjectId()
+    volume = _get_volume()
+    LabelIndex().build(item_id, get_label_stats(volume))
+    volume[volume == 3] = 0
+
+    LabelIndex().build(item_id, get_label_stats(volume))
+
+    assert sorted(LabelIndex().get_label_stats(item_id)) == [1, 2]
+
+
+def test_build_marks_empty_mask_as_indexed(db):
+    item_id = ObjectId()
+
+    LabelIndex().build(item_id, {})
+
+    assert LabelIndex().has_index(item_id)
+    assert LabelIndex().get_label_stats(item_id) == {}
+
+
+def test_update_block_inside_label_is_exact(db):
+    item_id = ObjectId()
+    volume = _get_volume()
+    LabelIndex().build(item_id, get_label_stats(volume))
+    extent = {'z_min': 0, 'z_max': 5, 'y_min': 2, 'y_max': 7, 'x_min': 2, 'x_max': 7}
+    old_stats = _get_block_stats(volume, extent)
+    # label 2 is entirely inside the block, label 4 is new
+    volume[1:5, 3:7, 3:7] = 0
+    volume[2, 4, 4] = 2
+    volume[3, 2:4, 2] = 4
+
+    LabelIndex().update_block(item_id, old_stats, _get_block_stats(volume, extent), extent)
+
+    _assert_stats_equal(LabelIndex().get_label_stats(item_id), get_label_stats(volume))
+
+
+def test_update_block_flags_shrunk_label_as_not_exact(db):
+    item_id = ObjectId()
+    volume = _get_volume()
+    LabelIndex().build(item_id, get_label_stats(volume))
+    extent = {'z_min': 0, 'z_max': 5, 'y_min': 0, 'y_max': 7, 'x_min': 5, 'x_max': 7}
+    old_stats = _get_block_stats(volume, extent)
+    # label 2 loses voxels at its x max side which is inside the block and label 3 is removed
+    volume[1:5, 3:7, 5:7] = 0
+    volume[5, 7, 7] = 0
+
+    LabelIndex().update_block(item_id, old_stats, _get_block_stats(volume, extent), extent)
+
+    index_stats = LabelIndex().get_label_stats(item_id)
+    stats = get_label_stats(volume)
+    assert not index_stats[2]['exact']
+    assert index_stats[2]['count'] == stats[2]['count']
+    assert index_stats[2]['centroid'] == pytest.approx(stats[2]['centroid'])
+    assert index_stats[2]['x_max'] >= stats[2]['x_max']
+    assert 3 not in index_stats
+
+    LabelIndex().set_exact_stats(item_id, stats, [2, 3])
+
+    _assert_stats_equal(LabelIndex().get_label_stats(item_id), stats)
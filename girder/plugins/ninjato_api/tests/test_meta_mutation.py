@@ -0,0 +1,101 @@
+from girder_ninjato_api.meta_mutation import MetaMutation
+
+
+def _get_item():
+    return {'meta': {'user1': ['a1'], 'regions': {'5': {'x_min': 0, 'x_max': 4}}}}
+
+
+def test_changes_apply_to_item():
+    item = _get_item()
+    mutation = MetaMutation(item)
+    mutation.push('user1', 'a2')
+    mutation.add_to_set('user1', 'a1')
+    mutation.set('regions.6.x_min', 3)
+    mutation.unset('regions.5')
+    mutation.pull('user2', 'a3')
+
+    assert item['meta'] == {'user1': ['a1', 'a2'], 'regions': {'6': {'x_min': 3}}}
+    assert mutation.has_changes()
+
+
+def test_get_update_combines_operators():
+    mutation = MetaMutation(_get_item())
+    mutation.push('user1', 'a2')
+    mutation.push('user1', 'a3')
+    mutation.pull('user2', 'a4')
+    mutation.pull('user2', 'a5')
+    mutation.add_to_set('user3', 'a6')
+    mutation.set('regions.5.x_max', 6)
+    mutation.set('regions.5.x_max', 7)
+    mutation.unset('regions.7')
+
+    update = mutation.get_update()
+
+    assert 'updated' in update['$set']
+    del update['$set']['updated']
+    assert update == {
+        '$push': {'meta.user1': {'$each': ['a2', 'a3']}},
+        '$pull': {'meta.user2': {'$in': ['a4', 'a5']}},
+        '$addToSet': {'meta.user3': {'$each': ['a6']}},
+        '$set': {'meta.regions.5.x_max': 7},
+        '$unset': {'meta.regions.7': ''}
+    }
+    assert not mutation.needs_base()
+
+
+def test_get_update_falls_back_to_in_memory_value():
+    item = _get_item()
+    mutation = MetaMutation(item)
+    # nested paths and mixed operators on a path cannot be combined in one update
+    mutation.set('regions.6', {'x_min': 1})
+    mutation.set('regions.6.x_max', 2)
+    mutation.push('user1', 'a2')
+    mutation.pull('user1', 'a1')
+    mutation.set('user2', ['a3'])
+    mutation.unset('user2')
+
+    update = mutation.get_update()
+
+    assert mutation.needs_base()
+    assert update['$set']['meta.regions.6'] == {'x_min': 1, 'x_max': 2}
+    assert update['$set']['meta.user1'] == ['a2']
+    assert update['$unset'] == {'meta.user2': ''}
+
+
+def test_get_update_without_changes():
+    mutation = MetaMutation(_get_item())
+    assert not mutation.has_changes()
+    assert mutation.get_update() is None
+
+
+def test_replay_applies_ops_of_another_mutation():
+    mutation = MetaMutation(_get_item())
+    mutation.push('user1', 'a2')
+    mutation.set('regions.5.x_max', 6)
+    mutation.unset('regions.5.x_min')
+    mutation.pull('user1', 'a1')
+    mutation.add_to_set('user2', 'a3')
+    item = _get_item()
+
+    replayed = MetaMutation(item)
+    replayed.replay(mutation.get_ops())
+
+    assert replayed.get_ops() == mutation.get_ops()
+    assert item['meta'] == {'user1': ['a2'], 'user2': ['a3'], 'regions': {'5': {'x_max': 6}}}
+
+
+def test_unset_if_is_kept_apart_from_ops():
+    item = _get_item()
+    mutation = MetaMutation(item)
+    mutation.pull('user1', 'a1')
+    mutation.unset_if('user1', [])
+    mutation.unset_if('regions.5', {})
+
+    assert mutation.get_ops() == [('$pull', 'user1', 'a1')]
+    assert mutation.get_conditional_unsets() == [('user1', []), ('regions.5', {})]
+    assert item['meta'] == {'regions': {'5': {'x_min': 0, 'x_max': 4}}}
+
+    mutation.clear(3)
+    assert not mutation.has_changes()
+    assert mutation.get_conditional_unsets() == []
+    assert item['metaVersion'] == 3
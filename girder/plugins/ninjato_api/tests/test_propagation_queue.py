@@ -0,0 +1,103 @@
+import pytest
+
+from girder_ninjato_api import propagation_queue
+
+
+class _Timer:
+    def __init__(self, interval, function, args):
+        self.function = function
+        self.args = args
+
+    def start(self):
+        timers.append(self)
+
+
+class _Job:
+    def __init__(self):
+        self.fail = False
+
+    def __call__(self):
+        return self
+
+    def createLocalJob(self, **kwargs):
+        if self.fail:
+            raise RuntimeError('cannot create job')
+        return kwargs
+
+    def scheduleJob(self, job):
+        scheduled_jobs.append(job['args'])
+
+
+class _User:
+    def getAdmins(self):
+        return ['admin']
+
+
+timers = []
+scheduled_jobs = []
+
+
+@pytest.fixture
+def job(monkeypatch):
+    timers.clear()
+    scheduled_jobs.clear()
+    job = _Job()
+    monkeypatch.setattr(propagation_queue.threading, 'Timer', _Timer)
+    monkeypatch.setattr(propagation_queue, 'Job', job)
+    monkeypatch.setattr(propagation_queue, 'User', _User)
+    monkeypatch.setattr(propagation_queue, '_pending', {})
+    monkeypatch.setattr(propagation_queue, '_scheduled', set())
+    return job
+
+
+def _fire_timers():
+    while timers:
+        timer = timers.pop(0)
+        timer.function(*timer.args)
+
+
+def test_saves_are_merged_into_pending_job(job):
+    propagation_queue.submit('sub1', 'a1')
+    propagation_queue.submit('sub1', 'a2')
+    propagation_queue.submit('sub2', 'a3')
+
+    assert len(timers) == 2
+    _fire_timers()
+    assert scheduled_jobs == [('sub1',), ('sub2',)]
+    assert propagation_queue.take_pending('sub1') == {'a1', 'a2'}
+    assert propagation_queue.take_pending('sub2') == {'a3'}
+    assert propagation_queue.take_pending('sub1') == set()
+
+
+def test_saves_after_job_start_schedule_new_job(job):
+    propagation_queue.submit('sub1', 'a1')
+    _fire_timers()
+    # the save arrives while the job is scheduled but has not started yet
+    propagation_queue.submit('sub1', 'a2')
+    assert timers == []
+    assert propagation_queue.take_pending('sub1') == {'a1', 'a2'}
+
+    propagation_queue.submit('sub1', 'a3')
+
+    _fire_timers()
+    assert scheduled_jobs == [('sub1',), ('sub1',)]
+    assert propagation_queue.take_pending('sub1') == {'a3'}
+
+
+def test_saves_of_failed_job_are_kept(job):
+    job.fail = True
+    propagation_queue.submit('sub1', 'a1')
+    _fire_timers()
+    assert scheduled_jobs == []
+
+    job.fail = False
+    propagation_queue.submit('sub1', 'a2')
+    _fire_timers()
+
+    assert scheduled_jobs == [('sub1',)]
+    assert propagation_queue.take_pending('sub1') == {'a1', 'a2'}
+
+
+def test_run_lock_is_per_subvolume():
+    assert propagation_queue.get_run_lock('sub1') is propagation_queue.get_run_lock('sub1')
+    assert propagation_queue.get_run_lock('sub1') is not propagation_queue.get_run_lock('sub2')
@@ -0,0 +1,81 @@
+import pytest
+from bson.objectid import ObjectId
+from girder.models.item import Item
+
+from girder_ninjato_api import region_ids
+from girder_ninjato_api.meta_mutation import VERSION_KEY
+
+
+@pytest.mark.parametrize('ranges,ids,merged', [
+    ([], [5, 3, 4], [[3, 5]]),
+    ([[1, 2], [6, 8]], [4], [[1, 2], [4, 4], [6, 8]]),
+    ([[1, 2], [5, 8]], [3, 4], [[1, 8]]),
+    ([[1, 4]], [2, 3], [[1, 4]]),
+    ([[3, 4]], [9, 1], [[1, 1], [3, 4], [9, 9]])
+])
+def test_add_ids_to_ranges(ranges, ids, merged):
+    assert region_ids.add_ids_to_ranges(ranges, ids) == merged
+
+
+@pytest.mark.parametrize('ranges,count,ids,remaining', [
+    ([], 2, [], []),
+    ([[3, 5]], 2, [3, 4], [[5, 5]]),
+    ([[3, 5]], 3, [3, 4, 5], []),
+    ([[1, 1], [4, 6], [9, 9]], 3, [1, 4, 5], [[6, 6], [9, 9]]),
+    ([[1, 2]], 5, [1, 2], [])
+])
+def test_take_ids_from_ranges(ranges, count, ids, remaining):
+    assert region_ids.take_ids_from_ranges(ranges, count) == (ids, remaining)
+
+
+def _create_item(meta):
+    item = {'_id': ObjectId(), 'name': 'whole', 'meta': meta}
+    Item().collection.insert_one(item)
+    return item
+
+
+def test_allocate_reuses_freed_ids_first(db):
+    item = _create_item({'regions': {}, 'max_region_id': 10})
+
+    region_ids.free_region_ids(item, [4, 5, 7])
+    assert item['meta'][region_ids.FREE_RANGES_KEY] == [[4, 5], [7, 7]]
+
+    assert region_ids.allocate_region_ids(item, 5) == [4, 5, 7, 11, 12]
+    saved = Item().collection.find_one({'_id': item['_id']})
+    assert saved['meta'][region_ids.FREE_RANGES_KEY] == []
+    assert saved['meta']['max_region_id'] == 12
+    assert VERSION_KEY not in saved
+
+
+def test_allocate_migrates_legacy_freed_ids_and_max_id(db):
+    item = _create_item({'regions': {}, 'max_region_id': '10',
+                         region_ids.LEGACY_FREE_IDS_KEY: [3, 2]})
+
+    assert region_ids.allocate_region_ids(item, 3) == [2, 3, 11]
+    saved = Item().collection.find_one({'_id': item['_id']})
+    assert region_ids.LEGACY_FREE_IDS_KEY not in saved['meta']
+    assert saved['meta']['max_region_id'] == 11
+
+
+def test_allocate_retries_when_freed_ids_change(db, monkeypatch):
+    item = _create_item({'regions': {}, 'max_region_id': 10})
+    region_ids.free_region_ids(item, [1, 2, 3])
+    get_free_state = region_ids._get_free_state
+    reads = []
+
+    def get_free_state_before_concurrent_allocation(item_id):
+        state = get_free_state(item_id)
+        reads.append(state[0])
+        if len(reads) == 1:
+            # another request takes region id 1 after the freed ids are read
+            Item().collection.update_one({'_id': item_id}, {
+                '$set': {f'meta.{region_ids.FREE_RANGES_KEY}': [[2, 3]]}})
+        return state
+
+    monkeypatch.setattr(region_ids, '_get_free_state',
+                        get_free_state_before_concurrent_allocation)
+
+    assert region_ids.allocate_region_ids(item, 2) == [2, 3]
+    assert reads == [[[1, 3]], [[2, 3]]]
+    saved = Item().collection.find_one({'_id': item['_id']})
+    assert saved['meta'][region_ids.FREE_RANGES_KEY] == []
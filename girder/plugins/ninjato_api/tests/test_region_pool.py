@@ -0,0 +1,54 @@
+from bson.objectid import ObjectId
+
+from girder_ninjato_api.models import RegionPool
+
+
+def _get_labels(subvolume_id):
+    return sorted(doc['label'] for doc in RegionPool().collection.find(
+        {'subvolumeId': subvolume_id, 'label': {'$ne': None}}))
+
+
+def test_build_replaces_pool(db):
+    subvolume_id = ObjectId()
+    assert not RegionPool().is_built(subvolume_id)
+
+    RegionPool().build(subvolume_id, {1: [], 2: ['user1']})
+    RegionPool().build(subvolume_id, {2: [], 3: []})
+
+    assert RegionPool().is_built(subvolume_id)
+    assert _get_labels(subvolume_id) == ['2', '3']
+
+
+def test_build_empty_pool_is_built(db):
+    subvolume_id = ObjectId()
+
+    RegionPool().build(subvolume_id, {})
+
+    assert RegionPool().is_built(subvolume_id)
+    assert RegionPool().pick(subvolume_id, 'user1') is None
+
+
+def test_update_regions(db):
+    subvolume_id = ObjectId()
+    RegionPool().build(subvolume_id, {1: [], 2: []})
+
+    RegionPool().update_regions(subvolume_id, {1: None, 3: ['user1']})
+
+    assert _get_labels(subvolume_id) == ['2', '3']
+
+
+def test_pick_skips_regions_rejected_by_user(db):
+    subvolume_id = ObjectId()
+    RegionPool().build(subvolume_id, {1: ['user1'], 2: ['user2'], 3: ['user1', 'user2']})
+
+    assert {RegionPool().pick(subvolume_id, 'user1') for _ in range(20)} == {'2'}
+    assert sorted(RegionPool().sample(subvolume_id, 'user3', 50)) == ['1', '2', '3']
+    assert RegionPool().sample(subvolume_id, 'user1', 5) == ['2']
+
+
+def test_pick_in_label_order(db):
+    subvolume_id = ObjectId()
+    RegionPool().build(subvolume_id, {1: [], 2: ['user1'], 3: []})
+
+    assert RegionPool().pick(subvolume_id, 'user1', labels=[5, 2, 3, 1]) == '3'
+    assert RegionPool().pick(subvolume_id, 'user1', labels=[2, 5]) is None
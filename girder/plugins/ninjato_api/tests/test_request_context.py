@@ -0,0 +1,74 @@
+import pytest
+
+from girder_ninjato_api import request_context, write_coalescer
+from girder_ninjato_api.meta_mutation import MetaMutation
+
+
+@pytest.fixture
+def submitted(monkeypatch):
+    submitted = []
+
+    def submit(mutation):
+        submitted.append(mutation.item['_id'])
+        if mutation.item.get('fail'):
+            raise ValueError(mutation.item['_id'])
+
+    monkeypatch.setattr(write_coalescer, 'submit', submit)
+    return submitted
+
+
+def test_mutations_are_flushed_once_on_return(submitted):
+    item = {'_id': 'item1', 'meta': {}}
+
+    @request_context.request_scope
+    def nested():
+        mutation = request_context.get_meta_mutation(item)
+        mutation.push('user1', 'a2')
+        request_context.save_meta_mutation(mutation)
+
+    @request_context.request_scope
+    def endpoint():
+        mutation = request_context.get_meta_mutation(item)
+        mutation.push('user1', 'a1')
+        request_context.save_meta_mutation(mutation)
+        nested()
+        assert submitted == []
+        assert request_context.get_meta_mutation(item) is mutation
+        return mutation
+
+    mutation = endpoint()
+
+    assert submitted == ['item1']
+    assert mutation.get_ops() == [('$push', 'user1', 'a1'), ('$push', 'user1', 'a2')]
+
+
+def test_mutations_are_discarded_on_error(submitted):
+    @request_context.request_scope
+    def endpoint():
+        mutation = request_context.get_meta_mutation({'_id': 'item1', 'meta': {}})
+        mutation.push('user1', 'a1')
+        raise KeyError('endpoint error')
+
+    with pytest.raises(KeyError):
+        endpoint()
+    assert submitted == []
+
+
+def test_flush_writes_all_mutations_and_raises_first_error(submitted):
+    @request_context.request_scope
+    def endpoint():
+        for item in ({'_id': 'item1', 'meta': {}, 'fail': True},
+                     {'_id': 'item2', 'meta': {}, 'fail': True},
+                     {'_id': 'item3', 'meta': {}}):
+            request_context.get_meta_mutation(item).push('user1', 'a1')
+
+    with pytest.raises(ValueError, match='item1'):
+        endpoint()
+    assert submitted == ['item1', 'item2', 'item3']
+
+
+def test_mutations_are_written_right_away_without_scope(submitted):
+    mutation = request_context.get_meta_mutation({'_id': 'item1', 'meta': {}})
+    assert isinstance(mutation, MetaMutation)
+    request_context.save_meta_mutation(mutation)
+    assert submitted == ['item1']
@@ -0,0 +1,55 @@
+import math
+import random
+
+import pytest
+
+from girder_ninjato_api.spatial_index import BoxGrid, box_distance, to_box
+
+
+def _random_box(rng, size=200, max_edge=20):
+    mins = tuple(rng.randint(0, size) for _ in range(3))
+    return mins, tuple(v + rng.randint(0, max_edge) for v in mins)
+
+
+def test_to_box():
+    extent = {'x_min': 1, 'x_max': 4, 'y_min': '2', 'y_max': '5', 'z_min': 3, 'z_max': 6}
+    assert to_box(extent) == ((1, 2, 3), (4, 5, 6))
+
+
+@pytest.mark.parametrize('box1,box2,distance', [
+    (((0, 0, 0), (4, 4, 4)), ((2, 2, 2), (6, 6, 6)), 0),
+    (((0, 0, 0), (4, 4, 4)), ((7, 0, 0), (9, 4, 4)), 3),
+    (((0, 0, 0), (1, 1, 1)), ((4, 5, 1), (6, 6, 6)), 5)
+])
+def test_box_distance(box1, box2, distance):
+    assert box_distance(box1, box2) == distance
+    assert box_distance(box2, box1) == distance
+
+
+def test_empty_grid():
+    grid = BoxGrid([])
+    assert len(grid) == 0
+    assert grid.nearest_distance(((0, 0, 0), (1, 1, 1))) == math.inf
+    assert grid.pick_farthest([('a', ((0, 0, 0), (1, 1, 1)))]) == 'a'
+    assert grid.pick_farthest([]) is None
+
+
+@pytest.mark.parametrize('cell_size', [None, 7, 500])
+def test_nearest_distance_matches_brute_force(cell_size):
+    rng = random.Random(cell_size)
+    boxes = [_random_box(rng) for _ in range(50)]
+    grid = BoxGrid(boxes, cell_size=cell_size)
+    # include query boxes outside of the occupied part of the grid
+    queries = [_random_box(rng, size=400) for _ in range(100)] + [
+        ((-300, -300, -300), (-290, -290, -290))]
+    for query in queries:
+        assert grid.nearest_distance(query) == \
+            pytest.approx(min(box_distance(query, box) for box in boxes))
+
+
+def test_pick_farthest():
+    grid = BoxGrid([((0, 0, 0), (10, 10, 10)), ((100, 100, 100), (110, 110, 110))])
+    candidates = [('near', ((12, 0, 0), (14, 4, 4))),
+                  ('far', ((50, 50, 50), (55, 55, 55))),
+                  ('overlap', ((5, 5, 5), (20, 20, 20)))]
+    assert grid.pick_farthest(candidates) == 'far'
@@ -0,0 +1,82 @@
+import struct
+
+import numpy as np
+import pytest
+
+from girder_ninjato_api import tiff_pages
+
+
+def _write_tiff(path, volume, endian='<'):
+    # write an uncompressed 16 bit grayscale TIFF file with one strip per page
+    z_size, y_size, x_size = volume.shape
+    page_bytes = y_size * x_size * 2
+    ifd_size = 2 + 9 * 12 + 4
+    with open(path, 'wb') as f:
+        f.write((b'II' if endian == '<' else b'MM') + struct.pack(f'{endian}HI', 42, 8))
+        for z, img in enumerate(volume):
+            ifd_offset = f.tell()
+            data_offset = ifd_offset + ifd_size
+            next_ifd = data_offset + page_bytes if z < z_size - 1 else 0
+            entries = [(256, 4, x_size), (257, 4, y_size), (258, 3, 16), (259, 3, 1),
+                       (262, 3, 1), (273, 4, data_offset), (277, 3, 1), (278, 4, y_size),
+                       (279, 4, page_bytes)]
+            f.write(struct.pack(f'{endian}H', len(entries)))
+            for tag, field_type, value in entries:
+                fmt = f'{endian}HHIH2x' if field_type == 3 else f'{endian}HHII'
+                f.write(struct.pack(fmt, tag, field_type, 1, value))
+            f.write(struct.pack(f'{endian}I', next_ifd))
+            f.write(img.astype(f'{endian}u2').tobytes())
+
+
+def _read_tiff(path, shape, endian='<'):
+    pages = [np.frombuffer(b''.join(page.segments[273]), dtype=f'{endian}u2').reshape(shape)
+             for page in tiff_pages.iter_pages(path)]
+    return np.array(pages)
+
+
+@pytest.mark.parametrize('endian', ['<', '>'])
+@pytest.mark.parametrize('first_page,page_count', [(0, 2), (3, 4), (6, 1)])
+def test_replace_pages(tmp_path, endian, first_page, page_count):
+    rng = np.random.default_rng(0)
+    volume = rng.integers(0, 1000, size=(7, 20, 30), dtype=np.uint16)
+    pages = rng.integers(0, 1000, size=(page_count, 20, 30), dtype=np.uint16)
+    src_path = str(tmp_path / 'src.tif')
+    pages_path = str(tmp_path / 'pages.tif')
+    out_path = str(tmp_path / 'out.tif')
+    _write_tiff(src_path, volume, endian)
+    _write_tiff(pages_path, pages, endian)
+
+    tiff_pages.replace_pages(src_path, pages_path, first_page, out_path)
+
+    expected = volume.copy()
+    expected[first_page:first_page + page_count] = pages
+    assert np.array_equal(_read_tiff(out_path, (20, 30), endian), expected)
+
+
+def test_replace_pages_rejects_truncated_file(tmp_path):
+    volume = np.arange(3 * 8 * 8, dtype=np.uint16).reshape((3, 8, 8))
+    src_path = tmp_path / 'src.tif'
+    pages_path = str(tmp_path / 'pages.tif')
+    _write_tiff(str(src_path), volume)
+    _write_tiff(pages_path, volume[:1])
+    data = src_path.read_bytes()
+    src_path.write_bytes(data[:len(data) - 10])
+    with pytest.raises(ValueError):
+        tiff_pages.replace_pages(str(src_path), pages_path, 0, str(tmp_path / 'out.tif'))
+
+
+def test_replace_pages_rejects_pages_past_the_end(tmp_path):
+    volume = np.arange(3 * 8 * 8, dtype=np.uint16).reshape((3, 8, 8))
+    src_path = str(tmp_path / 'src.tif')
+    pages_path = str(tmp_path / 'pages.tif')
+    _write_tiff(src_path, volume)
+    _write_tiff(pages_path, volume[:2])
+    with pytest.raises(ValueError):
+        tiff_pages.replace_pages(src_path, pages_path, 2, str(tmp_path / 'out.tif'))
+
+
+def test_iter_pages_rejects_non_tiff_file(tmp_path):
+    path = tmp_path / 'not.tif'
+    path.write_bytes(b'not a tiff file')
+    with pytest.raises(ValueError):
+        list(tiff_pages.iter_pages(str(path)))
@@ -0,0 +1,61 @@
+from bson.objectid import ObjectId
+
+from girder_ninjato_api.models import History, UserAssignment
+
+
+def _info(info_type, time, user):
+    return {'type': info_type, 'user': user, 'time': time}
+
+
+def test_find_user_assignments_backfills_history(db):
+    subvolume_ids = [ObjectId(), ObjectId()]
+    assign_item_ids = [str(ObjectId()), str(ObjectId())]
+    History().add(subvolume_ids[0], assign_item_ids[1],
+                  _info('annotation_assigned_to', '01/01/2022 10:00', 'user1'))
+    History().add(subvolume_ids[0], assign_item_ids[0],
+                  _info('annotation_assigned_to', '01/01/2022 11:00', 'user1'))
+    History().add(subvolume_ids[0], assign_item_ids[1],
+                  _info('annotation_completed_by', '01/01/2022 12:00', 'user1'))
+    History().add(subvolume_ids[0], assign_item_ids[0],
+                  _info('review_assigned_to', '01/01/2022 13:00', 'user2'))
+    History().add(subvolume_ids[1], str(ObjectId()),
+                  _info('annotation_assigned_to', '01/01/2022 13:00', 'user1'))
+    History().add(subvolume_ids[0], '7', {'comment': 'note', 'user': 'user1',
+                                          'time': '01/01/2022 14:00'})
+
+    docs = UserAssignment().find_user_assignments('user1', [subvolume_ids[0]])
+
+    assert [(str(doc['assignmentId']), doc['type']) for doc in docs] == [
+        (assign_item_ids[0], 'annotation_assigned_to'),
+        (assign_item_ids[1], 'annotation_completed_by')]
+
+
+def test_add_events_after_backfill(db):
+    subvolume_id = ObjectId()
+    assign_item_id = str(ObjectId())
+    UserAssignment().find_user_assignments('user1', [subvolume_id])
+
+    event = History().add(subvolume_id, assign_item_id,
+                          _info('annotation_assigned_to', '01/01/2022 10:00', 'user1'))
+    UserAssignment().add_events([event])
+    docs = UserAssignment().find_user_assignments('user1', [subvolume_id])
+
+    assert [str(doc['assignmentId']) for doc in docs] == [assign_item_id]
+    # events are only backfilled once per user
+    History().add(subvolume_id, str(ObjectId()),
+                  _info('annotation_assigned_to', '01/01/2022 11:00', 'user1'))
+    assert len(UserAssignment().find_user_assignments('user1', [subvolume_id])) == 1
+
+
+def test_remove_assignments(db):
+    subvolume_id = ObjectId()
+    assign_item_ids = [str(ObjectId()), str(ObjectId())]
+    UserAssignment().find_user_assignments('user1', [subvolume_id])
+    UserAssignment().add_events([
+        History().add(subvolume_id, aid, _info('annotation_assigned_to', '01/01/2022 10:00',
+                                               'user1')) for aid in assign_item_ids])
+
+    UserAssignment().remove_assignments(subvolume_id, [assign_item_ids[0]])
+
+    docs = UserAssignment().find_user_assignments('user1', [subvolume_id])
+    assert [str(doc['assignmentId']) for doc in docs] == [assign_item_ids[1]]
@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+import pytest
+from libtiff import TIFF
+
+from girder_ninjato_api import utils
+
+
+def _write_tiff(path, volume):
+    tif = TIFF.open(path, mode='w')
+    for img in volume:
+        tif.write_image(np.ascontiguousarray(img))
+    tif.close()
+
+
+@pytest.fixture
+def volume_paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'SIDECAR_PATH', str(tmp_path / 'sidecars'))
+    monkeypatch.setattr(utils, 'USE_VOLUME_SIDECAR', True)
+    file_path = str(tmp_path / 'volume.tif')
+    sidecar_path = os.path.join(utils.SIDECAR_PATH, 'volume.npy')
+    return file_path, sidecar_path
+
+
+def test_load_volume_builds_sidecar(volume_paths):
+    file_path, sidecar_path = volume_paths
+    volume = np.arange(4 * 6 * 5, dtype=np.uint16).reshape((4, 6, 5))
+    _write_tiff(file_path, volume)
+
+    loaded = utils._load_volume(file_path, sidecar_path)
+
+    assert isinstance(loaded, np.memmap)
+    assert not loaded.flags.writeable
+    assert loaded.dtype == volume.dtype
+    assert np.array_equal(loaded, volume)
+    assert os.listdir(utils.SIDECAR_PATH) == ['volume.npy']
+
+
+def test_load_volume_rebuilds_stale_sidecar(volume_paths):
+    file_path, sidecar_path = volume_paths
+    volume = np.zeros((3, 4, 4), dtype=np.uint16)
+    _write_tiff(file_path, volume)
+    utils._load_volume(file_path, sidecar_path)
+    os.utime(sidecar_path, (1000, 1000))
+
+    _write_tiff(file_path, volume + 7)
+
+    assert np.array_equal(utils._load_volume(file_path, sidecar_path), volume + 7)
+
+
+def test_load_volume_reuses_current_sidecar(volume_paths):
+    file_path, sidecar_path = volume_paths
+    volume = np.ones((2, 3, 3), dtype=np.uint8)
+    _write_tiff(file_path, volume)
+    utils._load_volume(file_path, sidecar_path)
+    sidecar_mtime = os.path.getmtime(sidecar_path)
+
+    utils._load_volume(file_path, sidecar_path)
+
+    assert os.path.getmtime(sidecar_path) == sidecar_mtime
+
+
+def test_load_volume_without_sidecar(volume_paths, monkeypatch):
+    file_path, sidecar_path = volume_paths
+    monkeypatch.setattr(utils, 'USE_VOLUME_SIDECAR', False)
+    volume = np.arange(2 * 3 * 4, dtype=np.uint16).reshape((2, 3, 4))
+    _write_tiff(file_path, volume)
+
+    assert np.array_equal(utils._load_volume(file_path, sidecar_path), volume)
+    assert not os.path.exists(sidecar_path)
+
+
+def test_read_volume_region_from_sidecar(volume_paths):
+    file_path, sidecar_path = volume_paths
+    volume = np.arange(5 * 6 * 7, dtype=np.uint16).reshape((5, 6, 7))
+    _write_tiff(file_path, volume)
+    source = {'file_path': file_path, 'sidecar_path': sidecar_path}
+
+    region = utils._read_volume_region(source, 1, 3, 2, 4, 0, 5)
+
+    assert np.array_equal(region, volume[1:4, 2:5, 0:6])
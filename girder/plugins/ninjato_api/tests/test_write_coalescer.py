@@ -0,0 +1,123 @@
+import threading
+
+import pytest
+from bson.objectid import ObjectId
+from girder.exceptions import RestException
+from girder.models.item import Item
+
+from girder_ninjato_api import write_coalescer
+from girder_ninjato_api.meta_mutation import MetaMutation, VERSION_KEY
+
+
+def _create_item(meta):
+    item = {'_id': ObjectId(), 'name': 'whole', 'meta': meta}
+    Item().collection.insert_one(item)
+    return item
+
+
+def _get_item(item_id):
+    return Item().collection.find_one({'_id': item_id})
+
+
+@pytest.fixture
+def write_batches(monkeypatch):
+    batches = []
+    write_batch = write_coalescer._write_batch
+
+    def counting_write_batch(item_id, submissions):
+        batches.append(len(submissions))
+        return write_batch(item_id, submissions)
+
+    monkeypatch.setattr(write_coalescer, '_write_batch', counting_write_batch)
+    return batches
+
+
+def test_submit_coalesces_concurrent_mutations(db, write_batches, monkeypatch):
+    monkeypatch.setattr(write_coalescer, 'COALESCE_WINDOW', 0.2)
+    item = _create_item({'user1': []})
+    mutations = []
+    for i in range(4):
+        mutation = MetaMutation(dict(item, meta={'user1': []}))
+        mutation.push('user1', f'a{i}')
+        mutations.append(mutation)
+    threads = [threading.Thread(target=write_coalescer.submit, args=(mutation,))
+               for mutation in mutations]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert write_batches == [4]
+    saved = _get_item(item['_id'])
+    assert sorted(saved['meta']['user1']) == ['a0', 'a1', 'a2', 'a3']
+    assert saved[VERSION_KEY] == 1
+    assert all(not mutation.has_changes() and mutation.item[VERSION_KEY] == 1
+               for mutation in mutations)
+
+
+def test_submit_reapplies_changes_after_version_conflict(db, monkeypatch):
+    item = _create_item({'regions': {'5': {'x_min': 0}}, 'user1': ['a1']})
+    replay = MetaMutation.replay
+    replays = []
+
+    def replay_after_concurrent_write(self, ops):
+        replays.append(self.item)
+        if len(replays) == 2:
+            # another request writes the item after it is read for the version check
+            Item().collection.update_one({'_id': item['_id']},
+                                         {'$push': {'meta.user1': 'a2'},
+                                          '$inc': {VERSION_KEY: 1}})
+        return replay(self, ops)
+
+    monkeypatch.setattr(MetaMutation, 'replay', replay_after_concurrent_write)
+    mutation = MetaMutation(item)
+    # nested changes of the same region need the current region to be written
+    mutation.set('regions.6', {'x_min': 1})
+    mutation.set('regions.6.x_max', 2)
+    mutation.push('user1', 'a3')
+
+    write_coalescer.submit(mutation)
+
+    saved = _get_item(item['_id'])
+    assert saved['meta']['user1'] == ['a1', 'a2', 'a3']
+    assert saved['meta']['regions'] == {'5': {'x_min': 0}, '6': {'x_min': 1, 'x_max': 2}}
+    assert saved[VERSION_KEY] == 2
+    # the changes are batched, replayed onto the item read first and then onto the latest item
+    assert len(replays) == 3
+
+
+def test_submit_raises_conflict_after_max_retries(db, monkeypatch):
+    item = _create_item({'regions': {}})
+    replay = MetaMutation.replay
+
+    def replay_after_concurrent_write(self, ops):
+        Item().collection.update_one({'_id': item['_id']}, {'$inc': {VERSION_KEY: 1}})
+        return replay(self, ops)
+
+    monkeypatch.setattr(MetaMutation, 'replay', replay_after_concurrent_write)
+    mutation = MetaMutation(item)
+    mutation.set('regions.6', {'x_min': 1})
+    mutation.set('regions.6.x_max', 2)
+
+    with pytest.raises(RestException) as exc:
+        write_coalescer.submit(mutation)
+    assert exc.value.code == 409
+    assert mutation.has_changes()
+
+
+def test_submit_writes_conditional_unsets(db):
+    item = _create_item({'user1': ['a1'], 'user2': ['a2']})
+    mutation = MetaMutation(item)
+    mutation.pull('user1', 'a1')
+    mutation.unset_if('user1', [])
+    # another request has added an assignment to user2 in the meantime
+    Item().collection.update_one({'_id': item['_id']}, {'$push': {'meta.user2': 'a3'}})
+    mutation.pull('user2', 'a2')
+    mutation.unset_if('user2', [])
+
+    write_coalescer.submit(mutation)
+
+    saved = _get_item(item['_id'])
+    assert saved['meta'] == {'user2': ['a3']}
+    assert saved[VERSION_KEY] == 2
+    assert mutation.get_conditional_unsets() == []
@@ -0,0 +1,3 @@
+from .label_stats import EXTENT_KEYS, SLAB_SIZE, get_label_extent, get_label_stats
+
+__all__ = ['EXTENT_KEYS', 'SLAB_SIZE', 'get_label_extent', 'get_label_stats']
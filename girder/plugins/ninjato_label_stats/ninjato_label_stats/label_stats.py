@@ -0,0 +1,94 @@
+import numpy as np
+
+
+# number of z slices processed at a time to bound the memory used for voxel coordinates
+SLAB_SIZE = 16
+EXTENT_KEYS = ('z_min', 'z_max', 'y_min', 'y_max', 'x_min', 'x_max')
+
+
+def _group_by_label(labels, mins, maxs, counts, sums):
+    """
+    reduce per label columns over groups of equal labels
+    :param labels: 1D label array
+    :param mins: list of 1D arrays to reduce with minimum per label
+    :param maxs: list of 1D arrays to reduce with maximum per label
+    :param counts: 1D array to reduce with sum per label
+    :param sums: list of 1D arrays to reduce with sum per label
+    :return: unique labels followed by the reduced mins, maxs, counts and sums
+    """
+    # a stable sort of 8 or 16 bit integer labels is a radix sort which keeps this O(voxels)
+    order = np.argsort(labels, kind='stable')
+    labels = labels[order]
+    starts = np.flatnonzero(np.concatenate(([True], labels[1:] != labels[:-1])))
+    return (labels[starts],
+            [np.minimum.reduceat(col[order], starts) for col in mins],
+            [np.maximum.reduceat(col[order], starts) for col in maxs],
+            np.add.reduceat(counts[order], starts),
+            [np.add.reduceat(col[order], starts) for col in sums])
+
+
+def _get_slab_stats(slab, z_offset):
+    flat = slab.ravel()
+    indices = np.flatnonzero(flat)
+    if not indices.size:
+        return None
+    coords = [c.astype(np.int64) for c in np.unravel_index(indices, slab.shape)]
+    coords[0] += z_offset
+    return _group_by_label(flat[indices], coords, coords, np.ones(indices.size, dtype=np.int64),
+                           coords)
+
+
+def get_label_stats(label_volume, offset=(0, 0, 0), slab_size=SLAB_SIZE):
+    """
+    compute the bounding box, voxel count and centroid of every nonzero label of a ZYX label
+    volume in a single pass over the voxels
+    :param label_volume: ZYX label numpy array or np.memmap
+    :param offset: (z, y, x) offset of the label volume to be added to all coordinates
+    :param slab_size: number of z slices to process at a time
+    :return: dict keyed by integer label with x_min, x_max, y_min, y_max, z_min, z_max, count and
+    centroid keys where centroid is a dict with x, y, z keys
+    """
+    slab_stats = []
+    for z in range(0, label_volume.shape[0], slab_size):
+        stats = _get_slab_stats(np.asarray(label_volume[z:z + slab_size]), z)
+        if stats:
+            slab_stats.append(stats)
+    if not slab_stats:
+        return {}
+    # merge the per slab results of labels spanning multiple slabs
+    labels, mins, maxs, counts, sums = _group_by_label(
+        np.concatenate([s[0] for s in slab_stats]),
+        [np.concatenate([s[1][i] for s in slab_stats]) for i in range(3)],
+        [np.concatenate([s[2][i] for s in slab_stats]) for i in range(3)],
+        np.concatenate([s[3] for s in slab_stats]),
+        [np.concatenate([s[4][i] for s in slab_stats]) for i in range(3)])
+
+    ret_stats = {}
+    for i, label in enumerate(labels.tolist()):
+        # need to convert values to int from int64, otherwise, JSON serialization
+        # will raise exception when adding metadata to item
+        count = int(counts[i])
+        ret_stats[label] = {
+            'x_min': int(mins[2][i]) + offset[2],
+            'x_max': int(maxs[2][i]) + offset[2],
+            'y_min': int(mins[1][i]) + offset[1],
+            'y_max': int(maxs[1][i]) + offset[1],
+            'z_min': int(mins[0][i]) + offset[0],
+            'z_max': int(maxs[0][i]) + offset[0],
+            'count': count,
+            'centroid': {
+                'x': float(sums[2][i]) / count + offset[2],
+                'y': float(sums[1][i]) / count + offset[1],
+                'z': float(sums[0][i]) / count + offset[0]
+            }
+        }
+    return ret_stats
+
+
+def get_label_extent(label_stats):
+    """
+    get the bounding box extent of a label from its stats
+    :param label_stats: stats dict of a label returned by get_label_stats
+    :return: extent dict with x_max, x_min, y_max, y_min, z_max, z_min keys
+    """
+    return {key: label_stats[key] for key in EXTENT_KEYS}
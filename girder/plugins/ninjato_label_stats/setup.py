@@ -0,0 +1,25 @@
+from setuptools import setup, find_packages
+
+requirements = [
+    'numpy'
+]
+
+setup(
+    author='Hong Yi',
+    author_email='hongyi@renci.org',
+    classifiers=[
+        'Development Status :: 2 - Pre-Alpha',
+        'License :: OSI Approved :: Apache Software License',
+        'Natural Language :: English',
+        'Programming Language :: Python :: 3'
+    ],
+    description='Label statistics of ninjato region masks shared by the ninjato_api plugin and '
+                'the girder-client data preparation scripts',
+    install_requires=requirements,
+    license='Apache Software License 2.0',
+    name='ninjato_label_stats',
+    packages=find_packages(exclude=['test', 'test.*']),
+    url='https://github.com/RENCI/ninjato/tree/main/girder/plugins/ninjato_label_stats',
+    version='0.1.0',
+    zip_safe=False
+)